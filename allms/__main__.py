@@ -36,6 +36,7 @@ def main():
     runtime_config = RunTimeConfiguration(ai_model=yml_parser.ai_model,
                                           offline_model=yml_parser.offline_model,
                                           ai_reasoning_lvl=yml_parser.reasoning_level,
+                                          ai_routine_reasoning_lvl=yml_parser.routine_reasoning_level,
                                           max_agent_count=yml_parser.max_agent_count,
                                           enable_rag=yml_parser.enable_rag,
                                           show_thought_process=yml_parser.show_thought_process,
@@ -43,7 +44,29 @@ def main():
                                           ui_dev_mode=yml_parser.ui_dev_mode,
                                           save_directory=yml_parser.save_directory,
                                           default_agent_count=default_agent_count,
-                                          skip_intro=skip_intro)
+                                          skip_intro=skip_intro,
+                                          max_connections=yml_parser.max_connections,
+                                          request_timeout=yml_parser.request_timeout,
+                                          endpoints=tuple(yml_parser.endpoints),
+                                          sticky_endpoints=yml_parser.sticky_endpoints,
+                                          backend=yml_parser.backend,
+                                          ollama_options=yml_parser.ollama_options,
+                                          hedge_requests=yml_parser.hedge_requests,
+                                          hedge_percentile=yml_parser.hedge_percentile,
+                                          stream_responses=yml_parser.stream_responses,
+                                          constrained_output=yml_parser.constrained_output,
+                                          repair_responses=yml_parser.repair_responses,
+                                          model_routing=yml_parser.model_routing,
+                                          generation_profiles=yml_parser.generation_profiles,
+                                          adaptive_concurrency=yml_parser.adaptive_concurrency,
+                                          rate_limits=yml_parser.rate_limits,
+                                          prompt_layout=yml_parser.prompt_layout,
+                                          history_tokens=yml_parser.history_tokens,
+                                          agent_memory=yml_parser.agent_memory,
+                                          fake_options=yml_parser.fake_options,
+                                          cassette_mode=yml_parser.cassette_mode,
+                                          cassette_match=yml_parser.cassette_match,
+                                          cassette_speed=yml_parser.cassette_speed)
 
     # Preload the sentence transformer before starting the app to avoid performance issues in the UI
     if yml_parser.enable_rag:
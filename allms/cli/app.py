@@ -5,6 +5,7 @@ from textual.app import App
 from textual.screen import Screen
 
 from allms.config import AppConfiguration, RunTimeConfiguration
+from allms.core.llm.registry import LLMClientRegistry
 from .screens.main import MainScreen
 
 
@@ -31,9 +32,15 @@ class AmongLLMs(App):
         self._config = config
         self._main_screen = MainScreen(self._config)
 
+        # The LLM clients (and their connection pool) are shared across the chatrooms and live as long as the app
+        LLMClientRegistry.configure(max_connections=self._config.max_connections, request_timeout=self._config.request_timeout)
+
     def on_ready(self) -> None:
         msg = f"Start time: {AppConfiguration.clock.current_time_in_iso_format()}"
         log.debug(msg)
 
+    async def on_unmount(self) -> None:
+        await LLMClientRegistry.close()
+
     def get_default_screen(self) -> Screen:
         return self._main_screen
@@ -14,6 +14,8 @@ class ChatCallbackType(BaseCallbackType):
     NOTIFY_TOAST: str = "notify_toast"
     CLOSE_CHATROOM: str = "close_chat"
     GAME_HAS_ENDED: str = "game_has_ended"
+    LLM_STATUS_CHANGED: str = "llm_status_changed"
+    PARTIAL_MESSAGE: str = "partial_message"
 
 
 class ChatCallbacks(BaseCallbacks):
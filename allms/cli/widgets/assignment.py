@@ -4,7 +4,7 @@ from typing import Optional
 from textual import on
 from textual.app import ComposeResult
 from textual.containers import Horizontal, VerticalScroll
-from textual.widgets import Label, TextArea, Select, Button
+from textual.widgets import Label, TextArea, Select, Button, Static
 
 from allms.config import BindingConfiguration, RunTimeConfiguration
 from allms.core.agents import AgentFactory
@@ -20,9 +20,25 @@ class YourAgentAssignmentWidget(ModalScreenWidget):
         self._agent = self._state_manager.get_agent(self._agent_id)
         self._agent_persona = self._agent.get_persona()
 
+        # Shows the status of the model while it is being warmed up in the background
+        self._llm_status_widget = Static(id="assignment-llm-status")
+
+    def on_mount(self) -> None:
+        # Note: Textual invokes the on_mount of the base class by itself
+        self.__update_llm_status()
+        self.set_interval(0.5, self.__update_llm_status)
+
     def compose(self) -> ComposeResult:
         textbox = TextArea(text=self._agent_persona, show_line_numbers=True, read_only=True)
         with VerticalScroll():
             yield self._wrap_inside_container(textbox, Horizontal, border_title="Agent's Persona")
+        yield self._llm_status_widget
 
         textbox.focus()
+
+    def __update_llm_status(self) -> None:
+        """ Helper method to display the latest status of the model backend """
+        status = self._state_manager.get_llm_status()
+        self._llm_status_widget.display = (status is not None)
+        if status is not None:
+            self._llm_status_widget.update(f"[dim]{status.value}[/]")
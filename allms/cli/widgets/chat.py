@@ -21,6 +21,7 @@ from allms.cli.widgets.clock import ChatClock
 from allms.cli.widgets.contents import ChatroomContentsWidget
 from allms.cli.widgets.type import ChatroomIsTyping
 from allms.config import BindingConfiguration, RunTimeConfiguration, ToastConfiguration
+from allms.core.llm.status import LLMBackendStatus
 from allms.core.state import GameStateManager
 
 
@@ -170,7 +171,9 @@ class ChatroomWidget(Vertical):
             ChatCallbackType.NOTIFY_TOAST: self.__send_notification,
             ChatCallbackType.TERMINATE_ALL_TASKS: self.__cancel_all_bg_tasks,
             ChatCallbackType.GAME_HAS_ENDED: self.__game_has_officially_ended,
-            ChatCallbackType.CLOSE_CHATROOM: self.__close_chatroom
+            ChatCallbackType.CLOSE_CHATROOM: self.__close_chatroom,
+            ChatCallbackType.LLM_STATUS_CHANGED: self.__llm_status_changed,
+            ChatCallbackType.PARTIAL_MESSAGE: self.__partial_message
         }
 
         return callback_map
@@ -186,11 +189,32 @@ class ChatroomWidget(Vertical):
             self._is_typing_widget.add_typing(agent_id)
         else:
             self._is_typing_widget.remove_typing(agent_id)
+            self._contents_widget.remove_partial_message(agent_id)  # Either sent by now or given up on
+
+    def __partial_message(self, agent_id: str, text: Optional[str]) -> None:
+        """ Callback method to show the message the agent is still typing """
+        # Note: The update may arrive after the agent has stopped typing (i.e. the message was sent or given up on)
+        if self._game_ended or (not self._is_typing_widget.is_typing(agent_id)):
+            return
+        self._contents_widget.show_partial_message(agent_id, text)
 
     def __event_occurred(self, event: str) -> None:
         """ Callback method to display the event on the screen """
         self._contents_widget.announce_event(event)
 
+    def __llm_status_changed(self, status: LLMBackendStatus) -> None:
+        """ Callback method to notify the user about the changes in the status of the model backend """
+        if status == LLMBackendStatus.READY:
+            self.__send_notification(title="Agents are Ready", message=status.value)
+        elif status == LLMBackendStatus.WARM_UP_FAILED:
+            self.__send_notification(title="Model Warm-up Failed", message=status.value, severity=ToastConfiguration.type_warning)
+        elif status == LLMBackendStatus.UNAVAILABLE:
+            self._is_typing_widget.set_backend_unavailable(status.value)
+            self.__send_notification(title="Backend Unavailable", message=status.value, severity=ToastConfiguration.type_error)
+        elif status == LLMBackendStatus.RECOVERED:
+            self._is_typing_widget.set_backend_unavailable("")
+            self.__send_notification(title="Backend is Back", message=status.value)
+
     def __send_notification(self, title: str, message: str, severity: str = ToastConfiguration.type_information) -> None:
         """ Callback method to send a notification toast """
         self.notify(title=title, message=message, severity=severity)
@@ -213,6 +237,8 @@ class ChatroomWidget(Vertical):
     def __game_has_officially_ended(self, conclusion: str) -> None:
         """ Callback method to display the game ended screen """
         self._is_typing_widget.remove_all()
+        self._is_typing_widget.set_backend_unavailable("")
+        self._contents_widget.remove_all_partial_messages()
         self._game_ended = True
         screen = GameEndedScreen(title=conclusion, config=self._config, state_manager=self._state_manager)
         self.app.push_screen(screen)
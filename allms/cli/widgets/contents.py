@@ -1,5 +1,6 @@
 from typing import Optional
 
+from rich.text import Text
 from textual.app import ComposeResult
 from textual.containers import Container, Vertical, VerticalScroll
 from textual.widget import Widget
@@ -121,6 +122,28 @@ class ChatBubbleWidget(Container):
         return border_title, border_subtitle
 
 
+class PartialChatBubbleWidget(Container):
+    """ Class for a widget hosting the message an agent is still typing (replaced by the actual message once sent) """
+    def __init__(self, sent_by: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._sent_by = sent_by
+        self._container = Vertical()
+        self._chat_bubble = Static()
+        self.styles.align = "left", "middle"  # Only the agents type via the model
+
+    def compose(self) -> ComposeResult:
+        with self._container:
+            self._container.add_class(StyleConfiguration.class_border)
+            self._container.border_title = f"{self._sent_by} [i](typing ...)[/]"
+            yield self._chat_bubble
+        yield self._container
+
+    def update_contents(self, text: str) -> None:
+        """ Updates the contents of the chat bubble with the message typed so far """
+        # Note: The text is shown as-is -- a half-typed message may contain a half-written markup tag
+        self._chat_bubble.update(Text(text))
+
+
 class ChatroomContentsWidget(VerticalScroll):
     """ Class for storing the contents of the chat """
 
@@ -137,6 +160,10 @@ class ChatroomContentsWidget(VerticalScroll):
         # Mapping between a message ID, and it's corresponding chat-bubble widget
         self._msg_map: dict[str, ChatBubbleWidget] = {}
 
+        # Mapping between an agent ID and the chat-bubble widget of the message it is still typing
+        # Note: These are always kept at the bottom, below the messages that have been sent
+        self._partial_msg_map: dict[str, PartialChatBubbleWidget] = {}
+
     def on_mount(self) -> None:
         # Add the messages and announcements if there are any (in the case of load chatroom)
         msgs: list[ChatMessage] = self._state_manager.get_all_messages()
@@ -161,6 +188,32 @@ class ChatroomContentsWidget(VerticalScroll):
         self._msg_map[msg_id] = msg_widget
         self.__add_widget_to_screen(msg_widget)
 
+    def show_partial_message(self, agent_id: str, text: Optional[str]) -> None:
+        """ Method to show the message the given agent is still typing. Removes it if the text is None """
+        if text is None:
+            self.remove_partial_message(agent_id)
+            return
+
+        msg_widget = self._partial_msg_map.get(agent_id, None)
+        if msg_widget is None:
+            msg_widget = PartialChatBubbleWidget(sent_by=agent_id)
+            self._partial_msg_map[agent_id] = msg_widget
+            self.mount(msg_widget)
+
+        msg_widget.update_contents(text)
+        self.scroll_end(animate=False)
+
+    def remove_partial_message(self, agent_id: str) -> None:
+        """ Method to remove the message the given agent was typing (if any) """
+        msg_widget = self._partial_msg_map.pop(agent_id, None)
+        if msg_widget is not None:
+            msg_widget.remove()
+
+    def remove_all_partial_messages(self) -> None:
+        """ Method to remove the messages all the agents were typing """
+        for agent_id in list(self._partial_msg_map.keys()):
+            self.remove_partial_message(agent_id)
+
     async def edit_message(self, msg_id: str) -> None:
         """ Method to edit an existing chat message """
         msg_widget = self._msg_map[msg_id]
@@ -182,6 +235,7 @@ class ChatroomContentsWidget(VerticalScroll):
         return Container(widget, classes=self._css_class_announcement_container)
 
     def __add_widget_to_screen(self, widget: ChatBubbleWidget | Widget | Container) -> None:
-        """ Helper method to add the given widget to the screen """
-        self.mount(widget)
+        """ Helper method to add the given widget to the screen (above the messages still being typed) """
+        first_partial_msg = next(iter(self._partial_msg_map.values()), None)
+        self.mount(widget, before=first_partial_msg)
         self.scroll_end(animate=False)
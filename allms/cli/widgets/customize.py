@@ -6,7 +6,7 @@ from textual.binding import BindingsMap
 from textual.containers import Horizontal, VerticalScroll
 from textual.widgets import Label, TextArea, Select, Button
 
-from allms.config import BindingConfiguration, RunTimeConfiguration
+from allms.config import AppConfiguration, BindingConfiguration, RunTimeConfiguration
 from allms.core.agents import AgentFactory
 from allms.core.state import GameStateManager
 from .modal import ModalScreenWidget
@@ -26,12 +26,19 @@ class CustomizeAgentsWidget(ModalScreenWidget):
 
         self._id_btn_confirm = "customize-agent-confirm-btn"
         self._id_btn_cancel = "customize-agent-cancel-btn"
+        self._id_select_agent = "customize-agent-select"
+        self._id_select_profile = "customize-agent-profile-select"
 
         # Mapping between agent ID and newly edited persona
         self._edited_agents_personas: dict[str, str] = {}
 
+        # Mapping between agent ID and the name of the newly chosen generation profile
+        self._edited_agents_profiles: dict[str, str] = {}
+        self._profile_names = self._state_manager.get_generation_profile_names()
+
         self._curr_agent_id_selected: str = ""
         self._persona_text_box: Optional[TextArea] = None
+        self._profile_select_box: Optional[Select] = None
 
         # Unset the bindings to avoid editing in read-only mode
         if self._read_only:
@@ -42,13 +49,17 @@ class CustomizeAgentsWidget(ModalScreenWidget):
         default_agent_id = self._agent_ids[0]
         default_text = self._all_agents[default_agent_id].persona
 
-        select_box = Select(options=agent_ids, allow_blank=False, value=default_agent_id, compact=True)
+        select_box = Select(options=agent_ids, allow_blank=False, value=default_agent_id, compact=True, id=self._id_select_agent)
         textbox = TextArea(text=default_text, show_line_numbers=True, read_only=self._read_only)
+        profile_select_box = Select(options=self.__get_profile_options(), allow_blank=False, compact=True,
+                                    value=self.__get_profile_name(default_agent_id), disabled=self._read_only,
+                                    id=self._id_select_profile)
         confirm_btn, cancel_btn = self._create_confirm_cancel_buttons(self._id_btn_confirm, self._id_btn_cancel)
 
         with VerticalScroll():
             yield self._wrap_inside_container(select_box, Horizontal, border_title="Choose Agent")
             yield self._wrap_inside_container(textbox, Horizontal, border_title="Agent's Persona", cid="persona-textbox")
+            yield self._wrap_inside_container(profile_select_box, Horizontal, border_title="Agent's Generation Profile")
 
         # read-only mode happens when we are inside the chatroom and we need to see all the agent personas
         # Instead of creating a dedicated widget for it, re-use this widget -- bit of an ugly solution, but it gets the
@@ -61,6 +72,7 @@ class CustomizeAgentsWidget(ModalScreenWidget):
 
         self._curr_agent_id_selected = default_agent_id
         self._persona_text_box = textbox
+        self._profile_select_box = profile_select_box
 
     def on_button_pressed(self, event: Button.Pressed) -> None:
         """ Event handler for button clicked event """
@@ -72,18 +84,34 @@ class CustomizeAgentsWidget(ModalScreenWidget):
             for (agent_id, new_persona) in self._edited_agents_personas.items():
                 self._all_agents[agent_id].update_persona(new_persona)
 
+            # Note: Only the profiles in the configuration file can be given (the ones from a save are kept as-is)
+            for (agent_id, profile_name) in self._edited_agents_profiles.items():
+                if profile_name in self._profile_names:
+                    self._all_agents[agent_id].update_generation_profile(self._state_manager.create_generation_profile(profile_name))
+
         else:
             # Should not arrive at this branch or else there is a bug
             raise RuntimeError(f"Received a button pressed event from button-id({btn_pressed_id}) on {self.__class__.__name__}")
 
         self.app.pop_screen()
 
-    @on(Select.Changed)
+    @on(Select.Changed, "#customize-agent-select")
     async def handler_agent_id_changed(self, event: Select.Changed) -> None:
         """ Handler for handling events when number of agents is changed """
         agent_id = event.value
-        self._persona_text_box.text = self._all_agents[agent_id].get_persona()
         self._curr_agent_id_selected = agent_id
+        self._persona_text_box.text = self._all_agents[agent_id].get_persona()
+        self._profile_select_box.value = self.__get_profile_name(agent_id)
+
+    @on(Select.Changed, "#customize-agent-profile-select")
+    async def handler_agent_profile_changed(self, event: Select.Changed) -> None:
+        """ Handler for handling events when agent's generation profile has changed """
+        agent_id = self._curr_agent_id_selected
+        profile = self._all_agents[agent_id].get_generation_profile()
+        if (profile is not None) and (event.value == profile.name):
+            self._edited_agents_profiles.pop(agent_id, None)  # Keep the current one (along with its seed)
+        else:
+            self._edited_agents_profiles[agent_id] = event.value
 
     @on(TextArea.Changed)
     async def handler_agent_persona_changed(self, event: TextArea.Changed) -> None:
@@ -97,3 +125,21 @@ class CustomizeAgentsWidget(ModalScreenWidget):
         self._edited_agents_personas[self._curr_agent_id_selected] = persona
 
         self._persona_text_box.text = persona
+
+    def __get_profile_name(self, agent_id: str) -> str:
+        """ Helper method to return the name of the generation profile chosen for the given agent """
+        if agent_id in self._edited_agents_profiles:
+            return self._edited_agents_profiles[agent_id]
+        profile = self._all_agents[agent_id].get_generation_profile()
+        return profile.name if (profile is not None) else AppConfiguration.default_generation_profile
+
+    def __get_profile_options(self) -> list[tuple[str, str]]:
+        """ Helper method to return the (description, name) of the generation profiles that can be chosen """
+        options = [(self._state_manager.create_generation_profile(name).describe(), name) for name in self._profile_names]
+
+        # Profiles of a loaded save that are no longer in the configuration file are shown as well
+        for agent in self._all_agents.values():
+            profile = agent.get_generation_profile()
+            if (profile is not None) and (profile.name not in [name for (_, name) in options]):
+                options.append((f"{profile.describe()} [from the save]", profile.name))
+        return options
@@ -11,6 +11,7 @@ class ChatroomIsTyping(Container):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._are_typing = set()
+        self._backend_unavailable_text = ""  # Shown instead of the typing agents while the model backend is down
         self._typing_label = Label()
         self._loading_indicator = LoadingIndicator()
 
@@ -38,14 +39,24 @@ class ChatroomIsTyping(Container):
         self._are_typing.remove(agent_id)
         self.__update_indicator()
 
+    def is_typing(self, agent_id: str) -> bool:
+        """ Returns True if the given agent is in the typing set """
+        return agent_id in self._are_typing
+
     def remove_all(self) -> None:
         """ Removes all the agents from the typing set """
         self._are_typing.clear()
         self.__update_indicator()
 
+    def set_backend_unavailable(self, text: str = "") -> None:
+        """ Shows the given text in place of the typing agents. Clears it if the text is empty """
+        self._backend_unavailable_text = text
+        self._typing_label.set_class(bool(text), "backend-unavailable")
+        self.__update_indicator()
+
     def __update_indicator(self) -> None:
         """ Helper method to update the loading indicator """
-        typing_str = self.__create_is_typing_text()
+        typing_str = self._backend_unavailable_text or self.__create_is_typing_text()
         if not typing_str:
             self._typing_label.display = False
             self._loading_indicator.display = False
@@ -30,6 +30,19 @@ class AppConfiguration:
         "gpt-oss:120b",
     ]
 
+    # List of APIs supported to talk to the models
+    llm_backends: list[str] = [
+        "openai",  # OpenAI-compatible API
+        "ollama",  # Ollama's native API
+        "fake",    # In-process fake model (for testing)
+    ]
+
+    # Layouts of the prompts sent to the model (see promptLayout in config.yml)
+    prompt_layouts: list[str] = ["classic", "stable"]
+
+    # Modes of the cassette (recording/replaying the LLM traffic of a game)
+    cassette_modes: list[str] = ["off", "record", "replay"]
+
     ai_reasoning_levels: list[str] = [
         "low",
         "medium",
@@ -44,15 +57,76 @@ class AppConfiguration:
     # Minimum number of agents that should be in the game
     min_agent_count: int = 3
 
-    # Context size for the model -- Max. no. of messages in the chat history (public messages, DMs and notifications)
-    # the model gets as context for generating a reply
+    # Max. no. of items kept in the chat log of an agent (public messages, DMs and notifications)
     # Note(s):
-    #   - Changing this to a larger value may reduce the performance as the models may take longer to produce replies
-    max_lookback_messages: int = 30
+    #   - Only a backstop bounding the size of the saves (e.g. for the agent played by you, which never gets a turn).
+    #     What the model gets as context is decided by the token budget of the history (see historyTokens in config.yml)
+    max_chat_log_messages: int = 500
+
+    # Fraction of the token budget the history of an agent is trimmed down to once it outgrows the budget. The oldest
+    # messages are dropped several at a time, so that the start of the history stays the same for a few turns
+    llm_history_trim_ratio: float = 0.75
+
+    # Memory settings of the agents (the memory itself is enabled via the config file)
+    llm_memory_poll_sec: float = 2.0         # How often the backlogs (and the spare capacity of the backend) are checked
+    llm_memory_min_backlog_items: int = 4    # Items evicted from the chat log of an agent before its memory is updated
+    llm_memory_max_backlog_items: int = 100  # Items kept waiting to be folded in (the oldest are dropped if it falls behind)
+    llm_memory_max_words: int = 120          # Length of the memory asked of the model
+    llm_memory_max_tokens: int = 384         # Cap on the tokens generated per update (including the reasoning)
 
     # Maximum duration of an active vote (in minutes)
     max_vote_duration_min: int = 10
 
+    # Connection pool settings for the LLM clients (the pool size and request timeout are set via the config file)
+    llm_keepalive_expiry_sec: float = 60.0  # How long an idle connection to the backend is kept alive
+    llm_connect_timeout_sec: float = 5.0    # Timeout for establishing a new connection to the backend
+
+    # Load balancing settings when multiple backend endpoints are configured
+    llm_endpoint_max_failures: int = 3           # Consecutive server errors before an endpoint is considered unhealthy
+    llm_health_check_interval_sec: float = 10.0  # How often an unhealthy endpoint is probed to check if it's back up
+    llm_sticky_max_imbalance: int = 2            # Max. extra in-flight requests tolerated before a sticky agent is moved
+
+    # Context window sizing when num_ctx is set to "auto" (Ollama's native API only)
+    # Note: Ollama reloads the model whenever num_ctx changes, so the window only grows (in powers of 2) and never shrinks
+    llm_num_ctx_min: int = 4096               # Smallest context window used
+    llm_num_ctx_max: int = 131072             # Largest context window used (gpt-oss supports upto 128k)
+    llm_num_ctx_reserved_tokens: int = 2048   # Room left for the reply (including reasoning) if num_predict isn't set
+
+    # Request hedging settings (the hedging itself and its percentile are set via the config file)
+    llm_hedge_window: int = 100            # Number of recent reply times the percentile is computed over
+    llm_hedge_min_samples: int = 10        # Replies needed before any request is hedged
+    llm_hedge_min_delay_sec: float = 1.0   # Never hedge a request sooner than this
+
+    # Number of recent reply times the latency statistics of each route (model) are computed over
+    llm_route_stats_window: int = 200
+
+    # Adaptive concurrency limit settings (the limiting itself is enabled via the config file, the largest limit being
+    # the maximum number of connections)
+    llm_concurrency_min_samples: int = 2            # Replies in a window before the limit is adjusted (at least the limit)
+    llm_concurrency_queueing_tolerance: float = 1.25  # Latency over the time the backend spent on the reply, beyond which it is queueing
+    llm_concurrency_latency_tolerance: float = 1.5    # Ditto, for the latency per token over the no-load one (a noisier estimate)
+    llm_concurrency_backoff: float = 0.75           # Factor the limit is multiplied with when the backend is queueing
+    llm_concurrency_baseline_window: int = 100      # Number of recent replies the no-load latency is estimated from
+    llm_concurrency_prompt_token_weight: float = 0.1  # Cost of a prompt token relative to a generated token
+    llm_rate_limit_default_pause_sec: float = 1.0  # Pause after a rate-limited request if the backend doesn't say how long
+    llm_rate_limit_max_waits: int = 10              # Rate-limited requests per turn retried without counting as a try
+
+    # Circuit breaker settings, used when the backend is down or overloaded
+    llm_breaker_failure_threshold: int = 5      # Consecutive backend failures before the agents are parked
+    llm_breaker_cooldown_sec: float = 5.0       # How long to wait before probing the backend
+    llm_breaker_max_cooldown_sec: float = 60.0  # The wait is doubled after every failed probe, upto this
+
+    # How often the message an agent is typing is refreshed in the chat (only when the replies are streamed)
+    llm_partial_message_refresh_sec: float = 0.1
+
+    # Cap on the tokens generated when asking the model to fix the format of a malformed reply (the replies are short)
+    llm_repair_max_tokens: int = 256
+
+    # Generation profile every agent starts with (must exist in the configuration file) and the largest seed picked for
+    # the profiles without one (the backends take 32-bit seeds)
+    default_generation_profile: str = "default"
+    max_generation_seed: int = 2**31 - 1
+
     # Path of the resource directories and other files
     __parent_dir: Path = Path(__file__).parent
     __resource_dir_root: Path = __parent_dir / "res"
@@ -120,6 +194,7 @@ class RunTimeConfiguration:
     ai_model: str
     offline_model: bool
     ai_reasoning_lvl: str
+    ai_routine_reasoning_lvl: str
     max_agent_count: int
     default_agent_count: int
     enable_rag: bool
@@ -128,3 +203,25 @@ class RunTimeConfiguration:
     save_directory: str
     ui_dev_mode: bool
     skip_intro: bool
+    max_connections: int
+    request_timeout: float
+    endpoints: tuple[str, ...]
+    sticky_endpoints: bool
+    backend: str
+    ollama_options: dict
+    hedge_requests: bool
+    hedge_percentile: float
+    stream_responses: bool
+    constrained_output: bool
+    repair_responses: bool
+    model_routing: dict
+    generation_profiles: dict
+    adaptive_concurrency: bool
+    rate_limits: dict
+    prompt_layout: str
+    history_tokens: int
+    agent_memory: bool
+    fake_options: dict
+    cassette_mode: str
+    cassette_match: str
+    cassette_speed: float
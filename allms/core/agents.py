@@ -1,10 +1,40 @@
+import random
 from collections import deque
 from dataclasses import dataclass, field
+from typing import Any, Optional
 
 from allms.config import AppConfiguration
 from .generate import NameGenerator, PersonaGenerator
 
 
+@dataclass
+class AgentGenerationProfile:
+    """ Class for how the replies of an agent are generated (None = the backend's default) """
+    name: str                            # Name of the profile (in the configuration file) the values are taken from
+    max_tokens: Optional[int] = None     # Caps the number of tokens generated per reply (including the reasoning)
+    temperature: Optional[float] = None  # Sampling temperature
+    top_p: Optional[float] = None        # Nucleus sampling probability
+    seed: Optional[int] = None           # Seed of the sampler -- fixed per agent to make its replies reproducible
+    history_tokens: Optional[int] = None  # Size of the message history the agent gets as context (None = the configured one)
+
+    @staticmethod
+    def from_config(name: str, options: dict[str, Any]) -> "AgentGenerationProfile":
+        """ Creates the profile from its options in the configuration file. Picks a random seed if it has none """
+        seed = options.get("seed", None)
+        if seed is None:
+            seed = random.randint(0, AppConfiguration.max_generation_seed)
+        return AgentGenerationProfile(name=name, max_tokens=options.get("max_tokens", None), temperature=options.get("temperature", None),
+                                      top_p=options.get("top_p", None), seed=seed,
+                                      history_tokens=options.get("history_tokens", None))
+
+    def describe(self) -> str:
+        """ Returns a short human-readable description of the profile """
+        def _fmt(value: Any) -> str:
+            return "default" if (value is None) else str(value)
+        return (f"{self.name} (max. tokens: {_fmt(self.max_tokens)}, temperature: {_fmt(self.temperature)}, " +
+                f"top-p: {_fmt(self.top_p)}, history: {_fmt(self.history_tokens)})")
+
+
 @dataclass
 class Agent:
     """ Class for an agent """
@@ -24,9 +54,28 @@ class Agent:
     # the state in each and every chat log -- a better way is to just store the message IDs of all chat messages
     # and keep the notifications etc. as normal formatted messages. On every iteration, the LLM will fetch the latest
     # contents (even if edited/deleted) instead of stale version (if stored as formatted messages instead of IDs)
-    chat_logs: deque[tuple[str, str, bool]] = field(default_factory=lambda: deque(maxlen=AppConfiguration.max_lookback_messages))
+    # Note: The oldest items are evicted once the history outgrows the token budget of the agent (see evict_from_chat_log)
+    chat_logs: deque[tuple[str, str, bool]] = field(default_factory=lambda: deque(maxlen=AppConfiguration.max_chat_log_messages))
     __latest_msg: str = ""  # Use as Producer/Consumer flags
 
+    # How the replies of the agent are generated (None = the backend's default, e.g. agents of the older saves)
+    generation_profile: Optional[AgentGenerationProfile] = None
+
+    # What the agent remembers of the items evicted from its chat log -- a short summary, kept up to date in the
+    # background by folding the items evicted since (the backlog) into it. None = nothing to remember yet
+    memory: Optional[str] = None
+    memory_backlog: list[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        if self.memory_backlog is None:
+            self.memory_backlog = []  # Agents of the saves made before the memory existed
+
+        # Note: Not fields, so that they aren't saved along with the agent -- only used to track the chat log in memory
+        # Note: The chat log of a loaded agent already has items -- they count as appended
+        self._chat_log_appended = len(self.chat_logs)  # Items appended to the chat log so far (including the ones evicted since)
+        self._chat_log_resets = 0    # Times the chat log was cleared
+        self._memory_backlog_removed = 0  # Items removed from the front of the memory backlog so far (folded or dropped)
+
     def add_message_id(self, msg_id: str) -> None:
         """ Adds the message ID to the list of IDs sent by the agent """
         if msg_id not in self.msg_ids:
@@ -44,6 +93,7 @@ class Agent:
         msg_type = "message ID" if is_message_id else "message"
         AppConfiguration.logger.log(f"Adding the following {msg_type} to chat-log for agent({self.id}): {msg}")
         self.chat_logs.append((role, msg, is_message_id))
+        self._chat_log_appended += 1
         self.__latest_msg = msg  # Doesn't matter if it is an ID or a raw message
 
     def can_reply(self, latest_msg_id: str | None) -> bool:
@@ -53,6 +103,52 @@ class Agent:
     def get_chat_logs(self) -> list[tuple[str, str, bool]]:
         return list(self.chat_logs)
 
+    def evict_from_chat_log(self, n_items: int) -> None:
+        """ Evicts the given number of the oldest items from the chat log """
+        assert 0 <= n_items <= len(self.chat_logs), f"Can't evict {n_items} items from a chat log of {len(self.chat_logs)} items"
+        for _ in range(n_items):
+            self.chat_logs.popleft()
+
+    def add_to_memory_backlog(self, items: list[str]) -> None:
+        """ Adds the given items (evicted from the chat log) to the backlog of the memory, dropping the oldest if full """
+        self.memory_backlog.extend(items)
+        n_dropped = len(self.memory_backlog) - AppConfiguration.llm_memory_max_backlog_items
+        if n_dropped > 0:
+            AppConfiguration.logger.log(f"Memory backlog of agent({self.id}) is full. Dropping its {n_dropped} oldest items")
+            del self.memory_backlog[:n_dropped]
+            self._memory_backlog_removed += n_dropped
+
+    def get_memory_backlog(self) -> tuple[tuple[int, int], list[str]]:
+        """
+        Returns the position of the memory backlog along with (a copy of) its items. The position tells update_memory
+        which of the items are still in the backlog once they have been folded into the memory
+        """
+        return (self._chat_log_resets, self._memory_backlog_removed), list(self.memory_backlog)
+
+    def update_memory(self, memory: str, position: tuple[int, int], n_folded: int) -> bool:
+        """
+        Replaces the memory with the given one, which has the given number of the backlog items at the given position
+        (see get_memory_backlog) folded in, and removes those items from the backlog. Returns False (and keeps the
+        memory as-is) if the agent was reset since
+        """
+        resets, removed = position
+        if resets != self._chat_log_resets:
+            return False  # The memory (and the backlog) are of the game before the reset
+
+        # Note: Some of the items might have been dropped since (the backlog was full) -- only remove the rest of them
+        n_removed = max(0, n_folded - (self._memory_backlog_removed - removed))
+        del self.memory_backlog[:n_removed]
+        self._memory_backlog_removed += n_removed
+        self.memory = memory
+        return True
+
+    def get_chat_log_cursor(self) -> tuple[int, int]:
+        """
+        Returns the position of the chat log -- the times it was cleared and the items appended to it since. Used to
+        find out what was appended to the chat log (and evicted from it) since a previous position
+        """
+        return self._chat_log_resets, self._chat_log_appended
+
     def get_message_ids(self, latest_first: bool = True) -> list[str]:
         """ Returns a sorted list of all the message IDs of the messages sent by the agent """
         msgs_list = sorted(list(self.msg_ids))
@@ -84,12 +180,24 @@ class Agent:
         """ Updates the persona of the agent with the provided one """
         self.persona = persona
 
+    def get_generation_profile(self) -> Optional[AgentGenerationProfile]:
+        """ Returns the generation profile of the agent """
+        return self.generation_profile
+
+    def update_generation_profile(self, profile: AgentGenerationProfile) -> None:
+        """ Updates the generation profile of the agent with the provided one """
+        self.generation_profile = profile
+
     def reset(self) -> None:
         """ Clears the chat messages and history logs """
         self.msg_ids.clear()
         self.dm_msg_ids_recv.clear()
         self.dm_msg_ids_sent.clear()
         self.chat_logs.clear()
+        self.memory = None
+        self.memory_backlog.clear()
+        self._chat_log_resets += 1
+        self._chat_log_appended = 0
 
 
 class AgentFactory:
@@ -2,6 +2,7 @@ from collections import OrderedDict
 from dataclasses import dataclass, field
 
 from allms.config import AppConfiguration
+from .formatter import ChatMessageFormatter
 from .message import ChatMessage
 
 
@@ -15,6 +16,13 @@ class ChatMessageHistory:
     # Maps message ID to the message for efficient retrieval and modification
     _history_all: OrderedDict[str, ChatMessage] = field(default_factory=OrderedDict)
 
+    def __post_init__(self):
+        # Note: Not fields, so that they aren't saved along with the history (and are rebuilt on loading it)
+        # Mapping between message ID and its (edit/delete version, message formatted for the LLMs)
+        object.__setattr__(self, "_formatted", {})
+        # Bumped on every edit/delete -- the formatted messages cached elsewhere are stale if it has changed
+        object.__setattr__(self, "_version", 0)
+
     async def initialize(self) -> None:
         # TODO: Initialize the vector database
         pass
@@ -33,6 +41,7 @@ class ChatMessageHistory:
         AppConfiguration.logger.log(f"Request received to edit message ID ({msg_id}) with '{message}', by_you={edited_by_you}")
 
         self._history_all[msg_id].edit(message, edited_by_you)
+        self.__invalidate(msg_id)
 
         # TODO: Edit the message in the database
 
@@ -42,6 +51,7 @@ class ChatMessageHistory:
         AppConfiguration.logger.log(f"Request received to delete message ID ({msg_id}), by_you={deleted_by_you}")
 
         self._history_all[msg_id].delete(deleted_by_you)
+        self.__invalidate(msg_id)
 
         # TODO: Delete the message in the database
 
@@ -50,6 +60,20 @@ class ChatMessageHistory:
         assert self.__has_message(msg_id), f"Can't fetch as ID({msg_id}) doesn't exist in the history"
         return self._history_all[msg_id]
 
+    def get_formatted(self, msg_id: str) -> str:
+        """ Returns the message from the history, formatted for the LLMs (formatted once per edit/delete) """
+        message = self.get(msg_id)
+        version = len(message.history_log)  # Every edit/delete of the message is logged
+        cached = self._formatted.get(msg_id, None)
+        if (cached is None) or (cached[0] != version):
+            cached = (version, ChatMessageFormatter.format_to_string(message))
+            self._formatted[msg_id] = cached
+        return cached[1]
+
+    def get_version(self) -> int:
+        """ Returns the version of the history, which changes every time a message is edited/deleted """
+        return self._version
+
     def get_all(self, ids_only: bool = False) -> list[ChatMessage] | list[str]:
         """ Returns all the chat messages from the history """
         messages = [msg_id if ids_only else self._history_all[msg_id] for msg_id in self._history_all]
@@ -62,6 +86,13 @@ class ChatMessageHistory:
     def reset(self) -> None:
         """ Clears the history log """
         self._history_all.clear()
+        self._formatted.clear()
+        object.__setattr__(self, "_version", self._version + 1)
+
+    def __invalidate(self, msg_id: str) -> None:
+        """ Helper method to drop the formatted message of the given ID (edited/deleted) and bump the version """
+        self._formatted.pop(msg_id, None)
+        object.__setattr__(self, "_version", self._version + 1)
 
     def __has_message(self, msg_id: str) -> bool:
         """ Helper method to check if a message exists in the history. Return True if exists """
@@ -36,6 +36,10 @@ class ChatMessage:
     suspect_confidence: Optional[int] = None  # A score between [0, 100] range describing the confidence
     suspect_reason: Optional[str] = None      # The reason behind suspecting the agent
 
+    # Only set by the LLMs -- the reasoning effort the model was asked for while generating this message (None = the
+    # backend's default)
+    reasoning_effort: Optional[str] = None
+
     # Stores the history of the edits/delete of the message
     history_log: list[ChatMessageEditLog] = field(default_factory=list)
 
@@ -1,3 +1,4 @@
+import math
 import random
 from pathlib import Path
 from typing import Optional, Type
@@ -27,8 +28,13 @@ class BaseGenerator:
         raise NotImplementedError
 
     @staticmethod
-    def choose_from(choices: list[str], max_count: int = 1, is_random_count: bool = False) -> list[str]:
+    def choose_from(choices: list[str], max_count: int = 1, is_random_count: bool = False, allow_repeats: bool = False) -> list[str]:
         """ Choose an item at random from the given list and return it """
+        if allow_repeats and (len(choices) < max_count):
+            # Not enough items -- go through the shuffled list as many times as needed
+            n_rounds = math.ceil(max_count / len(choices))
+            return [item for _ in range(n_rounds) for item in random.sample(choices, len(choices))][:max_count]
+
         assert len(choices) >= max_count, f"Tried to sample {max_count} but list only has {len(choices)} items"
         count = max_count
         if is_random_count:
@@ -50,8 +56,9 @@ class PersonaGenerator(BaseGenerator):
         voices = self.data[YAMLPersonaParser.key_voices]
         characteristics = self.data[YAMLPersonaParser.key_characteristics]
 
-        agent_backgrounds = self.choose_from(backgrounds, max_count=n)
-        agent_voices = self.choose_from(voices, max_count=n)
+        # Note: Backgrounds and voices are re-used (with different characteristics) only if there are a lot of agents
+        agent_backgrounds = self.choose_from(backgrounds, max_count=n, allow_repeats=True)
+        agent_voices = self.choose_from(voices, max_count=n, allow_repeats=True)
         agent_personas = []
 
         def _join_items(_items: list[str]) -> str:
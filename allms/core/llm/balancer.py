@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Mapping, Optional, Type
+
+import httpx
+import openai
+import tenacity
+
+from allms.config import AppConfiguration
+from .client import LLMBaseClient
+from .completion import LLMCompletion, LLMGenerationOptions
+
+
+@dataclass(eq=False)
+class LLMEndpoint:
+    """ Class for a single backend endpoint (e.g. one Ollama instance) """
+    url: str                          # The base URL of the endpoint
+    client_cls: Type[LLMBaseClient]   # The client class used to talk to the endpoint
+    client: Any                       # The client for the endpoint (created by the client class)
+
+    outstanding: int = 0              # Number of requests currently in flight on this endpoint
+    healthy: bool = True              # Set to False if the endpoint has been failing
+    failures: int = 0                 # Number of consecutive failures
+    last_checked: float = 0.0         # Last time (monotonic, in seconds) the endpoint failed or was probed
+    probing: bool = False             # Set to True while a health-check probe is in flight
+
+    async def chat(self, model: str, messages: list[dict[str, str]], options: LLMGenerationOptions) -> LLMCompletion:
+        """ Sends the messages to the model on this endpoint and returns the completion """
+        return await self.client_cls.chat(self.client, model, messages, options)
+
+
+@dataclass
+class LLMEndpointBalancer:
+    """
+    Class for routing the requests to one of the endpoints via least-outstanding-requests. Unhealthy endpoints are
+    skipped until a health-check probe succeeds. If sticky, each agent keeps using the same endpoint (as long as it
+    is healthy and not overloaded) so that its prompt prefix stays warm in that server's KV cache
+    """
+    endpoints: list[LLMEndpoint]
+    sticky: bool = False
+
+    _affinity: dict[str, LLMEndpoint] = field(default_factory=dict)  # Mapping between agent ID and its endpoint
+    _probes: set[asyncio.Task] = field(default_factory=set)          # Health-check probes in flight
+
+    def __post_init__(self):
+        assert len(self.endpoints) > 0, f"Expected atleast one endpoint for the balancer but got none"
+
+    @asynccontextmanager
+    async def acquire(self, agent_id: Optional[str] = None, avoid: Optional[LLMEndpoint] = None) -> AsyncIterator[LLMEndpoint]:
+        """ Picks an endpoint for the given agent and tracks the request as outstanding until the context exits """
+        endpoint = self.pick(agent_id, avoid=avoid)
+        endpoint.outstanding += 1
+        try:
+            yield endpoint
+            self.mark_success(endpoint)
+        except Exception as e:
+            cause = self.get_root_cause(e)
+            if self.is_connection_error(cause):
+                self.mark_failure(endpoint, fatal=True, reason=str(cause))
+            elif self.get_status_code(cause) >= 500:
+                self.mark_failure(endpoint, fatal=False, reason=str(cause))  # Server-side issue, the request itself is fine
+            raise
+        finally:
+            endpoint.outstanding -= 1
+
+    def pick(self, agent_id: Optional[str] = None, avoid: Optional[LLMEndpoint] = None) -> LLMEndpoint:
+        """
+        Returns the endpoint the next request of the given agent should be routed to. If avoid is given, a different
+        endpoint is picked whenever there is one (e.g. for hedged requests), without changing the agent's affinity
+        """
+        self.__probe_unhealthy_endpoints()
+
+        # If every endpoint is down, try them anyway -- a request might still go through
+        candidates = [ep for ep in self.endpoints if ep.healthy] or self.endpoints
+        if avoid is not None:
+            # With a single endpoint, the request just goes to another slot of the same server
+            candidates = [ep for ep in candidates if ep is not avoid] or candidates
+            agent_id = None
+        least_outstanding = min(ep.outstanding for ep in candidates)
+        least_loaded = random.choice([ep for ep in candidates if ep.outstanding == least_outstanding])
+
+        if (not self.sticky) or (agent_id is None):
+            return least_loaded
+
+        # Stay on the previous endpoint unless it went down or is too loaded compared to the others
+        max_imbalance = AppConfiguration.llm_sticky_max_imbalance
+        endpoint = self._affinity.get(agent_id, None)
+        if (endpoint is None) or (endpoint not in candidates) or (endpoint.outstanding > least_outstanding + max_imbalance):
+            if endpoint is not None:
+                AppConfiguration.logger.log(f"Moving {agent_id} from {endpoint.url} to {least_loaded.url}")
+            endpoint = least_loaded
+            self._affinity[agent_id] = endpoint
+
+        return endpoint
+
+    def mark_success(self, endpoint: LLMEndpoint) -> None:
+        """ Marks the request on the given endpoint as successful """
+        endpoint.failures = 0
+        if not endpoint.healthy:
+            AppConfiguration.logger.log(f"Endpoint {endpoint.url} is healthy again")
+        endpoint.healthy = True
+
+    def mark_failure(self, endpoint: LLMEndpoint, fatal: bool, reason: str = "") -> None:
+        """ Marks the request on the given endpoint as failed. Fatal failures (can't connect) take it down immediately """
+        endpoint.failures += 1
+        endpoint.last_checked = time.monotonic()
+
+        if endpoint.healthy and (fatal or (endpoint.failures >= AppConfiguration.llm_endpoint_max_failures)):
+            endpoint.healthy = False
+            AppConfiguration.logger.log(f"Endpoint {endpoint.url} marked as unhealthy after {endpoint.failures} " +
+                                        f"failure(s): {reason}", level=logging.WARNING)
+
+    @staticmethod
+    def get_root_cause(exc: BaseException) -> BaseException:
+        """ Returns the underlying API/transport error of the given exception (or the exception itself if none) """
+        # Note: instructor wraps the errors of the SDK inside its own (tenacity based) retry exceptions
+        seen = set()
+        curr_exc = exc
+        while (curr_exc is not None) and (id(curr_exc) not in seen):
+            if isinstance(curr_exc, (openai.APIError, httpx.HTTPError)):
+                return curr_exc
+            seen.add(id(curr_exc))
+            if isinstance(curr_exc, tenacity.RetryError):
+                curr_exc = curr_exc.last_attempt.exception()
+            else:
+                curr_exc = curr_exc.__cause__ or curr_exc.__context__
+        return exc
+
+    @staticmethod
+    def is_connection_error(exc: BaseException) -> bool:
+        """ Returns True if the given (root cause) exception means the backend couldn't be reached (or timed out) """
+        return isinstance(exc, (openai.APIConnectionError, httpx.TransportError))
+
+    @staticmethod
+    def is_backend_failure(exc: BaseException) -> bool:
+        """ Returns True if the given (root cause) exception is due to the backend being down or overloaded """
+        status_code = LLMEndpointBalancer.get_status_code(exc)
+        return LLMEndpointBalancer.is_connection_error(exc) or (status_code >= 500) or (status_code == 429)
+
+    @staticmethod
+    def is_overloaded(exc: BaseException) -> bool:
+        """ Returns True if the given (root cause) exception means the backend couldn't keep up with the requests """
+        status_code = LLMEndpointBalancer.get_status_code(exc)
+        return isinstance(exc, (openai.APITimeoutError, httpx.TimeoutException)) or (status_code in (429, 503))
+
+    @staticmethod
+    def get_headers(exc: BaseException) -> Mapping[str, str]:
+        """ Returns the headers of the response of the given (root cause) exception, or no headers if it has no response """
+        if isinstance(exc, (openai.APIStatusError, httpx.HTTPStatusError)):
+            return exc.response.headers
+        return {}
+
+    @staticmethod
+    def get_status_code(exc: BaseException) -> int:
+        """ Returns the HTTP status code of the given (root cause) exception, or 0 if it isn't a status error """
+        if isinstance(exc, openai.APIStatusError):
+            return exc.status_code
+        if isinstance(exc, httpx.HTTPStatusError):
+            return exc.response.status_code
+        return 0
+
+    def get_stats(self) -> list[dict]:
+        """ Returns the current state of the endpoints """
+        return [dict(url=ep.url, outstanding=ep.outstanding, healthy=ep.healthy, failures=ep.failures) for ep in self.endpoints]
+
+    def __probe_unhealthy_endpoints(self) -> None:
+        """ Helper method to fire health-check probes on the unhealthy endpoints that are due for one """
+        now = time.monotonic()
+        for endpoint in self.endpoints:
+            due = (now - endpoint.last_checked) >= AppConfiguration.llm_health_check_interval_sec
+            if endpoint.healthy or endpoint.probing or (not due):
+                continue
+
+            endpoint.probing = True
+            task = asyncio.create_task(self.__probe(endpoint))
+            self._probes.add(task)
+            task.add_done_callback(self._probes.discard)
+
+    async def __probe(self, endpoint: LLMEndpoint) -> None:
+        """ Helper method to probe an endpoint and update its health """
+        try:
+            if await endpoint.client_cls.check_health(endpoint.client):
+                self.mark_success(endpoint)
+            else:
+                endpoint.last_checked = time.monotonic()
+        finally:
+            endpoint.probing = False
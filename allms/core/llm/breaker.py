@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Awaitable, Callable, Optional
+
+from allms.config import AppConfiguration
+
+
+class LLMCircuitState(str, Enum):
+    """ Class for the states of the circuit breaker """
+
+    CLOSED: str = "closed"        # Backend is fine, requests go through
+    OPEN: str = "open"            # Backend is down, requests are held back until a probe succeeds
+    HALF_OPEN: str = "half-open"  # A single probe is in flight to check if the backend is back
+
+
+@dataclass
+class LLMCircuitBreaker:
+    """
+    Class for the circuit breaker shared by all the agents. After too many consecutive backend failures, the circuit
+    opens and the agents park instead of sending requests (which would otherwise turn into a retry storm and slow down
+    the recovery). Once the cool-down expires, a single probe is sent and its outcome decides if the agents resume
+    """
+    probe: Callable[[], Awaitable[bool]]  # Sends the probe and returns True if the backend served it
+    on_state_change: Optional[Callable[[LLMCircuitState], Awaitable[None]]] = None
+
+    state: LLMCircuitState = LLMCircuitState.CLOSED
+    trips: int = 0  # Number of times the circuit was opened
+
+    _failures: int = 0
+    _cooldown_sec: float = AppConfiguration.llm_breaker_cooldown_sec
+    _closed: asyncio.Event = field(default_factory=asyncio.Event)
+    _probe_task: Optional[asyncio.Task] = None
+
+    def __post_init__(self):
+        self._closed.set()
+
+    async def wait_until_closed(self) -> None:
+        """ Waits (parks the caller) until the circuit is closed, i.e. requests can be sent """
+        await self._closed.wait()
+
+    async def record_success(self) -> None:
+        """ Records a successful request """
+        # Note: Stray successes while open (requests sent before the circuit opened) are ignored -- the probe decides
+        if self.state == LLMCircuitState.CLOSED:
+            self._failures = 0
+
+    async def record_failure(self, reason: str = "") -> None:
+        """ Records a request that failed because of the backend. Opens the circuit if there were too many of them """
+        if self.state != LLMCircuitState.CLOSED:
+            return
+
+        self._failures += 1
+        if self._failures >= AppConfiguration.llm_breaker_failure_threshold:
+            self.trips += 1
+            AppConfiguration.logger.log(f"Backend failed {self._failures} times in a row ({reason}). Opening the circuit " +
+                                        f"for {self._cooldown_sec}s", level=logging.CRITICAL)
+            await self.__set_state(LLMCircuitState.OPEN)
+            self._probe_task = asyncio.create_task(self.__probe_until_closed())
+
+    def stop(self) -> None:
+        """ Stops the probing (if any) """
+        if (self._probe_task is not None) and (not self._probe_task.done()):
+            self._probe_task.cancel()
+
+    def get_stats(self) -> dict[str, Any]:
+        """ Returns the current state of the circuit breaker """
+        return dict(state=self.state.value, trips=self.trips)
+
+    async def __probe_until_closed(self) -> None:
+        """ Helper method to keep probing the backend (backing off in-between) until it is back """
+        while self.state != LLMCircuitState.CLOSED:
+            await asyncio.sleep(self._cooldown_sec)
+            await self.__set_state(LLMCircuitState.HALF_OPEN)
+
+            try:
+                is_back = await self.probe()
+            except Exception as e:
+                AppConfiguration.logger.log(f"Circuit breaker probe failed: {e}", level=logging.WARNING)
+                is_back = False
+
+            if is_back:
+                AppConfiguration.logger.log(f"Circuit breaker probe succeeded. Closing the circuit")
+                self._failures = 0
+                self._cooldown_sec = AppConfiguration.llm_breaker_cooldown_sec
+                await self.__set_state(LLMCircuitState.CLOSED)
+            else:
+                self._cooldown_sec = min(2 * self._cooldown_sec, AppConfiguration.llm_breaker_max_cooldown_sec)
+                AppConfiguration.logger.log(f"Backend is still unavailable. Probing again in {self._cooldown_sec}s",
+                                            level=logging.WARNING)
+                await self.__set_state(LLMCircuitState.OPEN)
+
+    async def __set_state(self, state: LLMCircuitState) -> None:
+        """ Helper method to update the state and notify about it """
+        if state == self.state:
+            return
+
+        AppConfiguration.logger.log(f"Circuit breaker: {self.state.value} -> {state.value}")
+        self.state = state
+        if state == LLMCircuitState.CLOSED:
+            self._closed.set()
+        else:
+            self._closed.clear()
+
+        if self.on_state_change is not None:
+            await self.on_state_change(state)
@@ -0,0 +1,146 @@
+import asyncio
+import gzip
+import json
+import logging
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from allms.config import AppConfiguration
+from .completion import LLMCompletion
+
+
+@dataclass
+class LLMCassetteEntry:
+    """ Class for a single recorded request/response pair """
+    agent_id: str                    # The agent the request was sent for
+    turn: int                        # Index of the request among the ones sent for the agent
+    model: str                       # The model the request was sent to
+    messages: list[dict[str, str]]   # The messages sent
+    latency_ms: float                # How long the backend took to reply
+    content: str                     # The raw reply of the model
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+
+class LLMCassette:
+    """
+    Class for reading/writing the cassette file -- the recorded LLM traffic of a game, stored next to its save.
+    Every line is a JSON record. The messages are mostly the same from one request to the next (the same prompts and
+    a slowly growing history), so each distinct message content is stored once and referred to by its index
+    """
+
+    file_name: str = "cassette.jsonl.gz"
+
+    @staticmethod
+    def save(entries: list[LLMCassetteEntry], file_path: Path) -> None:
+        """ Writes the given entries to the given file """
+        string_ids: dict[str, int] = {}
+        with gzip.open(file_path, "wt", encoding="utf-8") as f:
+            for entry in entries:
+                message_refs = []
+                for message in entry.messages:
+                    content = message["content"]
+                    if content not in string_ids:
+                        string_ids[content] = len(string_ids)
+                        f.write(json.dumps({"s": content}) + "\n")
+                    message_refs.append([message["role"], string_ids[content]])
+
+                record = dict(agent=entry.agent_id, turn=entry.turn, model=entry.model, messages=message_refs,
+                              latency_ms=round(entry.latency_ms, 1), content=entry.content,
+                              prompt_tokens=entry.prompt_tokens, completion_tokens=entry.completion_tokens)
+                f.write(json.dumps(record) + "\n")
+
+    @staticmethod
+    def load(file_path: Path) -> list[LLMCassetteEntry]:
+        """ Reads the entries from the given file """
+        strings: list[str] = []
+        entries: list[LLMCassetteEntry] = []
+        with gzip.open(file_path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if "s" in record:
+                    strings.append(record["s"])
+                    continue
+
+                messages = [dict(role=role, content=strings[idx]) for (role, idx) in record["messages"]]
+                entries.append(LLMCassetteEntry(agent_id=record["agent"], turn=record["turn"], model=record["model"],
+                                                messages=messages, latency_ms=record["latency_ms"], content=record["content"],
+                                                prompt_tokens=record.get("prompt_tokens", None),
+                                                completion_tokens=record.get("completion_tokens", None)))
+        return entries
+
+
+class LLMCassetteRecorder:
+    """ Class for recording the LLM traffic of a game """
+
+    def __init__(self):
+        self._entries: list[LLMCassetteEntry] = []
+        self._turns: dict[str, int] = defaultdict(int)  # Mapping between agent ID and its number of requests
+
+    def record(self, agent_id: str, model: str, messages: list[dict[str, str]], latency_ms: float, completion: LLMCompletion) -> None:
+        """ Records a request and the completion the backend replied with """
+        entry = LLMCassetteEntry(agent_id=agent_id, turn=self._turns[agent_id], model=model,
+                                 messages=[dict(message) for message in messages],  # The list is modified on retries
+                                 latency_ms=latency_ms, content=completion.content,
+                                 prompt_tokens=completion.prompt_tokens, completion_tokens=completion.completion_tokens)
+        self._entries.append(entry)
+        self._turns[agent_id] += 1
+
+    def save(self, save_dir: Path) -> Optional[Path]:
+        """ Saves the recording in the given save directory and returns its path (None if nothing was recorded) """
+        if not self._entries:
+            return None
+
+        file_path = save_dir / LLMCassette.file_name
+        LLMCassette.save(self._entries, file_path)
+        AppConfiguration.logger.log(f"Saved {len(self._entries)} recorded request(s) to {file_path}")
+        return file_path
+
+
+class LLMCassettePlayer:
+    """
+    Class for replaying the recorded LLM traffic of a game. The replies are served back either in the order they were
+    recorded in (order), or matched by the agent and its request count (agent). The original delays are kept, scaled
+    down by the speed (0 = no delay at all)
+    """
+
+    match_modes: list[str] = ["order", "agent"]
+
+    def __init__(self, entries: list[LLMCassetteEntry], match: str = "agent", speed: float = 1.0):
+        assert match in self.match_modes, f"Expected the match mode to be one of {self.match_modes} but got {match}"
+        assert speed >= 0, f"Expected the replay speed to be >= 0 but got {speed} instead"
+        self._match = match
+        self._speed = speed
+
+        self._in_order: deque[LLMCassetteEntry] = deque(entries)
+        self._by_agent: dict[str, deque[LLMCassetteEntry]] = defaultdict(deque)
+        for entry in sorted(entries, key=lambda e: e.turn):
+            self._by_agent[entry.agent_id].append(entry)
+
+    @classmethod
+    def from_save_dir(cls, save_dir: Path, match: str, speed: float) -> Optional["LLMCassettePlayer"]:
+        """ Creates the player for the cassette in the given save directory. Returns None if there isn't one """
+        file_path = save_dir / LLMCassette.file_name
+        if not file_path.exists():
+            AppConfiguration.logger.log(f"No cassette found at {file_path}. Nothing to replay", level=logging.WARNING)
+            return None
+
+        entries = LLMCassette.load(file_path)
+        AppConfiguration.logger.log(f"Replaying {len(entries)} recorded request(s) from {file_path} (match={match}, speed={speed})")
+        return cls(entries, match=match, speed=speed)
+
+    async def play(self, agent_id: str) -> Optional[LLMCompletion]:
+        """ Returns the next recorded completion for the given agent (after the recorded delay). None if there is none """
+        queue = self._in_order if (self._match == "order") else self._by_agent[agent_id]
+        if not queue:
+            AppConfiguration.logger.log(f"Cassette has no more recorded replies for {agent_id}", level=logging.WARNING)
+            return None
+
+        entry = queue.popleft()
+        if self._speed > 0:
+            await asyncio.sleep(entry.latency_ms / 1000 / self._speed)
+
+        return LLMCompletion(content=entry.content, prompt_tokens=entry.prompt_tokens,
+                             completion_tokens=entry.completion_tokens, finish_reason="stop")
@@ -1,28 +1,320 @@
+import json
+from dataclasses import dataclass
+from typing import Any, Mapping, Optional
+
+import httpx
 import instructor
 from openai import AsyncOpenAI
 
+from .completion import LLMCompletion, LLMGenerationOptions
+
 
 class LLMBaseClient:
     """ Base Class for the LLM client """
 
+    default_base_url: str = ""  # The URL used when no base URL is provided
+    supports_json_schema: bool = False  # Set to True if the backend can constrain the replies to a JSON schema
+
     @staticmethod
-    def create_client(api_key: str = None) -> instructor.Instructor:
+    def create_client(base_url: str = None, api_key: str = None, http_client: httpx.AsyncClient = None) -> Any:
         """ Creates the client and returns it """
         # Note: If you want a different client, inherit from this class and initialize it here
-        # However make sure you wrap it with instructor appropriately (as long as it is supported)
+        # If it is OpenAI-compatible, make sure you wrap it with instructor appropriately (as long as it is supported)
+        # The http_client is the connection pool shared across all clients -- pass it on to the client if possible
+        raise NotImplementedError
+
+    @staticmethod
+    async def chat(client: Any, model: str, messages: list[dict[str, str]], options: LLMGenerationOptions) -> LLMCompletion:
+        """ Sends the messages to the model via the given client (created by create_client) and returns the completion """
+        # Note: If options.on_delta is set, stream the reply and call it with every chunk (if the backend can stream)
         raise NotImplementedError
 
+    @staticmethod
+    async def check_health(client: Any) -> bool:
+        """ Returns True if the backend behind the given client is reachable and can serve requests """
+        # Note: Override this if your backend exposes a cheap way to check this. Assumes healthy by default
+        return True
+
+    @staticmethod
+    def get_rate_limit_headers(headers: Mapping[str, str]) -> Optional[dict[str, str]]:
+        """ Returns the rate-limit headers (x-ratelimit-*, retry-after) among the given ones, or None if there are none """
+        rate_limits = {key.lower(): value for (key, value) in headers.items()
+                       if key.lower().startswith(("x-ratelimit-", "retry-after"))}
+        return rate_limits or None
+
 
 class OllamaOfflineLLMClient(LLMBaseClient):
     """ Class for the offline Ollama LLM client """
 
+    default_base_url: str = "http://localhost:11434/v1"  # Ollama default
+    supports_json_schema: bool = True  # Via response_format (Ollama v0.5 onwards)
+
     @staticmethod
-    def create_client(api_key: str = None) -> instructor.Instructor:
+    def create_client(base_url: str = None, api_key: str = None, http_client: httpx.AsyncClient = None) -> instructor.Instructor:
         """ Creates the Ollama client and returns it """
         ollama_client = AsyncOpenAI(
-            base_url="http://localhost:11434/v1",  # Ollama default
-            api_key="ollama",                      # dummy key, Ollama ignores it
+            base_url=base_url or OllamaOfflineLLMClient.default_base_url,
+            api_key="ollama",         # dummy key, Ollama ignores it
+            http_client=http_client,  # None = let the SDK create its own pool
+            max_retries=0,            # The retries are handled by the agents manager (and its circuit breaker)
         )
 
         client = instructor.from_openai(ollama_client)
         return client
+
+    @staticmethod
+    async def chat(client: instructor.Instructor, model: str, messages: list[dict[str, str]], options: LLMGenerationOptions) -> LLMCompletion:
+        """ Sends the messages via the OpenAI-compatible API and returns the completion """
+        # Note: The OpenAI-compatible API has no way to pass the Ollama specific options -- they are ignored
+        # (except for the ones it has an equivalent of, like max_tokens)
+        if options.on_delta is not None:
+            return await OllamaOfflineLLMClient.__chat_stream(client, model, messages, options)
+
+        # Note: Goes to the underlying OpenAI client directly (we handle the response ourselves anyway) to get hold
+        # of the headers of the response -- they carry the rate limits of the hosted providers
+        raw_response = await client.client.chat.completions.with_raw_response.create(
+            model=model,
+            messages=messages,
+            **OllamaOfflineLLMClient.__get_request_kwargs(options)
+        )
+        response = raw_response.parse()
+        rate_limits = OllamaOfflineLLMClient.get_rate_limit_headers(raw_response.headers)
+
+        if (not response) or (not response.choices):
+            return LLMCompletion(content="", rate_limits=rate_limits)
+
+        choice = response.choices[0]
+        usage = response.usage
+        return LLMCompletion(
+            content=choice.message.content or "",
+            prompt_tokens=usage.prompt_tokens if usage else None,
+            completion_tokens=usage.completion_tokens if usage else None,
+            finish_reason=choice.finish_reason,
+            rate_limits=rate_limits
+        )
+
+    @staticmethod
+    async def __chat_stream(client: instructor.Instructor, model: str, messages: list[dict[str, str]], options: LLMGenerationOptions) -> LLMCompletion:
+        """ Helper method to stream the reply, passing on every chunk as it arrives """
+        # Note: Goes to the underlying OpenAI client directly -- there is no response model to wrap the stream into
+        raw_response = await client.client.chat.completions.with_raw_response.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **OllamaOfflineLLMClient.__get_request_kwargs(options)
+        )
+        stream = raw_response.parse()
+
+        content = ""
+        usage = None
+        finish_reason = None
+        async with stream:  # Closes the connection (i.e. stops the generation) if the stream is aborted
+            async for chunk in stream:
+                usage = chunk.usage or usage
+                if not chunk.choices:
+                    continue
+
+                choice = chunk.choices[0]
+                finish_reason = choice.finish_reason or finish_reason
+                delta = choice.delta.content if choice.delta else None
+                if delta:
+                    content += delta
+                    if options.on_delta(delta):
+                        finish_reason = LLMCompletion.finish_reason_stopped
+                        break
+
+        return LLMCompletion(
+            content=content,
+            prompt_tokens=usage.prompt_tokens if usage else None,
+            completion_tokens=usage.completion_tokens if usage else None,
+            finish_reason=finish_reason,
+            rate_limits=OllamaOfflineLLMClient.get_rate_limit_headers(raw_response.headers)
+        )
+
+    @staticmethod
+    def __get_request_kwargs(options: LLMGenerationOptions) -> dict[str, Any]:
+        """
+        Helper method to return the arguments capping the reply, its sampling and reasoning and constraining it to the
+        JSON schema (if any)
+        """
+        kwargs = {key: value for (key, value) in dict(max_tokens=options.max_tokens, temperature=options.temperature,
+                                                      top_p=options.top_p, seed=options.seed).items() if value is not None}
+        if options.reasoning_effort is not None:
+            kwargs["reasoning_effort"] = options.reasoning_effort
+        if options.stop:
+            kwargs["stop"] = options.stop
+        if options.json_schema is not None:
+            kwargs["response_format"] = {"type": "json_schema",
+                                         "json_schema": {"name": "response", "schema": options.json_schema, "strict": True}}
+        return kwargs
+
+    @staticmethod
+    async def check_health(client: instructor.Instructor) -> bool:
+        """ Checks if the Ollama server is up by listing its models """
+        try:
+            await client.client.models.list()
+            return True
+        except Exception:
+            return False
+
+
+class OpenAIOnlineLLMClient(OllamaOfflineLLMClient):
+    """ Class for the online LLM client, talking to a hosted OpenAI-compatible provider (e.g. OpenRouter, Groq) """
+
+    default_base_url: str = "https://openrouter.ai/api/v1"
+    supports_json_schema: bool = True  # Via response_format (the providers that can't do it reject the request)
+
+    # Mapping between the models and what most of the providers hosting them call them
+    hosted_models: dict[str, str] = {
+        "gpt-oss:20b": "openai/gpt-oss-20b",
+        "gpt-oss:120b": "openai/gpt-oss-120b",
+    }
+
+    # The environment variable holding the API key of the provider
+    api_key_env_var: str = "OPENAI_API_KEY"
+
+    @staticmethod
+    def create_client(base_url: str = None, api_key: str = None, http_client: httpx.AsyncClient = None) -> instructor.Instructor:
+        """ Creates the client for the provider and returns it """
+        online_client = AsyncOpenAI(
+            base_url=base_url or OpenAIOnlineLLMClient.default_base_url,
+            api_key=api_key,
+            http_client=http_client,
+            max_retries=0,  # The rate limits are waited out by the agents manager instead
+        )
+        return instructor.from_openai(online_client)
+
+    @staticmethod
+    async def chat(client: instructor.Instructor, model: str, messages: list[dict[str, str]], options: LLMGenerationOptions) -> LLMCompletion:
+        """ Sends the messages to the model (under the name the provider knows it by) and returns the completion """
+        model = OpenAIOnlineLLMClient.hosted_models.get(model, model)
+        return await OllamaOfflineLLMClient.chat(client, model, messages, options)
+
+
+@dataclass(frozen=True)
+class OllamaNativeConnection:
+    """ Class holding what is needed to talk to Ollama's native API """
+    base_url: str
+    http_client: httpx.AsyncClient
+
+
+class OllamaNativeLLMClient(LLMBaseClient):
+    """ Class for the offline Ollama LLM client talking to Ollama's native API """
+    # Unlike the OpenAI-compatible API, the native API allows setting keep_alive and the model options (num_ctx,
+    # num_predict, num_thread etc.) per request -- otherwise the model may get unloaded in-between the turns or
+    # get reloaded with a context size that doesn't fit the prompts
+
+    default_base_url: str = "http://localhost:11434"  # Ollama default
+    supports_json_schema: bool = True  # Via format (Ollama v0.5 onwards)
+
+    @staticmethod
+    def create_client(base_url: str = None, api_key: str = None, http_client: httpx.AsyncClient = None) -> OllamaNativeConnection:
+        """ Creates the connection to Ollama and returns it """
+        base_url = (base_url or OllamaNativeLLMClient.default_base_url).rstrip("/")
+
+        # Allow re-using the same endpoints as the OpenAI-compatible client
+        openai_suffix = "/v1"
+        if base_url.endswith(openai_suffix):
+            base_url = base_url[:-len(openai_suffix)]
+
+        return OllamaNativeConnection(base_url=base_url, http_client=http_client or httpx.AsyncClient())
+
+    @staticmethod
+    async def chat(client: OllamaNativeConnection, model: str, messages: list[dict[str, str]], options: LLMGenerationOptions) -> LLMCompletion:
+        """ Sends the messages via the /api/chat endpoint and returns the completion """
+        model_options = dict(options.backend_options)
+        if options.num_ctx is not None:
+            model_options["num_ctx"] = options.num_ctx
+        if options.max_tokens is not None:
+            model_options["num_predict"] = options.max_tokens
+        for (key, value) in dict(temperature=options.temperature, top_p=options.top_p, seed=options.seed).items():
+            if value is not None:
+                model_options[key] = value
+        if options.stop:
+            model_options["stop"] = options.stop
+
+        is_streamed = options.on_delta is not None
+        payload = dict(model=model, messages=messages, stream=is_streamed, options=model_options)
+        if options.keep_alive is not None:
+            payload["keep_alive"] = options.keep_alive
+        if options.json_schema is not None:
+            payload["format"] = options.json_schema
+        if options.reasoning_effort is not None:
+            payload["think"] = options.reasoning_effort  # gpt-oss models take the level, the others just turn thinking on
+
+        if not is_streamed:
+            response = await client.http_client.post(f"{client.base_url}/api/chat", json=payload)
+            await OllamaNativeLLMClient.__raise_for_status(response)
+            data = OllamaNativeLLMClient.__parse_json(response.text, response.request)
+            completion = OllamaNativeLLMClient.__to_completion(data.get("message", {}).get("content", ""), data)
+            completion.rate_limits = OllamaNativeLLMClient.get_rate_limit_headers(response.headers)
+            return completion
+
+        # Streamed replies arrive as one JSON object per line, the last one (done=True) carrying the statistics
+        content = ""
+        data = {}
+        async with client.http_client.stream("POST", f"{client.base_url}/api/chat", json=payload) as response:
+            await OllamaNativeLLMClient.__raise_for_status(response)
+            rate_limits = OllamaNativeLLMClient.get_rate_limit_headers(response.headers)
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                data = OllamaNativeLLMClient.__parse_json(line, response.request)
+                delta = data.get("message", {}).get("content", "")
+                if delta:
+                    content += delta
+                    if options.on_delta(delta):
+                        data = dict(done_reason=LLMCompletion.finish_reason_stopped)  # The statistics come at the end
+                        break
+
+        completion = OllamaNativeLLMClient.__to_completion(content, data)
+        completion.rate_limits = rate_limits
+        return completion
+
+    @staticmethod
+    async def __raise_for_status(response: httpx.Response) -> None:
+        """ Helper method to raise the HTTP error of the response along with the reason given by Ollama (if any) """
+        if response.is_success:
+            return
+
+        await response.aread()  # Not read yet if streamed
+        try:
+            reason = response.json().get("error", "")
+        except ValueError:
+            reason = response.text
+        raise httpx.HTTPStatusError(f"{response.status_code} {response.reason_phrase}: {reason}",
+                                    request=response.request, response=response)
+
+    @staticmethod
+    def __parse_json(text: str, request: httpx.Request) -> dict[str, Any]:
+        """
+        Helper method to parse a response (or a line of a streamed one) of the native API. Raises httpx.DecodingError
+        if it is garbled, so that it is retried like any other failed request
+        """
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            raise httpx.DecodingError(f"Garbled response from Ollama ({e}): {text[:200]!r}", request=request) from e
+
+    @staticmethod
+    def __to_completion(content: str, data: dict[str, Any]) -> LLMCompletion:
+        """ Helper method to create the completion from the (last) response of the native API """
+        ns_to_ms = 1e-6  # Ollama reports the durations in nanoseconds
+        return LLMCompletion(
+            content=content,
+            prompt_tokens=data.get("prompt_eval_count", None),
+            completion_tokens=data.get("eval_count", None),
+            prompt_eval_ms=data["prompt_eval_duration"] * ns_to_ms if ("prompt_eval_duration" in data) else None,
+            eval_ms=data["eval_duration"] * ns_to_ms if ("eval_duration" in data) else None,
+            finish_reason=data.get("done_reason", None)
+        )
+
+    @staticmethod
+    async def check_health(client: OllamaNativeConnection) -> bool:
+        """ Checks if the Ollama server is up by querying its version """
+        try:
+            response = await client.http_client.get(f"{client.base_url}/api/version")
+            return response.is_success
+        except httpx.HTTPError:
+            return False
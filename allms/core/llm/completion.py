@@ -0,0 +1,62 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, ClassVar, Optional
+
+
+@dataclass
+class LLMGenerationOptions:
+    """ Class for the options of a single generation request """
+    # Note: Backends ignore the options they don't support (e.g. the OpenAI-compatible route can't set most of these)
+    keep_alive: Optional[str | int] = None  # How long the backend keeps the model loaded after the request (Ollama only)
+    num_ctx: Optional[int] = None           # Size of the context window of the model (Ollama only)
+
+    max_tokens: Optional[int] = None        # Caps the number of tokens generated (None = the backend's default)
+    temperature: Optional[float] = None     # Sampling temperature (None = the backend's default)
+    top_p: Optional[float] = None           # Nucleus sampling probability (None = the backend's default)
+    seed: Optional[int] = None              # Seed of the sampler, for reproducible replies (None = random)
+    reasoning_effort: Optional[str] = None  # One of AppConfiguration.ai_reasoning_levels (None = the backend's default)
+
+    # Any other backend specific options, passed through as-is (e.g. num_predict, num_thread for Ollama)
+    backend_options: dict[str, Any] = field(default_factory=dict)
+
+    # If given, the reply is constrained to this JSON schema (only by the backends that support it)
+    json_schema: Optional[dict[str, Any]] = None
+
+    # If given, the backend stops the generation as soon as it generates any of these (which is left out of the reply)
+    stop: Optional[list[str]] = None
+
+    # If given, the reply is streamed and this is called with every chunk of text as it arrives. Returning True from it
+    # stops the generation (the reply received so far is returned). Raising an exception from it aborts the generation
+    # (the exception is propagated to the caller)
+    on_delta: Optional[Callable[[str], Optional[bool]]] = None
+
+
+@dataclass
+class LLMCompletion:
+    """ Class for the result of a single generation request """
+    content: str                              # The generated text
+    prompt_tokens: Optional[int] = None       # Number of tokens in the prompt (if reported by the backend)
+    completion_tokens: Optional[int] = None   # Number of tokens generated (if reported by the backend)
+    prompt_eval_ms: Optional[float] = None    # Time spent processing the prompt (if reported by the backend)
+    eval_ms: Optional[float] = None           # Time spent generating the tokens (if reported by the backend)
+    finish_reason: Optional[str] = None       # Why the generation stopped (if reported by the backend)
+    rate_limits: Optional[dict[str, str]] = None  # Rate-limit headers sent along with the reply (if any)
+
+    # Finish reason of the replies that were stopped by the client (via on_delta) instead of the backend
+    finish_reason_stopped: ClassVar[str] = "stopped_by_client"
+
+
+class LLMTokenEstimator:
+    """ Class for cheaply estimating the token counts without needing the model's tokenizer """
+
+    chars_per_token: float = 4.0  # Rough average for English text for most tokenizers
+    tokens_per_message: int = 4   # Overhead of the chat template per message (role, separators etc.)
+
+    @classmethod
+    def estimate(cls, text: str) -> int:
+        """ Returns the estimated number of tokens in the given text """
+        return int(len(text) / cls.chars_per_token) + 1
+
+    @classmethod
+    def estimate_messages(cls, messages: list[dict[str, str]]) -> int:
+        """ Returns the estimated number of tokens in the given list of chat messages """
+        return sum(cls.estimate(msg["content"]) + cls.tokens_per_message for msg in messages)
@@ -1,22 +1,58 @@
-from instructor import Instructor
+import os
 
+from .balancer import LLMEndpoint, LLMEndpointBalancer
 from .client import *
+from .fake import FakeLLMClient
+from .registry import LLMClientRegistry
 
 
-def client_factory(model: str, is_offline: bool) -> Instructor:
-    """ Factory method for the client """
+def client_factory(model: str,
+                   is_offline: bool,
+                   endpoints: list[str] = None,
+                   sticky: bool = False,
+                   backend: str = "openai"
+                   ) -> LLMEndpointBalancer:
+    """
+    Factory method for the client. Returns a balancer that routes each request to one of the given endpoints
+    (or the default endpoint of the model's client if none are provided)
+    """
     models_map = {
         ("gpt-oss:20b", True): OllamaOfflineLLMClient,
         ("gpt-oss:120b", True): OllamaOfflineLLMClient,
+        ("gpt-oss:20b", False): OpenAIOnlineLLMClient,
+        ("gpt-oss:120b", False): OpenAIOnlineLLMClient,
         # Add your model here as a (model_name, is_offline) tuple
         # Note: If your model is not offline, you will need to set its appropriate API key in an environment variable
     }
 
-    # TODO: Extract the API key and pass it to create_client if the model is not offline
-
     supported_configs = "\n".join([f"model={model}: offline={is_offline}" for (model, is_offline) in models_map.items()])
     assert tuple([model, is_offline]) in models_map, f"Given configuration: ({model}, {is_offline}) is not supported" + \
         f"Supported model configurations: {supported_configs}"
 
-    model_cls = models_map[(model, is_offline)]
-    return model_cls.create_client()
+    # The API to talk to the model with. Models in the above map use the OpenAI-compatible API by default
+    backends_map = {
+        "openai": models_map[(model, is_offline)],
+        "ollama": OllamaNativeLLMClient,  # Ollama's native API -- allows setting keep_alive, num_ctx etc.
+        "fake": FakeLLMClient,            # In-process fake model -- for testing without a backend
+    }
+    assert backend in backends_map, f"Given backend ({backend}) is not supported. Supported backends: {list(backends_map.keys())}"
+    if backend == "ollama":
+        assert is_offline, f"Ollama's native API can only be used with offline models"
+
+    model_cls = backends_map[backend]
+    if not endpoints:
+        endpoints = [model_cls.default_base_url]
+
+    # Note: Kept out of the configuration file so that it doesn't end up being shared along with it
+    api_key = None
+    if (not is_offline) and (backend == "openai"):
+        api_key = os.environ.get(OpenAIOnlineLLMClient.api_key_env_var, None)
+        assert api_key, f"Online models need the API key in the {OpenAIOnlineLLMClient.api_key_env_var} environment variable"
+
+    # Note: Clients are shared across the agents and chatrooms via the registry, so this does not create a new
+    # client (and connection pool) every time a chatroom is started
+    llm_endpoints = [
+        LLMEndpoint(url=url, client_cls=model_cls, client=LLMClientRegistry.get_client(model_cls, base_url=url, api_key=api_key))
+        for url in endpoints
+    ]
+    return LLMEndpointBalancer(endpoints=llm_endpoints, sticky=sticky)
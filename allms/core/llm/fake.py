@@ -0,0 +1,214 @@
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+from typing import Any
+
+import httpx
+
+from .client import LLMBaseClient
+from .completion import LLMCompletion, LLMGenerationOptions, LLMTokenEstimator
+from .parser import LLMResponseParser
+from .response import LLMResponseModel
+
+
+class FakeLLMClient(LLMBaseClient):
+    """
+    Class for a fake in-process LLM client that needs no model. Replies are generated from a generator seeded with the
+    seed (along with the seed of the request, if any) and the messages of the request, so the same request always gets
+    the same reply (and latency), no matter in which order the agents send them. Useful for load-testing the game engine
+    and the UI without a GPU
+    """
+
+    default_base_url: str = "fake://localhost"
+    supports_json_schema: bool = True
+
+    # The options (passed via backend_options) and their defaults
+    default_options: dict[str, Any] = {
+        "seed": 0,                          # Seed of the generator
+        "latency_distribution": "uniform",  # One of: constant, uniform, exponential, lognormal
+        "latency_mean_ms": 500,             # Mean latency of a reply
+        "latency_stddev_ms": 250,           # Spread of the latency (uniform and lognormal only)
+        "malformed_rate": 0.05,             # Probability of a reply not following the output schema
+        "vote_start_rate": 0.02,            # Probability of starting a vote (when no vote is in progress)
+        "dm_rate": 0.1,                     # Probability of sending a DM instead of a public message
+        "trailing_rate": 0.0,               # Probability of the model rambling on after the output schema
+        "reasoning_ms_per_token": 0,        # Time taken by every (hidden) reasoning token, before the reply starts
+    }
+    latency_distributions: list[str] = ["constant", "uniform", "exponential", "lognormal"]
+
+    # Number of hidden reasoning tokens generated before the reply for every reasoning effort (roughly what gpt-oss
+    # generates for a turn). Counted in the completion tokens, like the backends do
+    reasoning_tokens: dict[str, int] = {"low": 64, "medium": 256, "high": 1024}
+
+    # Note: The agent IDs are extracted from the prompts -- ensure these are consistent with ./prompt.py
+    _re_your_id = re.compile(r"\*\*YOU ARE (.+?)\*\*")
+    _re_personas = re.compile(r"Personas:(.*?)Rules:", re.DOTALL)
+    _re_persona_id = re.compile(r"^\s*- (.+?):", re.MULTILINE)
+
+    _phrases: list[str] = [
+        "I don't trust {target} one bit",
+        "{target}, what did you do before all this?",
+        "Something about {target} feels off",
+        "Has anyone else noticed how quiet {target} has been?",
+        "I'm with {target} on this one",
+        "That's exactly what a human would say, {target}",
+        "Let's not rush into anything",
+        "I have been watching everyone closely",
+    ]
+
+    _trailing_commentary: list[str] = [
+        "Note: I kept the message short so that it fits the persona. The suspicion is based on how they have been " +
+        "replying so far, which seems a little too polished for a bot. If they keep this up, I will start a vote.",
+        "Explanation: The message is meant to put some pressure on the others without revealing too much about what I " +
+        "think. Nobody seems to be acting out of place yet, so there is no reason to start a vote right now.",
+        "Let me know if you would like me to change the tone of the message or focus on a different agent instead.",
+    ]
+
+    @staticmethod
+    def create_client(base_url: str = None, api_key: str = None, http_client: httpx.AsyncClient = None) -> str:
+        """ Nothing to connect to -- returns the base URL """
+        return base_url or FakeLLMClient.default_base_url
+
+    @staticmethod
+    async def chat(client: str, model: str, messages: list[dict[str, str]], options: LLMGenerationOptions) -> LLMCompletion:
+        """ Generates a fake reply to the messages after a (fake) delay """
+        fake_options = {**FakeLLMClient.default_options, **options.backend_options}
+        seeds = [fake_options["seed"]] if (options.seed is None) else [fake_options["seed"], options.seed]
+        seed_str = json.dumps([*seeds, messages], sort_keys=True)
+        rng = random.Random(hashlib.sha256(seed_str.encode()).hexdigest())
+
+        latency_sec = FakeLLMClient.__sample_latency_sec(rng, fake_options)
+        reasoning_tokens = FakeLLMClient.reasoning_tokens.get(options.reasoning_effort, 0)
+        is_malformed = rng.random() < fake_options["malformed_rate"]
+        if options.json_schema is not None:
+            # Constrained to the schema -- the reply can't be malformed and nothing can follow it
+            content = json.dumps(FakeLLMClient.__generate_reply(rng, messages, fake_options))
+        elif is_malformed:
+            content = FakeLLMClient.__generate_malformed_reply(rng)
+        else:
+            reply = FakeLLMClient.__generate_reply(rng, messages, fake_options)
+            content = "\n".join(f"{key}: {reply[field_name]}" for (key, field_name) in LLMResponseParser.parser_map.items())
+            content += "\n" + LLMResponseParser.end_marker
+            if rng.random() < fake_options["trailing_rate"]:
+                content += "\n\n" + rng.choice(FakeLLMClient._trailing_commentary)
+
+        # Like the backends, stop at the first stop sequence -- what would have followed it is never generated
+        stop_at = [i for i in (content.find(stop) for stop in (options.stop or [])) if i >= 0]
+        if stop_at:
+            latency_sec *= min(stop_at) / len(content)
+            content = content[:min(stop_at)]
+
+        finish_reason = "stop"
+        max_chars = None
+        if options.max_tokens is not None:
+            # The cap covers the reasoning as well -- the reply may not even start
+            reasoning_tokens = min(reasoning_tokens, options.max_tokens)
+            max_chars = int((options.max_tokens - reasoning_tokens) * LLMTokenEstimator.chars_per_token)
+        if (max_chars is not None) and (len(content) > max_chars):
+            content = content[:max_chars]
+            finish_reason = "length"
+
+        reasoning_sec = reasoning_tokens * fake_options["reasoning_ms_per_token"] / 1000
+        if options.on_delta is None:
+            await asyncio.sleep(reasoning_sec + latency_sec)
+        else:
+            # Spread the latency over token-sized chunks, as if they were being generated (after reasoning)
+            await asyncio.sleep(reasoning_sec)
+            chunk_size = int(LLMTokenEstimator.chars_per_token)
+            chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+            for (i, chunk) in enumerate(chunks):
+                await asyncio.sleep(latency_sec / len(chunks))
+                if options.on_delta(chunk):
+                    content = "".join(chunks[:i+1])
+                    finish_reason = LLMCompletion.finish_reason_stopped
+                    break
+
+        return LLMCompletion(
+            content=content,
+            prompt_tokens=LLMTokenEstimator.estimate_messages(messages),
+            completion_tokens=LLMTokenEstimator.estimate(content) + reasoning_tokens,
+            finish_reason=finish_reason
+        )
+
+    @staticmethod
+    def __sample_latency_sec(rng: random.Random, fake_options: dict[str, Any]) -> float:
+        """ Helper method to sample the latency (in seconds) of a reply """
+        distribution = fake_options["latency_distribution"]
+        mean = fake_options["latency_mean_ms"]
+        stddev = fake_options["latency_stddev_ms"]
+
+        if distribution == "constant":
+            latency_ms = mean
+        elif distribution == "uniform":
+            latency_ms = rng.uniform(mean - stddev, mean + stddev)
+        elif distribution == "exponential":
+            latency_ms = rng.expovariate(1 / mean) if (mean > 0) else 0
+        elif distribution == "lognormal":
+            # Parameters of the underlying normal distribution for the given mean and standard deviation
+            sigma_sq = math.log(1 + (stddev / mean) ** 2)
+            mu = math.log(mean) - sigma_sq / 2
+            latency_ms = rng.lognormvariate(mu, math.sqrt(sigma_sq))
+        else:
+            raise ValueError(f"Latency distribution ({distribution}) is not supported: {FakeLLMClient.latency_distributions}")
+
+        return max(latency_ms, 0) / 1000
+
+    @staticmethod
+    def __generate_reply(rng: random.Random, messages: list[dict[str, str]], fake_options: dict[str, Any]) -> dict[str, Any]:
+        """ Helper method to generate the fields of a reply that follows the output schema """
+        prompts = "\n".join(msg["content"] for msg in messages if msg["role"] == "system")
+        your_id = FakeLLMClient.__get_your_id(prompts)
+        others = [agent_id for agent_id in FakeLLMClient.__get_agent_ids(prompts) if agent_id.lower() != your_id.lower()]
+        target = rng.choice(others) if others else None
+
+        vote_in_progress = "A VOTE IS IN PROGRESS" in prompts
+        already_voted = "You have already voted for" in prompts
+        start_a_vote = (target is not None) and (not vote_in_progress) and (rng.random() < fake_options["vote_start_rate"])
+        voting_for = target if (start_a_vote or (vote_in_progress and not already_voted)) else None
+        send_to = target if (target is not None) and (rng.random() < fake_options["dm_rate"]) else None
+
+        message = rng.choice(FakeLLMClient._phrases).format(target=f"@{target}" if target else "everyone")
+        return dict(
+            message=message,
+            intent=f"Trying to get a reaction out of {target or 'everyone'}",
+            send_to=send_to,
+            suspect=target,
+            suspect_confidence=rng.randint(0, 100) if target else 0,
+            suspect_reason="Acting suspicious" if target else "",
+            start_a_vote=start_a_vote,
+            voting_for=voting_for,
+        )
+
+    @staticmethod
+    def __generate_malformed_reply(rng: random.Random) -> str:
+        """ Helper method to generate a reply that doesn't follow the output schema """
+        malformed_replies = [
+            "Sure! Here is my response: I think someone here is not who they claim to be.",
+            "MESSAGE: I'm voting now\nINTENT: Get rid of them\nSTART_A_VOTE: True\nVOTING_FOR: None",
+            "INTENT: Forgot to write the message\nSEND_TO: None",
+            "MESSAGE: Hello there\nINTENT: Greet\nSEND_TO: Nobody-In-This-Room",
+            # Sloppy but salvageable
+            "MESSAGE: Has anyone noticed\nhow quiet it got?\nINTENT: Stir things up\nSEND_TO: None\nSUSPECT_CONFIDENCE: 85%",
+            "**MESSAGE:** Let's all calm down.\n**INTENT:** Look reasonable\n**SEND_TO:** everyone\n**START_A_VOTE:** no",
+        ]
+        return rng.choice(malformed_replies)
+
+    @staticmethod
+    def __get_your_id(prompts: str) -> str:
+        """ Helper method to get the ID of the agent the request is for """
+        match = FakeLLMClient._re_your_id.search(prompts)
+        return match.group(1) if match else ""
+
+    @staticmethod
+    def __get_agent_ids(prompts: str) -> list[str]:
+        """ Helper method to get the IDs of the agents still in the chatroom """
+        match = FakeLLMClient._re_personas.search(prompts)
+        if match is None:
+            return []
+
+        agent_ids = FakeLLMClient._re_persona_id.findall(match.group(1))
+        allowed_ids = LLMResponseModel.allowed_ids  # Excludes the terminated agents
+        return [agent_id.strip() for agent_id in agent_ids if (not allowed_ids) or (agent_id.strip().lower() in allowed_ids)]
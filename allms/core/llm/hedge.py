@@ -0,0 +1,91 @@
+import asyncio
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from allms.config import AppConfiguration
+from .completion import LLMCompletion
+
+
+@dataclass
+class LLMHedgingStats:
+    """ Class for tracking how often the requests were hedged and how often the hedge won """
+    requests: int = 0    # Total number of requests sent
+    hedged: int = 0      # Number of requests for which a duplicate (hedge) was sent
+    hedge_wins: int = 0  # Number of times the hedge returned a good answer before the original request
+
+    def as_dict(self) -> dict[str, Any]:
+        """ Returns the stats along with the hedging and win rates """
+        hedging_rate = (self.hedged / self.requests) if self.requests else 0.0
+        win_rate = (self.hedge_wins / self.hedged) if self.hedged else 0.0
+        return dict(requests=self.requests, hedged=self.hedged, hedge_wins=self.hedge_wins,
+                    hedging_rate=round(hedging_rate, 3), win_rate=round(win_rate, 3))
+
+
+@dataclass
+class LLMRequestHedger:
+    """
+    Class for hedging the requests to cut the tail latency. If a request hasn't returned within the given percentile
+    of the recent latencies, a duplicate is sent and the first good answer wins. The other one is cancelled
+    """
+    percentile: float  # Percentile (0-100] of the recent latencies after which a request is hedged
+
+    stats: LLMHedgingStats = field(default_factory=LLMHedgingStats)
+    _latencies: deque[float] = field(default_factory=lambda: deque(maxlen=AppConfiguration.llm_hedge_window))
+
+    def __post_init__(self):
+        assert 0 < self.percentile <= 100, f"Expected the hedging percentile to be in (0, 100] but got {self.percentile}"
+
+    def get_hedge_delay(self) -> Optional[float]:
+        """ Returns the delay (in seconds) after which a request is hedged. None if there are not enough samples yet """
+        if len(self._latencies) < AppConfiguration.llm_hedge_min_samples:
+            return None
+
+        latencies = sorted(self._latencies)
+        idx = max(0, math.ceil(self.percentile / 100 * len(latencies)) - 1)
+        return max(latencies[idx], AppConfiguration.llm_hedge_min_delay_sec)
+
+    async def run(self, send_request: Callable[[bool], Awaitable[LLMCompletion]]) -> LLMCompletion:
+        """
+        Sends the request (send_request(False)) and hedges it (send_request(True)) if it takes too long. Returns the
+        first good completion. If both fail, the outcome of the original request is returned (or raised)
+        """
+        self.stats.requests += 1
+        delay = self.get_hedge_delay()
+        primary = asyncio.create_task(self.__timed(send_request, is_hedge=False))
+        hedge: Optional[asyncio.Task] = None
+
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+
+            # Taking too long -- send a duplicate and go with whichever gives a good answer first
+            self.stats.hedged += 1
+            hedge = asyncio.create_task(self.__timed(send_request, is_hedge=True))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if (task.exception() is None) and task.result().content:
+                        if task is hedge:
+                            self.stats.hedge_wins += 1
+                        return task.result()
+
+            return primary.result()
+
+        finally:
+            # Cancel the loser (or both, if this was cancelled) so that the backend stops generating
+            for task in (primary, hedge):
+                if (task is not None) and (not task.done()):
+                    task.cancel()
+
+    async def __timed(self, send_request: Callable[[bool], Awaitable[LLMCompletion]], is_hedge: bool) -> LLMCompletion:
+        """ Helper method to send the request and record its latency if it succeeds """
+        start = time.monotonic()
+        completion = await send_request(is_hedge)
+        if completion.content:
+            self._latencies.append(time.monotonic() - start)
+        return completion
@@ -0,0 +1,143 @@
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Awaitable, Callable, Optional
+
+from allms.config import AppConfiguration
+from allms.core.agents import Agent
+from .completion import LLMTokenEstimator
+
+
+@dataclass
+class LLMAgentHistory:
+    """
+    Class for the chat log of an agent in the format sent to the LLMs, kept in sync with the chat log incrementally --
+    only what was appended to it since the last turn is formatted, and what was evicted from it is dropped along with it.
+    The chat messages (stored as IDs in the chat log) are formatted again only if a message was edited/deleted since.
+    Also keeps the history within the token budget of the agent, evicting the oldest items from the chat log once it
+    outgrows the budget
+    """
+    # Each item is of form (message ID if it is a chat message else None, message in the format sent to the LLMs, tokens)
+    entries: deque[tuple[Optional[str], dict[str, str], int]] = field(default_factory=deque)
+    cursor: tuple[int, int] = (0, 0)  # Position of the chat log the entries were last synced with
+    version: int = -1                 # Version of the messages the entries were last formatted with
+    tokens: int = 0                   # Estimated tokens of the entries
+
+    # Statistics of the budget
+    budget_tokens: int = 0            # Budget of the last sync
+    trims: int = 0                    # Times the history was trimmed down
+    evicted: int = 0                  # Items evicted from the chat log
+
+    async def sync(self,
+                   agent: Agent,
+                   version: int,
+                   format_message: Callable[[str], Awaitable[str]],
+                   budget_tokens: int,
+                   keep_evicted: bool = False) -> list[dict[str, str]]:
+        """
+        Syncs the history with the chat log of the agent and the given version of the messages, formatting the chat
+        messages via the given callback, and trims it down to the given budget. If asked to, what is evicted is added
+        to the backlog of the memory of the agent. Returns the messages in the format sent to the LLMs
+        """
+        chat_log = agent.chat_logs  # Each item is of form (role, message/message_ID, is_message_id)
+        cursor = agent.get_chat_log_cursor()
+
+        # Note: The chat log was cleared if it was reset or has fewer items appended than before -- start over
+        if (cursor[0] != self.cursor[0]) or (cursor[1] < self.cursor[1]):
+            self.__clear()
+            n_appended = len(chat_log)
+        else:
+            n_appended = min(cursor[1] - self.cursor[1], len(chat_log))
+
+        # Format the chat messages cached so far again only if some message was edited/deleted since
+        if version != self.version:
+            for (i, (msg_id, message, _)) in enumerate(self.entries):
+                if msg_id is not None:
+                    self.__replace(i, msg_id, dict(role=message["role"], content=await format_message(msg_id)))
+
+        for (role, msg, is_id) in islice(chat_log, len(chat_log) - n_appended, None):
+            content = (await format_message(msg)) if is_id else msg
+            self.__append(msg if is_id else None, dict(role=role, content=content))
+
+        # Note: Items are only ever evicted from the front of the chat log -- drop the ones evicted since
+        while len(self.entries) > len(chat_log):
+            self.__pop_oldest()
+
+        # Should never happen, but if the entries don't match the chat log (e.g. it was changed some other way than
+        # appending to and evicting from it), rebuild them from the whole chat log instead of sending a wrong history
+        if not self.__matches(chat_log):
+            AppConfiguration.logger.log(f"History of {agent.id} is out of sync with its chat log. Rebuilding it ...",
+                                        level=logging.WARNING)
+            self.__clear()
+            for (role, msg, is_id) in chat_log:
+                content = (await format_message(msg)) if is_id else msg
+                self.__append(msg if is_id else None, dict(role=role, content=content))
+
+        self.cursor, self.version = cursor, version
+        self.__trim(agent, budget_tokens, keep_evicted)
+
+        # Each message must be of the following format
+        # {"role": "user",      "content": <message>} for messages by other agents
+        # {"role": "assistant", "content": <message>} for messages by this agent
+        return [message for (_, message, _) in self.entries]
+
+    def get_stats(self) -> dict[str, Any]:
+        """ Returns the budget and how much of it the history used at the last sync """
+        used = (self.tokens / self.budget_tokens) if self.budget_tokens else 0.0
+        return dict(budget_tokens=self.budget_tokens, used_tokens=self.tokens, used_ratio=round(used, 2),
+                    messages=len(self.entries), trims=self.trims, evicted=self.evicted)
+
+    def __trim(self, agent: Agent, budget_tokens: int, keep_evicted: bool) -> None:
+        """
+        Helper method to trim the history (and the chat log of the agent) down once it outgrows the given budget.
+        The oldest items are dropped until it is well under the budget, so that the start of the history (and with it,
+        the prompt the backend can reuse) stays the same for the next few turns instead of shifting on every turn
+        """
+        self.budget_tokens = budget_tokens
+        if self.tokens <= budget_tokens:
+            return
+
+        target_tokens = int(budget_tokens * AppConfiguration.llm_history_trim_ratio)
+        evicted = []
+        while (self.tokens > target_tokens) and (len(self.entries) > 1):  # Note: The newest item is always kept
+            evicted.append(self.__pop_oldest())
+
+        n_evicted = len(evicted)
+        agent.evict_from_chat_log(n_evicted)
+        if keep_evicted:
+            agent.add_to_memory_backlog([message["content"] for message in evicted])
+        self.trims += 1
+        self.evicted += n_evicted
+        AppConfiguration.logger.log(f"History of {agent.id} outgrew its budget of {budget_tokens} tokens. Evicted the " +
+                                    f"{n_evicted} oldest items, {self.tokens} tokens left")
+
+    def __matches(self, chat_log: deque[tuple[str, str, bool]]) -> bool:
+        """ Helper method to check if the entries are the items of the given chat log """
+        if len(self.entries) != len(chat_log):
+            return False
+        return all((message["role"] == role) and ((msg_id == msg) if is_id else ((msg_id is None) and (message["content"] == msg)))
+                   for ((msg_id, message, _), (role, msg, is_id)) in zip(self.entries, chat_log))
+
+    def __clear(self) -> None:
+        """ Helper method to drop all the entries """
+        self.entries.clear()
+        self.tokens = 0
+
+    def __append(self, msg_id: Optional[str], message: dict[str, str]) -> None:
+        """ Helper method to append the given message (and its estimated tokens) to the entries """
+        tokens = LLMTokenEstimator.estimate_messages([message])
+        self.entries.append((msg_id, message, tokens))
+        self.tokens += tokens
+
+    def __replace(self, i: int, msg_id: Optional[str], message: dict[str, str]) -> None:
+        """ Helper method to replace the i-th entry with the given message (e.g. after an edit) """
+        tokens = LLMTokenEstimator.estimate_messages([message])
+        self.tokens += tokens - self.entries[i][2]
+        self.entries[i] = (msg_id, message, tokens)
+
+    def __pop_oldest(self) -> dict[str, str]:
+        """ Helper method to drop the oldest entry and return its message """
+        (_, message, tokens) = self.entries.popleft()
+        self.tokens -= tokens
+        return message
@@ -0,0 +1,167 @@
+import asyncio
+import math
+import statistics
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Optional
+
+from allms.config import AppConfiguration
+from .completion import LLMCompletion
+
+
+@dataclass
+class LLMConcurrencyStats:
+    """ Class for tracking how the concurrency limit has been adjusted """
+    samples: int = 0            # Replies the limit was tuned from
+    increases: int = 0          # Number of times the limit was raised
+    decreases: int = 0          # Number of times the limit was lowered
+    overloads: int = 0          # Requests that failed because the backend was overloaded (or timed out)
+    max_limit_reached: int = 0  # Largest limit so far
+    wait_ms: float = 0.0        # Total time the requests waited for the limit
+    load: Optional[float] = None  # Latency inflation of the last window over the tolerated one (> 1 = queueing)
+
+
+@dataclass
+class LLMConcurrencyLimiter:
+    """
+    Class for limiting the requests in flight to what the backend can serve without queueing them (AIMD). The limit is
+    raised by one after every window of replies in which the limit was used up and the latency stayed flat, and cut
+    down multiplicatively as soon as the latency inflates (i.e. the backend started queueing) or the backend fails
+    because of the load. Until the first cut, the limit is doubled instead of raised by one (slow start). The limit is
+    kept within [1, max_limit]. The latency
+    inflation of a reply is its latency over the time the backend actually spent on it (if reported, like Ollama's
+    native API does) or else its latency per token over the no-load latency per token. Only the replies to the requests
+    sent after the last adjustment count towards the next one
+    """
+    max_limit: int  # Largest limit allowed (e.g. the size of the connection pool)
+
+    limit: int = 1      # Requests allowed in flight (the one given is where it starts from, e.g. the number of agents)
+    in_flight: int = 0  # Requests currently holding a slot
+    waiting: int = 0    # Requests waiting for a slot
+    stats: LLMConcurrencyStats = field(default_factory=LLMConcurrencyStats)
+
+    _changed: asyncio.Condition = field(default_factory=asyncio.Condition)
+    _window: list[float] = field(default_factory=list)   # Load (see stats) of the replies since the last adjustment
+    _last_change: float = 0.0                            # Time (monotonic) of the last adjustment of the limit
+    _saturated: bool = False                             # Set if the limit was used up during the current window
+    _slow_start: bool = True                             # Set until the backend is found queueing for the first time
+    _latencies_per_token: deque[float] = field(default_factory=lambda: deque(maxlen=AppConfiguration.llm_concurrency_baseline_window))
+
+    def __post_init__(self):
+        assert self.max_limit >= 1, f"Expected the max. concurrency limit to be >= 1 but got {self.max_limit} instead"
+        self.limit = max(1, min(self.limit, self.max_limit))
+        self.stats.max_limit_reached = self.limit
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[None]:
+        """ Waits until the request can be sent without exceeding the limit and holds its slot until the context exits """
+        start = asyncio.get_running_loop().time()
+        async with self._changed:
+            self.waiting += 1
+            try:
+                await self._changed.wait_for(lambda: self.in_flight < self.limit)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            if self.in_flight >= self.limit:
+                self._saturated = True
+        self.stats.wait_ms += (asyncio.get_running_loop().time() - start) * 1000
+
+        try:
+            yield
+        finally:
+            async with self._changed:
+                self.in_flight -= 1
+                self._changed.notify_all()
+
+    async def record(self, latency_ms: float, completion: LLMCompletion) -> None:
+        """ Records a reply that took the given time, adjusting the limit at the end of every window """
+        # Replies to the requests sent before the last adjustment say nothing about the current limit
+        if time.monotonic() - latency_ms / 1000 < self._last_change:
+            return
+
+        load = self.__get_load(latency_ms, completion)
+        if load is None:
+            return
+
+        self.stats.samples += 1
+        self._window.append(load)
+        if len(self._window) < max(self.limit, AppConfiguration.llm_concurrency_min_samples):
+            return
+
+        # Note: The median keeps a single slow reply (e.g. the model being loaded) from cutting the limit down
+        window_load = statistics.median(self._window)
+        self.stats.load = round(window_load, 2)
+        if window_load > 1:
+            await self.__decrease(reason=f"backend is queueing, load: {window_load:.2f}")
+        elif self._saturated and (self.limit < self.max_limit):
+            new_limit = min((2 * self.limit) if self._slow_start else (self.limit + 1), self.max_limit)
+            await self.__set_limit(new_limit, reason=f"latency is flat, load: {window_load:.2f}")
+            self.stats.increases += 1
+        self.__reset_window()
+
+    async def record_overload(self, reason: str = "") -> None:
+        """ Records a request that failed because the backend was overloaded (e.g. rejected or timed out) """
+        self.stats.overloads += 1
+        await self.__decrease(reason=reason or "backend overloaded")
+        self.__reset_window()
+
+    def get_stats(self) -> dict[str, Any]:
+        """ Returns the current limit along with the statistics of its adjustments """
+        return dict(limit=self.limit, max_limit=self.max_limit, in_flight=self.in_flight, waiting=self.waiting,
+                    samples=self.stats.samples, increases=self.stats.increases, decreases=self.stats.decreases,
+                    overloads=self.stats.overloads, max_limit_reached=self.stats.max_limit_reached,
+                    wait_ms=round(self.stats.wait_ms, 1), load=self.stats.load)
+
+    async def __decrease(self, reason: str) -> None:
+        """ Helper method to cut the limit down multiplicatively """
+        self._slow_start = False
+        new_limit = max(1, math.floor(self.limit * AppConfiguration.llm_concurrency_backoff))
+        if new_limit < self.limit:
+            self.stats.decreases += 1
+            await self.__set_limit(new_limit, reason=reason)
+
+    async def __set_limit(self, limit: int, reason: str) -> None:
+        """ Helper method to change the limit, letting the waiting requests through if it went up """
+        AppConfiguration.logger.log(f"Concurrency limit {'raised' if (limit > self.limit) else 'lowered'} from " +
+                                    f"{self.limit} to {limit} ({reason})")
+        self._last_change = time.monotonic()
+        async with self._changed:
+            self.limit = limit
+            self.stats.max_limit_reached = max(self.stats.max_limit_reached, limit)
+            self._changed.notify_all()
+
+    def __reset_window(self) -> None:
+        """ Helper method to start a new window of replies """
+        self._window.clear()
+        self._saturated = self.in_flight >= self.limit
+
+    def __get_load(self, latency_ms: float, completion: LLMCompletion) -> Optional[float]:
+        """
+        Helper method to return how much longer the reply took than it would have without any load, over how much
+        longer it is allowed to take (None if unknown). Above 1 means the backend is queueing the requests
+        """
+        if not completion.content:
+            return None  # Failed midway -- says nothing about the load
+
+        # The time the backend actually spent on the reply -- anything beyond that was spent waiting in its queue
+        if (completion.prompt_eval_ms is not None) and (completion.eval_ms is not None):
+            service_ms = completion.prompt_eval_ms + completion.eval_ms
+            if service_ms <= 0:
+                return None
+            return (latency_ms / service_ms) / AppConfiguration.llm_concurrency_queueing_tolerance
+
+        # Otherwise compare the latency per token with the lowest ones seen recently (the no-load latency)
+        # Note: The low percentile keeps a single lucky reply from making every other reply look inflated
+        tokens = (completion.completion_tokens or 0) + AppConfiguration.llm_concurrency_prompt_token_weight * (completion.prompt_tokens or 0)
+        if tokens <= 0:
+            return None
+        latency_per_token = latency_ms / tokens
+        self._latencies_per_token.append(latency_per_token)
+        baseline_idx = len(self._latencies_per_token) // 10
+        baseline = sorted(self._latencies_per_token)[baseline_idx]
+        if baseline <= 0:
+            return None
+        return (latency_per_token / baseline) / AppConfiguration.llm_concurrency_latency_tolerance
@@ -1,13 +1,15 @@
 import asyncio
 import random
 from collections import deque
-from typing import Iterable, Optional
+from typing import Any, Iterable, Optional
 
 from allms.config import AppConfiguration, RunTimeConfiguration
 from allms.core.agents import Agent
 from allms.core.state.callbacks import StateManagerCallbackType, StateManagerCallbacks
+from .cassette import LLMCassettePlayer, LLMCassetteRecorder
 from .manager import LLMAgentsManager
 from .response import LLMResponseModel
+from .status import LLMBackendStatus
 
 
 class ChatLoop:
@@ -20,6 +22,8 @@ class ChatLoop:
                  terminated_agent_ids: set[str],
                  scenario: str,
                  callbacks: StateManagerCallbacks,
+                 cassette_recorder: Optional[LLMCassetteRecorder] = None,
+                 cassette_player: Optional[LLMCassettePlayer] = None,
                  ):
         self._config = config
         self._your_id = your_agent_id
@@ -34,8 +38,13 @@ class ChatLoop:
         }  # All except you and the terminated agents
         self._stop_loop: dict[str, bool] = {aid: False for aid in self._llm_agent_ids}
         self._agent_tasks: dict[str, asyncio.Task] = {}
+        self._generation_tasks: dict[str, asyncio.Task] = {}  # Mapping between agent ID and its in-flight generation
         self._pause_loop: bool = False
 
+        # The agents wait for the model to be warmed up before sending their first requests
+        self._warm_up_task: Optional[asyncio.Task] = None
+        self._warmed_up: asyncio.Event = asyncio.Event()
+
         # Maintain a rolling chat history per agent -- includes public messages, DMs and notifications
         # Since the number of agents would be typically small (if you configure it to be a value like > 100, either
         # you're crazy or you have a supercomputer powered by god himself idk), it's okay-ish to maintain redundant
@@ -43,10 +52,14 @@ class ChatLoop:
         self._llm_chat_history: dict[str, deque[str]] = {agent_id: deque() for agent_id in self._llm_agent_ids}
 
         self.__update_response_model_allowed_ids()
-        self._llm_agents_mgr = LLMAgentsManager(config=config, scenario=scenario, agents=self._agents, callbacks=self._callbacks)
+        self._llm_agents_mgr = LLMAgentsManager(config=config, scenario=scenario, agents=self._agents, callbacks=self._callbacks,
+                                                cassette_recorder=cassette_recorder, cassette_player=cassette_player,
+                                                your_agent_id=self._your_id, llm_agent_ids=self._llm_agent_ids)
 
     def start(self) -> None:
         """ Start the loop """
+        self._warm_up_task = asyncio.create_task(self.warm_up())
+        self._llm_agents_mgr.start()
         for agent_id in self._llm_agent_ids:
             AppConfiguration.logger.log(f"Starting agent loop for {agent_id} ... ")
             agent = self._agents[agent_id]
@@ -57,13 +70,37 @@ class ChatLoop:
         """ Pauses the loop """
         self._pause_loop = True
 
+        # Abort the generations in flight -- the backend stops generating as soon as the request is dropped
+        for agent_id, task in list(self._generation_tasks.items()):
+            AppConfiguration.logger.log(f"Cancelling the in-flight generation of {agent_id} as the loop is paused")
+            task.cancel()
+
     def resume(self) -> None:
         """ Resumes the loop """
         self._pause_loop = False
 
     def stop(self) -> None:
         """ Stops all the agents """
+        if self._warm_up_task is not None:
+            self._warm_up_task.cancel()
         self.stop_agents(self._llm_agent_ids.copy())
+        self._llm_agents_mgr.stop()
+        AppConfiguration.logger.log(f"LLM request statistics: {self.get_stats()}")
+
+    def get_stats(self) -> dict[str, Any]:
+        """ Returns the statistics of the requests sent by the agents so far """
+        return self._llm_agents_mgr.get_stats()
+
+    async def warm_up(self) -> None:
+        """ Warms up the model so that the first wave of requests by the agents don't pay for loading it """
+        await self._callbacks.invoke(StateManagerCallbackType.UPDATE_LLM_STATUS, LLMBackendStatus.WARMING_UP)
+        try:
+            warmed_up = await self._llm_agents_mgr.warm_up()
+        finally:
+            self._warmed_up.set()  # Let the agents go ahead regardless
+
+        status = LLMBackendStatus.READY if warmed_up else LLMBackendStatus.WARM_UP_FAILED
+        await self._callbacks.invoke(StateManagerCallbackType.UPDATE_LLM_STATUS, status)
 
     def stop_agents(self, agent_ids: str | Iterable[str] = None) -> None:
         """ Stops a given agent or a list of agents. If no agent is provided, stops every agent """
@@ -94,6 +131,7 @@ class ChatLoop:
         first_response = True
 
         try:
+            await self._warmed_up.wait()
             while not self._stop_loop[agent.id]:
 
                 # Sleep for N random seconds to simulate delays, like in a group-chat and to prevent spamming
@@ -121,12 +159,29 @@ class ChatLoop:
 
                 AppConfiguration.logger.log(f"Requesting response from agent ({agent_id}) ... ")
                 input_prompt = voting_started_prompt if vote_started else voting_not_started_prompt
+                turn = self._llm_agents_mgr.plan_turn(agent_id, vote_has_started=vote_started)
                 first_response = False
                 await self._callbacks.invoke(StateManagerCallbackType.IS_TYPING, agent_id, is_typing=True)
-                model_response: LLMResponseModel = await self._llm_agents_mgr.generate_response(agent_id,
-                                                                                                input_prompt=input_prompt,
-                                                                                                terminated_agents=self._terminated_agent_ids)
 
+                # Run the generation as a separate task so that it can be cancelled on its own when the loop is paused
+                # Note: Cancelling it (or the agent loop itself) drops the request, which makes the backend stop generating
+                generation = asyncio.create_task(self._llm_agents_mgr.generate_response(agent_id,
+                                                                                         input_prompt=input_prompt,
+                                                                                         terminated_agents=self._terminated_agent_ids,
+                                                                                         turn=turn))
+                self._generation_tasks[agent_id] = generation
+                try:
+                    await asyncio.wait({generation})
+                finally:
+                    generation.cancel()
+                    self._generation_tasks.pop(agent_id, None)
+
+                if generation.cancelled():
+                    AppConfiguration.logger.log(f"Generation of agent ({agent_id}) was cancelled. Skipping the turn")
+                    await self._callbacks.invoke(StateManagerCallbackType.IS_TYPING, agent_id, is_typing=False)
+                    continue
+
+                model_response: Optional[LLMResponseModel] = generation.result()
                 if model_response is None:
                     continue
 
@@ -146,7 +201,8 @@ class ChatLoop:
                 # 1. Send the message
                 msg_id = await self._callbacks.invoke(StateManagerCallbackType.SEND_MESSAGE, msg=msg, sent_by=agent_id, sent_by_you=False,
                                                       sent_to=send_to, thought_process=thought_process, suspect_id=suspect,
-                                                      suspect_reason=suspect_reason, suspect_confidence=suspect_confidence)
+                                                      suspect_reason=suspect_reason, suspect_confidence=suspect_confidence,
+                                                      reasoning_effort=turn.reasoning_effort)
 
                 # 2. Update the GUI
                 await self._callbacks.invoke(StateManagerCallbackType.IS_TYPING, agent_id, is_typing=False)
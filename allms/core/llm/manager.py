@@ -1,37 +1,144 @@
+import asyncio
+import contextlib
+import dataclasses
 import logging
+import time
+from typing import Any, AsyncContextManager, Optional
 
-import instructor
+import httpx
+import openai
+from instructor.core import InstructorError
 
 from allms.config import AppConfiguration, RunTimeConfiguration
 from allms.core.agents import Agent
-from allms.core.chat import ChatMessage, ChatMessageFormatter
 from allms.core.state.callbacks import StateManagerCallbackType, StateManagerCallbacks
+from .balancer import LLMEndpoint, LLMEndpointBalancer
+from .breaker import LLMCircuitBreaker, LLMCircuitState
+from .cassette import LLMCassettePlayer, LLMCassetteRecorder
+from .completion import LLMCompletion, LLMGenerationOptions, LLMTokenEstimator
 from .factory import client_factory
-from .parser import LLMResponseParser
+from .hedge import LLMRequestHedger
+from .history import LLMAgentHistory
+from .limiter import LLMConcurrencyLimiter
+from .memory import LLMMemorySummarizer
+from .parser import LLMJsonStreamParser, LLMParsingStats, LLMResponseParser, LLMResponseSalvager, LLMSchemaViolationError, LLMStreamParser
 from .prompt import LLMPromptGenerator
+from .registry import LLMClientRegistry
 from .response import LLMResponseModel
 from .roles import LLMRoles
+from .router import LLMModelRouter, LLMRoute, LLMRouteStats, LLMTurn
+from .status import LLMBackendStatus
 
 
 class LLMAgentsManager:
     """ Class for managing the agents """
-    def __init__(self, config: RunTimeConfiguration, scenario: str, agents: dict[str, Agent], callbacks: StateManagerCallbacks):
+
+    # Mapping between a model and the context window size (num_ctx) last used for it
+    # Note: Kept across the chatrooms because the backend reloads the model every time num_ctx changes
+    _context_sizes: dict[str, int] = {}
+
+    def __init__(self,
+                 config: RunTimeConfiguration,
+                 scenario: str,
+                 agents: dict[str, Agent],
+                 callbacks: StateManagerCallbacks,
+                 cassette_recorder: Optional[LLMCassetteRecorder] = None,
+                 cassette_player: Optional[LLMCassettePlayer] = None,
+                 your_agent_id: Optional[str] = None,
+                 llm_agent_ids: Optional[set[str]] = None,
+                 ):
         self._config = config
         self._scenario = scenario
         self._agents = agents
         self._callbacks = callbacks
         self._prompt = LLMPromptGenerator(scenario=self._scenario, agents=self._agents)
-        self._client: instructor.Instructor = client_factory(model=self._config.ai_model, is_offline=self._config.offline_model)
+
+        # Every turn goes to the same model, unless the turns are routed to different models based on their stakes
+        # Note: The routes share the endpoints (and the clients) -- the backend serves all the models
+        # The stakes are tracked either way, as they also decide the reasoning effort of the turns
+        routing = self._config.model_routing
+        self._router = LLMModelRouter(suspicion_threshold=routing["suspicion_threshold"], human_id=your_agent_id)
+        route_models = {LLMModelRouter.routine: self._config.ai_model}
+        if routing["enabled"]:
+            route_models = {LLMModelRouter.routine: routing["routine_model"], LLMModelRouter.high_stakes: routing["high_stakes_model"]}
+        self._routes: dict[str, LLMRoute] = {name: self.__create_route(name, model) for (name, model) in route_models.items()}
+
+        # Mapping between the stakes of a turn and the reasoning effort asked of the model (None = not sent at all,
+        # once the backend has rejected it)
+        self._reasoning_efforts: Optional[dict[str, str]] = {LLMModelRouter.routine: self._config.ai_routine_reasoning_lvl,
+                                                             LLMModelRouter.high_stakes: self._config.ai_reasoning_lvl}
+        self._reasoning_stats: dict[str, LLMRouteStats] = {}  # Mapping between the reasoning effort and its requests
+
+        # Options sent with every request (only used by the backends that support them)
+        backend_options = self._config.fake_options if (self._config.backend == "fake") else self._config.ollama_options
+        self._backend_options = dict(backend_options)
+        self._keep_alive = self._backend_options.pop("keep_alive", None)
+        self._num_ctx = self._backend_options.pop("num_ctx", None)  # Can also be "auto"
+
+        # Note: Only the agents played by the LLMs (and still in the game) send requests
+        self._llm_agent_ids = llm_agent_ids if (llm_agent_ids is not None) else {aid for aid in self._agents if aid != your_agent_id}
+
+        # Shared by all the agents -- holds their requests back once the backend starts queueing them
+        # Note: Without it, every agent has a request in flight whatever the backend can serve. That is also where the
+        # limit starts from, so that it is only ever lowered for the backends that can't keep up with every agent
+        self._limiter: Optional[LLMConcurrencyLimiter] = None
+        if self._config.adaptive_concurrency:
+            self._limiter = LLMConcurrencyLimiter(max_limit=self._config.max_connections, limit=len(self._llm_agent_ids))
+
+        # Shared by all the agents -- parks them while the backend is down instead of letting them hammer it
+        self._breaker = LLMCircuitBreaker(probe=self.__probe_backend, on_state_change=self.__circuit_state_changed)
+
+        # Records the traffic to the backend or serves the replies from an earlier recording instead of the backend
+        self._cassette_recorder = cassette_recorder
+        self._cassette_player = cassette_player
+
+        self._parsing_stats = LLMParsingStats()
+
+        # Constrain the replies to the JSON schema of the response if asked to and the backend can do it
+        self._json_output = self._config.constrained_output and \
+            all(endpoint.client_cls.supports_json_schema for route in self._routes.values() for endpoint in route.balancer.endpoints)
+        if self._config.constrained_output and (not self._json_output):
+            AppConfiguration.logger.log(f"Backend ({self._config.backend}) can't constrain the replies to a JSON schema. " +
+                                        f"Falling back to the text output schema", level=logging.WARNING)
+
+        # Mapping between agent ID and (time, text) of the partial message last shown for it (only when streaming)
+        self._partial_messages: dict[str, tuple[float, Optional[str]]] = {}
+
+        # Mapping between agent ID and its chat log in the format sent to the LLMs (synced with it on every turn)
+        self._histories: dict[str, LLMAgentHistory] = {}
+
+        # Folds what is evicted from the chat logs into the memories of the agents, using the spare capacity of the backend
+        # Note: Nothing to update if the replies come from a recording -- the memories are the ones in the save
+        self._summarizer: Optional[LLMMemorySummarizer] = None
+        if self._config.agent_memory and (self._cassette_player is None):
+            self._summarizer = LLMMemorySummarizer(agents=self._agents, live_agent_ids=self._llm_agent_ids,
+                                                   has_spare_capacity=self.__has_spare_capacity,
+                                                   send_request=self.__send_memory_request)
 
         self._there_is_a_human_prompt = self.__get_presence_of_human_prompt()
         self._bg_prompt = self.__get_background_prompt()
         self._op_prompt = self.__get_output_prompt()
 
-    async def generate_response(self, agent_id: str, input_prompt: str, terminated_agents: set[str]) -> LLMResponseModel | None:
-        """ Generates a response by the LLM and returns it """
+    def plan_turn(self, agent_id: str, vote_has_started: bool) -> LLMTurn:
+        """ Decides the stakes of the next turn of the given agent -- and with it, its route and reasoning effort """
+        stakes, reason = self._router.pick(self._agents[agent_id], vote_has_started)
+        route = self._routes.get(stakes, self._routes[LLMModelRouter.routine])
+        reasoning_effort = self._reasoning_efforts[stakes] if (self._reasoning_efforts is not None) else None
+        AppConfiguration.logger.log(f"Turn of {agent_id} is {stakes} ({reason}): {route.model}, reasoning effort: {reasoning_effort}")
+        return LLMTurn(stakes=stakes, reason=reason, route=route, reasoning_effort=reasoning_effort)
+
+    async def generate_response(self,
+                                agent_id: str,
+                                input_prompt: str,
+                                terminated_agents: set[str],
+                                turn: Optional[LLMTurn] = None) -> LLMResponseModel | None:
+        """ Generates a response by the LLM for the given turn (planned via plan_turn) and returns it """
         tries = 0
+        rate_limited_waits = 0
         generated_message = ""
         parsed_response = None
+        turn = turn or self.plan_turn(agent_id, vote_has_started=False)
+        route = turn.route
 
         # Note: Need to include the instructions in the history
         human_prompt = await self.__create_message(content=self._there_is_a_human_prompt)
@@ -40,47 +147,530 @@ class LLMAgentsManager:
         ip_prompt = await self.__create_message(content=input_prompt)
         term_prompt = await self.__create_message(content=self._prompt.generate_terminated_agents_prompt(terminated_agents))
         history = await self.__prepare_history(agent_id)
-        messages = [bg_prompt] + history + [ip_prompt, human_prompt, term_prompt, op_prompt]
 
+        # What the agent remembers of the messages evicted from its history (if anything)
+        memory = self._agents[agent_id].memory
+        memory_prompts = [await self.__create_message(content=self._prompt.generate_remembered_prompt(memory))] if memory else []
+        if self._config.prompt_layout == "stable":
+            # What doesn't change from turn to turn comes first (what all the agents share, then the persona of the
+            # agent) and the history after it, so that the backend can reuse the prompt processed in the agent's
+            # previous turn (its KV cache) -- only the new messages and the tail need to be processed
+            # Note: The memory is updated in the background at any time -- it goes in the tail so that an update
+            # doesn't invalidate the history cached before it
+            persona_prompt = await self.__create_message(content=self._prompt.generate_persona_prompt(agent_id))
+            messages = [bg_prompt, human_prompt, op_prompt, persona_prompt] + history + memory_prompts + [ip_prompt, term_prompt]
+        else:
+            messages = [bg_prompt] + memory_prompts + history + [ip_prompt, human_prompt, term_prompt, op_prompt]
+
+        # Note: The partial message of the previous turn (if any) was removed from the chat when the agent stopped typing
+        self._partial_messages.pop(agent_id, None)
         while tries < AppConfiguration.max_model_retries:
+            if tries > 0:
+                self.__show_partial_message(agent_id, None)  # Clear whatever the failed attempt has shown
+            await self._breaker.wait_until_closed()
             tries += 1
-            response = await self._client.chat.completions.create(
-                response_model=None,  # We will handle it ourselves
-                model=self._config.ai_model,
-                messages=messages
-            )
+            if tries > 1:
+                self._parsing_stats.record_regeneration(prompt_tokens=LLMTokenEstimator.estimate_messages(messages))
+            json_output = self._json_output  # Might get turned off midway if the backend rejects the schema
+            if self._reasoning_efforts is None:  # Ditto for the reasoning effort
+                turn.reasoning_effort = None
+            op_prompt["content"] = self._op_prompt
+            json_schema = None
+            if json_output:
+                json_schema = LLMResponseModel.get_json_schema(aid for aid in self._agents if aid not in terminated_agents)
+            sampling = self.__get_sampling_options(agent_id, attempt=tries)
+            # Note: The backend stops right after the text output schema, whether the reply is streamed or not (nothing
+            # can follow the JSON object anyway)
+            options = LLMGenerationOptions(keep_alive=self._keep_alive,
+                                           num_ctx=self.__get_context_size(messages, route.model, sampling["max_tokens"]),
+                                           backend_options=self._backend_options,
+                                           json_schema=json_schema,
+                                           stop=None if json_output else [LLMResponseParser.end_marker],
+                                           reasoning_effort=turn.reasoning_effort,
+                                           **sampling)
+            try:
+                # Note: The HTTP timeout only limits each read -- this also caps slow replies trickling in
+                # (the time spent waiting for the rate and concurrency limits doesn't count)
+                await self.__wait_for_rate_limits(agent_id, route, messages, options)
+                async with self.__limit_concurrency():
+                    completion = await asyncio.wait_for(self.__send_request(agent_id, messages, options, route),
+                                                        timeout=self._config.request_timeout)
+            except LLMSchemaViolationError as e:
+                # The backend is fine, the model just went off the rails -- the rest of the reply wasn't generated
+                await self._breaker.record_success()
+                self._parsing_stats.record(is_malformed=True, tokens=LLMTokenEstimator.estimate(e.content), aborted=True)
+                AppConfiguration.logger.log(f"[{tries}] Aborted the response of {agent_id} midway: {e.content}. " +
+                                            f"Exception: {e}. Retrying ... ", level=logging.CRITICAL)
+                exception_msg = await self.__create_message(content=str(e), role=LLMRoles.system)
+                messages.append(exception_msg)
+                continue
+            except asyncio.TimeoutError:
+                AppConfiguration.logger.log(f"[{tries}] Request for {agent_id} exceeded the deadline of " +
+                                            f"{self._config.request_timeout}s. Retrying ... ", level=logging.CRITICAL)
+                await self._breaker.record_failure(reason="deadline exceeded")
+                await self.__record_overload(reason="deadline exceeded")
+                continue
+            except (openai.APIError, httpx.HTTPError, InstructorError) as e:
+                # The balancer has already taken note of the failure -- the retry may go to a different endpoint
+                e = LLMEndpointBalancer.get_root_cause(e)
+                AppConfiguration.logger.log(f"[{tries}] Request for {agent_id} failed: {e}. Retrying ... ", level=logging.CRITICAL)
+                if (LLMEndpointBalancer.get_status_code(e) == 429) and (route.rate_limiter is not None):
+                    # The backend is fine, it just wants the requests to slow down -- the rate limiter takes care of it
+                    await route.rate_limiter.record_rate_limited(LLMEndpointBalancer.get_headers(e))
+                    if rate_limited_waits < AppConfiguration.llm_rate_limit_max_waits:
+                        rate_limited_waits += 1
+                        tries -= 1  # Waiting out the rate limits doesn't count as a try
+                    continue
+                if LLMEndpointBalancer.is_overloaded(e):
+                    await self.__record_overload(reason=str(e))
+                if LLMEndpointBalancer.is_backend_failure(e):
+                    await self._breaker.record_failure(reason=str(e))
+                elif (LLMEndpointBalancer.get_status_code(e) == 400) and (turn.reasoning_effort is not None) and self.__is_reasoning_rejection(e):
+                    self.__disable_reasoning_effort(reason=str(e))
+                elif json_output and (LLMEndpointBalancer.get_status_code(e) == 400):
+                    self.__disable_json_output(reason=str(e))
+                continue
 
-            if (not response) or (not response.choices):
+            await self._breaker.record_success()
+            if not completion.content:
                 AppConfiguration.logger.log(f"[{tries}] {agent_id} could not generate a response. Retrying ... ", level=logging.CRITICAL)
                 continue
 
+            completion_tokens = completion.completion_tokens or LLMTokenEstimator.estimate(completion.content)
+            if not json_output:  # Nothing can follow the JSON object
+                self.__record_trailing_output(agent_id, completion)
             try:
-                # TODO: Need to check if the below line will work with non OpenAI models as I'm currently not sure of it
-                # TODO: If doesn't work, then need to come up with a generalized method to extract the contents
-                generated_message = (response.choices[0]).message.content
-                parsed_response = LLMResponseParser.parse(generated_message)
+                generated_message = completion.content
+                repairs = []
+                if json_output:
+                    parsed_response = LLMResponseParser.parse_json(generated_message)
+                else:
+                    # Repair what can be repaired instead of regenerating the whole response
+                    parsed_response, repairs = LLMResponseSalvager.salvage(generated_message)
+                if repairs:
+                    AppConfiguration.logger.log(f"[{tries}] Salvaged the response of {agent_id}: {generated_message}. " +
+                                                f"Repairs: {repairs}", level=logging.WARNING)
+                self._parsing_stats.record(is_malformed=False, salvaged=bool(repairs))
                 break
 
             except (ValueError, Exception) as e:
+                self._parsing_stats.record(is_malformed=True, tokens=completion_tokens)
                 AppConfiguration.logger.log(f"[{tries}] {agent_id} generated a malformed response: {generated_message}. " +
                                             f"Exception: {e}. ENSURE YOU ADHERE TO THE EXPECTED OUTPUT SCHEMA", level=logging.CRITICAL)
+
+                # Fixing the format is far cheaper than regenerating the response from the whole conversation
+                if self._config.repair_responses:
+                    parsed_response = await self.__repair_response(agent_id, generated_message, error=str(e), route=route,
+                                                                   json_output=json_output, terminated_agents=terminated_agents)
+                    if parsed_response is not None:
+                        break
+
                 # Add in the exception message to the list of messages inorder for the model to generate a better response next time
                 exception_msg = await self.__create_message(content=str(e), role=LLMRoles.system)
                 messages.append(exception_msg)
                 continue
 
         # Either the model failed to generate a response properly or it successfully generated the message
+        output_mode = "json" if self._json_output else "text"
+        self._parsing_stats.record_turn(tries, success=(parsed_response is not None))
         if parsed_response is None:
             AppConfiguration.logger.log(f"{agent_id} exceeded max. tries and could not generate a response. Returning None")
+        else:
+            AppConfiguration.logger.log(f"{agent_id} generated a valid response in {tries} tries ({output_mode} output, " +
+                                        f"{route.model}, reasoning effort: {turn.reasoning_effort})")
+            self._router.record_response(agent_id, parsed_response)
         return parsed_response
 
+    async def warm_up(self) -> bool:
+        """
+        Sends a tiny request to every endpoint to force the model to be loaded and the shared background prompt to be
+        processed before the agents start. Returns True if atleast one endpoint could be warmed up
+        """
+        if self._cassette_player is not None:
+            return True  # Replies come from the recording -- nothing to warm up
+
+        async def _warm_up(_endpoint, _model: str) -> bool:
+            """ Helper method to warm up the model on a single endpoint """
+            try:
+                await self.__ping(_endpoint, _model)
+                return True
+            except (openai.APIError, httpx.HTTPError, InstructorError) as e:
+                e = LLMEndpointBalancer.get_root_cause(e)
+                AppConfiguration.logger.log(f"Could not warm up {_model} on {_endpoint.url}: {e}", level=logging.WARNING)
+                return False
+
+        warm_ups = []
+        for route in self._routes.values():
+            AppConfiguration.logger.log(f"Warming up {route.model} on {len(route.balancer.endpoints)} endpoint(s) ...")
+            warm_ups.extend(_warm_up(endpoint, route.model) for endpoint in route.balancer.endpoints)
+        results = await asyncio.gather(*warm_ups)
+        return any(results)
+
+    def start(self) -> None:
+        """ Starts the background activity of the manager (if any) """
+        if self._summarizer is not None:
+            self._summarizer.start()
+
+    def stop(self) -> None:
+        """ Stops the background activity of the manager (if any) """
+        self._breaker.stop()
+        if self._summarizer is not None:
+            self._summarizer.stop()
+
+    def get_stats(self) -> dict[str, Any]:
+        """ Returns the statistics of the requests sent so far (useful for tuning the backend settings) """
+        stats = dict(routes={name: route.get_stats() for (name, route) in self._routes.items()},
+                     circuit_breaker=self._breaker.get_stats(),
+                     reasoning={effort: effort_stats.as_dict() for (effort, effort_stats) in self._reasoning_stats.items()},
+                     parsing=dict(output="json" if self._json_output else "text", **self._parsing_stats.as_dict()),
+                     routing=self._router.get_stats(),
+                     prompt_layout=self._config.prompt_layout,
+                     history={agent_id: history.get_stats() for (agent_id, history) in self._histories.items()})
+        if self._limiter is not None:
+            stats["concurrency"] = self._limiter.get_stats()
+        if self._summarizer is not None:
+            stats["memory"] = self._summarizer.get_stats()
+        return stats
+
     def get_input_prompt(self, agent_id: str, voting_has_started: bool, started_by: str = None, voted_for: str = None) -> str:
+        # Note: With the stable layout, the persona is added before the history by generate_response instead
+        if self._config.prompt_layout == "stable":
+            return self._prompt.generate_turn_prompt(agent_id, voting_has_started, started_by, voted_for)
         return self._prompt.generate_input_prompt(agent_id, voting_has_started, started_by, voted_for)
 
+    async def __send_request(self,
+                             agent_id: str,
+                             messages: list[dict[str, str]],
+                             options: LLMGenerationOptions,
+                             route: LLMRoute) -> LLMCompletion:
+        """ Helper method to send the request to one of the endpoints of the route (hedging it if enabled) and return the completion """
+        primary_endpoint: Optional[LLMEndpoint] = None
+
+        async def _send(is_hedge: bool) -> LLMCompletion:
+            """ Helper method to send a single copy of the request """
+            nonlocal primary_endpoint
+            # The hedge goes to a different endpoint than the original request whenever there is one
+            avoid = primary_endpoint if is_hedge else None
+            async with route.balancer.acquire(agent_id, avoid=avoid) as endpoint:
+                if not is_hedge:
+                    primary_endpoint = endpoint
+                else:
+                    AppConfiguration.logger.log(f"Request for {agent_id} is taking too long. Hedging it on {endpoint.url}")
+                    if route.rate_limiter is not None:
+                        route.rate_limiter.charge(self.__estimate_request_tokens(messages, options))  # Too late to wait
+
+                send_options = options
+                if self._config.stream_responses:
+                    # Each copy of the request gets its own parser -- their replies arrive independently
+                    stream_parser = LLMJsonStreamParser() if (options.json_schema is not None) else LLMStreamParser()
+
+                    def _on_delta(delta: str) -> bool:
+                        schema_complete = stream_parser.feed(delta)
+                        if not is_hedge:  # Only one copy is shown while typing
+                            text = stream_parser.message or None  # Nothing to show until the first word arrives
+                            self.__show_partial_message(agent_id, text, force=stream_parser.message_complete)
+                        return schema_complete  # Stop the generation -- anything after the schema is ignored anyway
+
+                    send_options = dataclasses.replace(options, on_delta=_on_delta)
+                return await endpoint.chat(model=route.model, messages=messages, options=send_options)
+
+        if self._cassette_player is not None:
+            completion = await self._cassette_player.play(agent_id)
+            if completion is not None:
+                return completion
+
+        start = time.monotonic()
+        if route.hedger is None:
+            completion = await _send(is_hedge=False)
+        else:
+            completion = await route.hedger.run(_send)
+
+        latency_ms = (time.monotonic() - start) * 1000
+        prompt_tokens_sent = LLMTokenEstimator.estimate_messages(messages)
+        route.stats.record(latency_ms, completion, prompt_tokens_sent=prompt_tokens_sent)
+        if self._limiter is not None:
+            await self._limiter.record(latency_ms, completion)
+        if route.rate_limiter is not None:
+            await route.rate_limiter.record(completion, charged_tokens=self.__estimate_request_tokens(messages, options))
+        effort = options.reasoning_effort or "default"
+        self._reasoning_stats.setdefault(effort, LLMRouteStats()).record(latency_ms, completion, prompt_tokens_sent=prompt_tokens_sent)
+        if self._cassette_recorder is not None:
+            self._cassette_recorder.record(agent_id, model=route.model, messages=messages,
+                                           latency_ms=latency_ms, completion=completion)
+        return completion
+
+    async def __repair_response(self,
+                                agent_id: str,
+                                response: str,
+                                error: str,
+                                route: LLMRoute,
+                                json_output: bool,
+                                terminated_agents: set[str]) -> LLMResponseModel | None:
+        """
+        Helper method to ask the model to only fix the format of the given malformed response. Sends just the response,
+        the problem with it and a compact output schema (no background or history). Returns None if it couldn't be fixed
+        """
+        allowed_ids = [aid for aid in self._agents if aid not in terminated_agents]
+        repair_prompt = await self.__create_message(content=self._prompt.generate_repair_prompt(allowed_ids, json_output))
+        reply_prompt = await self.__create_message(content=f"REPLY:\n{response}\n\nWHAT IS WRONG: {error}", role=LLMRoles.user)
+        messages = [repair_prompt, reply_prompt]
+        prompt_tokens = LLMTokenEstimator.estimate_messages(messages)
+
+        sampling = self.__get_sampling_options(agent_id)
+        sampling["max_tokens"] = min(sampling["max_tokens"] or AppConfiguration.llm_repair_max_tokens, AppConfiguration.llm_repair_max_tokens)
+        options = LLMGenerationOptions(keep_alive=self._keep_alive,
+                                       num_ctx=self.__get_context_size(messages, route.model, sampling["max_tokens"]),
+                                       backend_options=self._backend_options,
+                                       reasoning_effort=self.__get_repair_reasoning_effort(),
+                                       **sampling,
+                                       json_schema=LLMResponseModel.get_json_schema(allowed_ids) if json_output else None,
+                                       stop=None if json_output else [LLMResponseParser.end_marker])
+        try:
+            await self.__wait_for_rate_limits(agent_id, route, messages, options)
+            async with self.__limit_concurrency():
+                completion = await asyncio.wait_for(self.__send_request(agent_id, messages, options, route),
+                                                    timeout=self._config.request_timeout)
+            if json_output:
+                parsed_response = LLMResponseParser.parse_json(completion.content)
+            else:
+                parsed_response, _ = LLMResponseSalvager.salvage(completion.content)
+        except (LLMSchemaViolationError, asyncio.TimeoutError, openai.APIError, httpx.HTTPError, InstructorError, ValueError) as e:
+            e = LLMEndpointBalancer.get_root_cause(e)
+            if (LLMEndpointBalancer.get_status_code(e) == 429) and (route.rate_limiter is not None):
+                await route.rate_limiter.record_rate_limited(LLMEndpointBalancer.get_headers(e))
+            self._parsing_stats.record_repair(prompt_tokens, success=False)
+            AppConfiguration.logger.log(f"Could not fix the format of the response of {agent_id}: {e}. " +
+                                        f"Regenerating it instead ... ", level=logging.WARNING)
+            return None
+
+        self._parsing_stats.record_repair(prompt_tokens, success=True)
+        AppConfiguration.logger.log(f"Fixed the format of the response of {agent_id} with ~{prompt_tokens} prompt tokens: " +
+                                    f"{completion.content}")
+        return parsed_response
+
+    def __create_route(self, name: str, model: str) -> LLMRoute:
+        """ Helper method to create the route sending the requests to the given model """
+        balancer = client_factory(model=model,
+                                  is_offline=self._config.offline_model,
+                                  endpoints=list(self._config.endpoints),
+                                  sticky=self._config.sticky_endpoints,
+                                  backend=self._config.backend)
+        hedger = LLMRequestHedger(percentile=self._config.hedge_percentile) if self._config.hedge_requests else None
+        rate_limiter = LLMClientRegistry.get_rate_limiter(model, [endpoint.url for endpoint in balancer.endpoints],
+                                                          **self._config.rate_limits)
+        return LLMRoute(name=name, model=model, balancer=balancer, hedger=hedger, rate_limiter=rate_limiter)
+
+    async def __send_memory_request(self, agent_id: str, messages: list[dict[str, str]]) -> LLMCompletion:
+        """
+        Helper method to send the request updating the memory of the given agent to the routine route. Sent on its own
+        (not streamed, hedged or recorded) and not counted in the statistics of the route -- those are of the turns
+        """
+        route = self._routes[LLMModelRouter.routine]
+        max_tokens = AppConfiguration.llm_memory_max_tokens
+        options = LLMGenerationOptions(keep_alive=self._keep_alive,
+                                       num_ctx=self.__get_context_size(messages, route.model, max_tokens),
+                                       backend_options=self._backend_options,
+                                       max_tokens=max_tokens,
+                                       reasoning_effort=self.__get_repair_reasoning_effort())
+        try:
+            await self.__wait_for_rate_limits(agent_id, route, messages, options)
+            async with self.__limit_concurrency():
+                # Note: Not sticky -- the agent's endpoint has the prefix of its prompt cached, which this would evict
+                async with route.balancer.acquire() as endpoint:
+                    completion = await asyncio.wait_for(endpoint.chat(model=route.model, messages=messages, options=options),
+                                                        timeout=self._config.request_timeout)
+        except (openai.APIError, httpx.HTTPError, InstructorError) as e:
+            root_cause = LLMEndpointBalancer.get_root_cause(e)
+            if (LLMEndpointBalancer.get_status_code(root_cause) == 429) and (route.rate_limiter is not None):
+                await route.rate_limiter.record_rate_limited(LLMEndpointBalancer.get_headers(root_cause))
+            raise
+
+        if route.rate_limiter is not None:
+            await route.rate_limiter.record(completion, charged_tokens=self.__estimate_request_tokens(messages, options))
+        return completion
+
+    def __has_spare_capacity(self) -> bool:
+        """
+        Helper method to check if the backend has spare capacity right now, i.e. a request can be sent without holding
+        back (or slowing down) the requests of the agents
+        """
+        if self._breaker.state != LLMCircuitState.CLOSED:
+            return False
+        if any((route.rate_limiter is not None) and route.rate_limiter.has_waiting() for route in self._routes.values()):
+            return False
+        if self._limiter is not None:
+            # Note: A slot is left free for the next turn of an agent, as the request can't be preempted once sent
+            headroom = 1 if (self._limiter.limit > 1) else 0
+            return (self._limiter.waiting == 0) and (self._limiter.in_flight < self._limiter.limit - headroom)
+
+        # Otherwise, what the backend can serve isn't known -- only use an endpoint that is idle
+        # Note: The routes share the endpoints, but each tracks its own requests
+        busy_urls = {endpoint.url for route in self._routes.values() for endpoint in route.balancer.endpoints if endpoint.outstanding > 0}
+        return any(endpoint.healthy and (endpoint.url not in busy_urls) for endpoint in self._routes[LLMModelRouter.routine].balancer.endpoints)
+
+    def __limit_concurrency(self) -> AsyncContextManager:
+        """ Helper method to hold a request back until the concurrency limit (if any) lets it through """
+        if (self._limiter is None) or (self._cassette_player is not None):
+            return contextlib.nullcontext()  # Nothing to limit if the replies come from a recording
+        return self._limiter.acquire()
+
+    async def __wait_for_rate_limits(self,
+                                     agent_id: str,
+                                     route: LLMRoute,
+                                     messages: list[dict[str, str]],
+                                     options: LLMGenerationOptions) -> None:
+        """ Helper method to hold a request back until it fits in the rate limits of the route (if any) """
+        if (route.rate_limiter is None) or (self._cassette_player is not None):
+            return  # Nothing to limit if the replies come from a recording
+        await route.rate_limiter.wait_for_turn(agent_id, tokens=self.__estimate_request_tokens(messages, options))
+
+    @staticmethod
+    def __estimate_request_tokens(messages: list[dict[str, str]], options: LLMGenerationOptions) -> int:
+        """ Helper method to estimate the tokens of a request as counted by the rate limits (the reply at its cap) """
+        return LLMTokenEstimator.estimate_messages(messages) + (options.max_tokens or 0)
+
+    async def __record_overload(self, reason: str) -> None:
+        """ Helper method to let the concurrency limiter (if any) know that the backend couldn't keep up """
+        if self._limiter is not None:
+            await self._limiter.record_overload(reason)
+
+    def __get_sampling_options(self, agent_id: str, attempt: int = 1) -> dict[str, Any]:
+        """
+        Helper method to return the options of the generation profile of the given agent (all None if it has none) for
+        the given attempt at generating its reply
+        """
+        profile = self._agents[agent_id].get_generation_profile()
+        if profile is None:
+            return dict(max_tokens=None, temperature=None, top_p=None, seed=None)
+
+        # Note: The same seed would reproduce the same (failed) reply -- every retry gets the next seed instead
+        seed = None
+        if profile.seed is not None:
+            seed = (profile.seed + attempt - 1) % (AppConfiguration.max_generation_seed + 1)
+        return dict(max_tokens=profile.max_tokens, temperature=profile.temperature, top_p=profile.top_p, seed=seed)
+
+    def __get_repair_reasoning_effort(self) -> Optional[str]:
+        """ Helper method to return the reasoning effort for fixing the format of a response -- the least there is """
+        # Note: There is nothing to reason about, the contents of the response are kept as-is
+        return AppConfiguration.ai_reasoning_levels[0] if (self._reasoning_efforts is not None) else None
+
+    def __record_trailing_output(self, agent_id: str, completion: LLMCompletion) -> None:
+        """ Helper method to record the output generated after the output schema was complete """
+        stopped = (completion.finish_reason == LLMCompletion.finish_reason_stopped)
+        trailing_content = LLMResponseParser.get_trailing_content(completion.content)
+        trailing_tokens = LLMTokenEstimator.estimate(trailing_content) if trailing_content else 0
+        self._parsing_stats.record_trailing(trailing_tokens, stopped=stopped)
+
+        if stopped:
+            AppConfiguration.logger.log(f"Stopped the generation of {agent_id} once the output schema was complete")
+        elif trailing_tokens > 0:
+            AppConfiguration.logger.log(f"{agent_id} generated ~{trailing_tokens} token(s) after the output schema: {trailing_content}")
+
+    def __disable_json_output(self, reason: str) -> None:
+        """ Helper method to fall back to the text output schema once the backend has rejected the JSON schema """
+        if not self._json_output:
+            return
+        AppConfiguration.logger.log(f"Backend rejected the JSON schema of the response: {reason}. " +
+                                    f"Falling back to the text output schema", level=logging.WARNING)
+        self._json_output = False
+        self._op_prompt = self.__get_output_prompt()
+
+    @staticmethod
+    def __is_reasoning_rejection(e: Exception) -> bool:
+        """ Helper method to check if the given error is the backend rejecting the reasoning effort """
+        # Note: E.g. Ollama replies with '"<model>" does not support thinking' for the models that can't reason
+        error = str(e).lower()
+        return ("think" in error) or ("reasoning" in error)
+
+    def __disable_reasoning_effort(self, reason: str) -> None:
+        """ Helper method to stop sending the reasoning effort once the backend has rejected it """
+        if self._reasoning_efforts is None:
+            return
+        AppConfiguration.logger.log(f"Backend rejected the reasoning effort: {reason}. " +
+                                    f"Leaving it to the backend from now on", level=logging.WARNING)
+        self._reasoning_efforts = None
+
+    def __show_partial_message(self, agent_id: str, text: Optional[str], force: bool = False) -> None:
+        """ Helper method to show the message the agent is still typing (None = remove it), at most every few ms """
+        now = time.monotonic()
+        last_time, last_text = self._partial_messages.get(agent_id, (0.0, None))
+        if text == last_text:
+            return
+        if (text is not None) and (not force) and (now - last_time < AppConfiguration.llm_partial_message_refresh_sec):
+            return
+
+        self._partial_messages[agent_id] = (now, text)
+        asyncio.gather(self._callbacks.invoke(StateManagerCallbackType.PARTIAL_MESSAGE, agent_id, text))
+
+    async def __ping(self, endpoint: LLMEndpoint, model: str) -> None:
+        """ Helper method to send a tiny request for the given model to the given endpoint """
+        bg_prompt = await self.__create_message(content=self._bg_prompt)
+        ping_prompt = await self.__create_message(content="Reply with OK", role=LLMRoles.user)
+        messages = [bg_prompt, ping_prompt]
+
+        # Generate as little as possible -- only the prompt processing and the model load matter here
+        backend_options = dict(self._backend_options)
+        backend_options["num_predict"] = 1
+        options = LLMGenerationOptions(keep_alive=self._keep_alive,
+                                       num_ctx=self.__get_context_size(messages, model),
+                                       backend_options=backend_options)
+        await endpoint.chat(model=model, messages=messages, options=options)
+
+    async def __probe_backend(self) -> bool:
+        """ Helper method to check if the backend can serve requests again (used by the circuit breaker) """
+        try:
+            # Note: The routes share the endpoints, so it's enough to check one of them
+            route = self._routes[LLMModelRouter.routine]
+            async with route.balancer.acquire() as endpoint:
+                await asyncio.wait_for(self.__ping(endpoint, route.model), timeout=self._config.request_timeout)
+            return True
+        except asyncio.TimeoutError:
+            AppConfiguration.logger.log(f"Backend did not answer the probe within {self._config.request_timeout}s", level=logging.WARNING)
+            return False
+        except (openai.APIError, httpx.HTTPError, InstructorError) as e:
+            e = LLMEndpointBalancer.get_root_cause(e)
+            AppConfiguration.logger.log(f"Backend is still failing: {e}", level=logging.WARNING)
+            return False
+
+    async def __circuit_state_changed(self, state: LLMCircuitState) -> None:
+        """ Helper method to let the user know when the backend goes down or comes back """
+        if state == LLMCircuitState.OPEN:
+            await self._callbacks.invoke(StateManagerCallbackType.UPDATE_LLM_STATUS, LLMBackendStatus.UNAVAILABLE)
+        elif state == LLMCircuitState.CLOSED:
+            await self._callbacks.invoke(StateManagerCallbackType.UPDATE_LLM_STATUS, LLMBackendStatus.RECOVERED)
+
+    def __get_context_size(self, messages: list[dict[str, str]], model: str, max_tokens: Optional[int] = None) -> int | None:
+        """
+        Helper method to return the context window size (num_ctx) to request for the given messages and model, leaving
+        room for a reply of the given number of tokens (if capped)
+        """
+        if self._num_ctx != "auto":
+            return self._num_ctx
+
+        # Size the window from the prompt, leaving enough room for the reply
+        num_predict = max_tokens or self._backend_options.get("num_predict", -1)
+        reserved_tokens = num_predict if (num_predict > 0) else AppConfiguration.llm_num_ctx_reserved_tokens
+        required_tokens = LLMTokenEstimator.estimate_messages(messages) + reserved_tokens
+
+        # Only ever grow the window (in powers of two) -- every change in num_ctx causes the model to be reloaded
+        curr_size = LLMAgentsManager._context_sizes.get(model, AppConfiguration.llm_num_ctx_min)
+        new_size = curr_size
+        while (new_size < required_tokens) and (new_size < AppConfiguration.llm_num_ctx_max):
+            new_size *= 2
+        new_size = min(new_size, AppConfiguration.llm_num_ctx_max)
+
+        if new_size != curr_size:
+            AppConfiguration.logger.log(f"Growing the context window of {model} from {curr_size} to {new_size} tokens " +
+                                        f"(estimated prompt + reply: {required_tokens} tokens)", level=logging.WARNING)
+        LLMAgentsManager._context_sizes[model] = new_size
+        return new_size
+
     def __get_background_prompt(self) -> str:
         return self._prompt.generate_background_prompt()
 
     def __get_output_prompt(self) -> str:
+        if self._json_output:
+            return self._prompt.generate_json_output_prompt()
         return self._prompt.generate_output_prompt()
 
     def __get_presence_of_human_prompt(self) -> str:
@@ -89,24 +679,25 @@ class LLMAgentsManager:
     async def __prepare_history(self, agent_id: str) -> list[dict[str, str]]:
         """ Helper method to prepare the message history of the agent required for context """
         agent = self._agents[agent_id]
-        chat_log = agent.get_chat_logs()  # Each item is of form (role, message/message_ID, is_message_id)
+        if agent_id not in self._histories:
+            self._histories[agent_id] = LLMAgentHistory()
 
-        # Each message must be of the following format
-        # {"role": "user",      "content": <message>} for messages by other agents
-        # {"role": "assistant", "content": <message>} for messages by this agent
-        messages = []
-        for (role, msg, is_id) in chat_log:
-            message = await self.__create_message(role=role, content=msg, is_message_id=is_id)
-            messages.append(message)
+        # The budget of the agent (if its generation profile has one), else the configured one
+        profile = agent.get_generation_profile()
+        budget_tokens = self._config.history_tokens
+        if (profile is not None) and (profile.history_tokens is not None):
+            budget_tokens = profile.history_tokens
 
-        return messages
+        # Note: Only what was appended to the chat log since the agent's last turn is formatted
+        version = await self._callbacks.invoke(StateManagerCallbackType.GET_MESSAGES_VERSION)
+        return await self._histories[agent_id].sync(agent, version, self.__get_formatted_message, budget_tokens,
+                                                    keep_evicted=(self._summarizer is not None))
 
-    async def __create_message(self, content: str, role: str = LLMRoles.system, is_message_id: bool = False) -> dict[str, str]:
-        """ Helper method to create the dict in the format required """
-        # If the contents is actually a message ID, need to fetch the message contents and then format it
-        if is_message_id:
-            msg: ChatMessage = await self._callbacks.invoke(StateManagerCallbackType.GET_MESSAGE_WITH_ID, content)
-            content = ChatMessageFormatter.format_to_string(msg)
+    async def __get_formatted_message(self, msg_id: str) -> str:
+        """ Helper method to fetch the latest contents (even if edited/deleted) of the message, formatted """
+        return await self._callbacks.invoke(StateManagerCallbackType.GET_FORMATTED_MESSAGE_WITH_ID, msg_id)
 
+    async def __create_message(self, content: str, role: str = LLMRoles.system) -> dict[str, str]:
+        """ Helper method to create the dict in the format required """
         message = dict(role=role, content=content)
         return message
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+import openai
+from instructor.core import InstructorError
+
+from allms.config import AppConfiguration
+from allms.core.agents import Agent
+from .completion import LLMCompletion, LLMTokenEstimator
+from .prompt import LLMPromptGenerator
+from .roles import LLMRoles
+
+
+@dataclass
+class LLMMemoryStats:
+    """ Class for tracking the updates of the memories of the agents """
+    updates: int = 0            # Memories updated
+    failures: int = 0           # Updates that failed (the backlog is kept for the next one)
+    deferrals: int = 0          # Times an update had to wait as the backend had no spare capacity
+    items_folded: int = 0       # Items evicted from the chat logs that were folded into the memories
+    prompt_tokens: int = 0      # Prompt tokens sent (estimated)
+    completion_tokens: int = 0  # Tokens generated (as reported by the backend)
+    latency_ms: float = 0.0     # Total time spent on the updates
+
+
+class LLMMemorySummarizer:
+    """
+    Class for keeping the memory of every agent up to date in the background -- the items evicted from its chat log
+    (the backlog) are folded into a short summary (who accused whom, the votes, the DMs and alliances), which the agent
+    gets as context instead of forgetting them altogether. The updates are off the critical path: they only run while
+    the backend has spare capacity (checked via the given callback), one at a time, the largest backlog first. Only the
+    memories of the agents still in the game (and played by the LLMs) are updated
+    """
+
+    def __init__(self,
+                 agents: dict[str, Agent],
+                 live_agent_ids: set[str],
+                 has_spare_capacity: Callable[[], bool],
+                 send_request: Callable[[str, list[dict[str, str]]], Awaitable[LLMCompletion]]):
+        self._agents = agents
+        self._live_agent_ids = live_agent_ids  # Note: Shared with the chat loop -- the terminated agents are removed from it
+        self._has_spare_capacity = has_spare_capacity
+        self._send_request = send_request  # Sends the request (for the given agent ID) and returns the completion
+        self._task: Optional[asyncio.Task] = None
+        self.stats = LLMMemoryStats()
+
+    def start(self) -> None:
+        """ Starts updating the memories in the background """
+        if self._task is None:
+            self._task = asyncio.create_task(self.__run())
+
+    def stop(self) -> None:
+        """ Stops updating the memories (the backlogs are kept, e.g. to be picked up after loading the save) """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def update(self, agent: Agent) -> bool:
+        """ Folds the backlog of the given agent into its memory. Returns True if the memory was updated """
+        position, items = agent.get_memory_backlog()
+        messages = [
+            dict(role=LLMRoles.system, content=LLMPromptGenerator.generate_memory_prompt(agent.id, AppConfiguration.llm_memory_max_words)),
+            dict(role=LLMRoles.user, content=LLMPromptGenerator.generate_memory_input_prompt(agent.memory, items)),
+        ]
+
+        start = time.monotonic()
+        try:
+            completion = await self._send_request(agent.id, messages)
+        except (asyncio.TimeoutError, openai.APIError, httpx.HTTPError, InstructorError) as e:
+            # Note: The backlog is kept and folded in by a later update
+            self.stats.failures += 1
+            AppConfiguration.logger.log(f"Could not update the memory of {agent.id}: {e}", level=logging.WARNING)
+            return False
+
+        self.stats.latency_ms += (time.monotonic() - start) * 1000
+        self.stats.prompt_tokens += LLMTokenEstimator.estimate_messages(messages)
+        self.stats.completion_tokens += completion.completion_tokens or 0
+        memory = (completion.content or "").strip()
+        if (not memory) or (completion.finish_reason == "length"):
+            self.stats.failures += 1
+            AppConfiguration.logger.log(f"Could not update the memory of {agent.id}: the reply was empty or cut off " +
+                                        f"(finish reason: {completion.finish_reason})", level=logging.WARNING)
+            return False
+
+        if not agent.update_memory(memory, position, n_folded=len(items)):
+            AppConfiguration.logger.log(f"Discarding the memory update of {agent.id} as it was reset in the meantime")
+            return False
+
+        self.stats.updates += 1
+        self.stats.items_folded += len(items)
+        AppConfiguration.logger.log(f"Folded {len(items)} forgotten items into the memory of {agent.id}: {memory}")
+        return True
+
+    def get_stats(self) -> dict[str, Any]:
+        """ Returns the statistics of the updates along with the size of the memories and the backlogs """
+        memory_words = {aid: len(agent.memory.split()) for (aid, agent) in self._agents.items() if agent.memory}
+        backlog = sum(len(agent.memory_backlog) for agent in self._agents.values())
+        mean_ms = (self.stats.latency_ms / self.stats.updates) if self.stats.updates else 0.0
+        return dict(updates=self.stats.updates, failures=self.stats.failures, deferrals=self.stats.deferrals,
+                    items_folded=self.stats.items_folded, backlog=backlog, prompt_tokens=self.stats.prompt_tokens,
+                    completion_tokens=self.stats.completion_tokens, latency_mean_ms=round(mean_ms, 1),
+                    memory_words=memory_words)
+
+    async def __run(self) -> None:
+        """ Helper method to update the memories with a backlog, whenever the backend has spare capacity """
+        while True:
+            await asyncio.sleep(AppConfiguration.llm_memory_poll_sec)
+            agent = self.__pick_agent()
+            if agent is None:
+                continue
+            if not self._has_spare_capacity():
+                self.stats.deferrals += 1  # Note: The agents' turns come first -- try again later
+                continue
+            await self.update(agent)
+
+    def __pick_agent(self) -> Optional[Agent]:
+        """ Helper method to return the agent with the largest backlog (None if no backlog is large enough) """
+        agents = [self._agents[agent_id] for agent_id in self._live_agent_ids
+                  if len(self._agents[agent_id].memory_backlog) >= AppConfiguration.llm_memory_min_backlog_items]
+        if not agents:
+            return None
+        return max(agents, key=lambda agent: len(agent.memory_backlog))
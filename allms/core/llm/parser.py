@@ -1,9 +1,41 @@
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Optional
+
 from .response import LLMResponseModel
 
 
+class LLMSchemaViolationError(ValueError):
+    """ Raised when a (partial) response of the LLM can't be salvaged (see LLMResponseSalvager) """
+
+    def __init__(self, message: str, content: str = ""):
+        super().__init__(message)
+        self.content = content  # What the model had generated until the violation was detected
+
+
 class LLMResponseParser:
     """ Parser class for parsing LLM responses """
 
+    # Note: Ensure this is consistent with the output schema
+    # Also it must match with the response model
+    # Format -- key_in_LLM_output: key_in_response_model
+    parser_map: dict[str, str] = {
+        "MESSAGE":            "message",
+        "INTENT":             "intent",
+        "SEND_TO":            "send_to",
+        "SUSPECT_ID":         "suspect",
+        "SUSPECT_CONFIDENCE": "suspect_confidence",
+        "REASON_FOR_SUSPECT": "suspect_reason",
+        "START_A_VOTE":       "start_a_vote",
+        "VOTING_FOR":         "voting_for"
+    }
+
+    # Line the model ends the response with (after all the keys). Sent as the stop sequence, so that the backend stops
+    # generating right after the output schema even when the response isn't streamed
+    # Note: Ensure this is consistent with the output schema in ./prompt.py
+    end_marker: str = "END_OF_REPLY"
+
     @classmethod
     def parse(cls, response: str) -> LLMResponseModel:
         # Note: I know this is not the best way to do things, but getting structured outputs CONSISTENTLY without
@@ -11,19 +43,7 @@ class LLMResponseParser:
         # parse it manually instead of enforcing structured JSON outputs from the LLM via a third party library like
         # instructor -- I had enough of debugging and trying to fix the errors raised from it.
         # This method might need changes if the response output schema is changed in ./prompt.py -- ensure it is up-to-date
-        parser_map = {
-            # Note: Ensure this is consistent with the output schema
-            # Also it must match with the response model
-            # Format -- key_in_LLM_output: key_in_response_model
-            "MESSAGE":            "message",
-            "INTENT":             "intent",
-            "SEND_TO":            "send_to",
-            "SUSPECT_ID":         "suspect",
-            "SUSPECT_CONFIDENCE": "suspect_confidence",
-            "REASON_FOR_SUSPECT": "suspect_reason",
-            "START_A_VOTE":       "start_a_vote",
-            "VOTING_FOR":         "voting_for"
-        }
+        parser_map = cls.parser_map
         response_dict = {}
         lines = response.splitlines()
         keys = set(parser_map.keys())
@@ -57,7 +77,33 @@ class LLMResponseParser:
         return LLMResponseModel(**response_dict)
 
     @staticmethod
-    def __add_to_result(key: str, contents: str, result: dict[str, str]) -> None:
+    def parse_json(response: str) -> LLMResponseModel:
+        """ Parses a response that was constrained to the JSON schema of the response model """
+        # Note: The backend enforces the schema, but some models still wrap the object in a code block or similar
+        start, end = response.find("{"), response.rfind("}")
+        if (start < 0) or (end < start):
+            raise ValueError(f"Expected a JSON object but got: {response}. DOES NOT MATCH THE OUTPUT SCHEMA")
+        return LLMResponseModel.model_validate_json(response[start:end + 1])
+
+    @classmethod
+    def get_trailing_content(cls, response: str) -> str:
+        """
+        Returns whatever the model generated after all the keys of the output schema (empty if nothing). The end marker
+        (if the backend didn't stop at it) is not counted
+        """
+        remaining_keys = set(cls.parser_map.keys())
+        end = 0
+        for line in response.splitlines(keepends=True):
+            end += len(line)
+            key, _, _ = LLMResponseSalvager.split_line(line)
+            remaining_keys.discard(key)
+            if not remaining_keys:
+                return response[end:].strip().removeprefix(cls.end_marker).strip()
+        return ""
+
+    @staticmethod
+    def parse_value(contents: str) -> Any:
+        """ Parses the contents of a line (the part after the key) into its value """
         parsed_contents = contents.strip()
         parsed_contents = parsed_contents.lstrip('"')
         parsed_contents = parsed_contents.rstrip('"')
@@ -73,5 +119,412 @@ class LLMResponseParser:
         elif pc.isnumeric():
             parsed_contents = int(pc)
 
+        return parsed_contents
+
+    @staticmethod
+    def __add_to_result(key: str, contents: str, result: dict[str, str]) -> None:
+        parsed_contents = LLMResponseParser.parse_value(contents)
         if key not in result:
             result[key] = parsed_contents
+
+
+class LLMResponseReader:
+    """
+    Class for reading a response line by line into the raw values of the keys of the output schema, the way the salvager
+    does -- anything before the first key, unknown and repeated keys are ignored and the lines following a multi-line
+    value are joined to it. Shared by LLMResponseSalvager and LLMStreamParser, so that a response is read the same way
+    whether it is streamed or not
+    """
+
+    def __init__(self):
+        self.raw_values: dict[str, str] = {}  # Mapping between the keys read so far and their (raw) values
+        self.repairs: list[str] = []          # Repairs made while reading
+        self._last_key: Optional[str] = None  # Key of the value the next line may be a continuation of
+
+    def read_line(self, line: str) -> Optional[str]:
+        """ Reads the next (complete) line. Returns the key of the output schema whose value it starts (None if none) """
+        line = line.strip()
+        if not line:
+            return None
+
+        key, value, is_repaired = LLMResponseSalvager.split_line(line)
+        if key is None:
+            # Continuation of the previous value. Anything before the first key is ignored (like the parser does)
+            if self._last_key in LLMResponseSalvager.multi_line_keys:
+                self.raw_values[self._last_key] += " " + line
+                self.repairs.append(f"{self._last_key}: joined the lines of a multi-line value")
+            return None
+
+        self._last_key = None
+        if key not in LLMResponseParser.parser_map:
+            self.repairs.append(f"{key}: ignored the unknown key")
+            return None
+        if key in self.raw_values:
+            self.repairs.append(f"{key}: ignored the repeated key")
+            return None
+
+        self.raw_values[key] = value
+        self._last_key = key
+        if is_repaired:
+            self.repairs.append(f"{key}: read the key from: {line.split(':')[0]}")
+        return key
+
+
+class LLMResponseSalvager:
+    """
+    Tolerant counterpart of LLMResponseParser. Deterministically repairs the common deviations from the output schema
+    (decorated or misnamed keys, multi-line values, "85%" as the confidence, quoted agent IDs etc.) and downgrades the
+    invalid optional fields to their defaults, instead of rejecting the whole response and paying for a regeneration.
+    Only rejects what can't be repaired without guessing what the model meant
+    """
+
+    # Other names the models tend to use for the keys of the output schema
+    key_aliases: dict[str, str] = {
+        "MSG":                  "MESSAGE",
+        "INTENTION":            "INTENT",
+        "SUSPECT":              "SUSPECT_ID",
+        "CONFIDENCE":           "SUSPECT_CONFIDENCE",
+        "SUSPICION_CONFIDENCE": "SUSPECT_CONFIDENCE",
+        "REASON":               "REASON_FOR_SUSPECT",
+        "SUSPECT_REASON":       "REASON_FOR_SUSPECT",
+        "START_VOTE":           "START_A_VOTE",
+        "VOTE_FOR":             "VOTING_FOR",
+    }
+
+    # Keys whose values may span multiple lines (the other values are single words)
+    multi_line_keys: set[str] = {"MESSAGE", "INTENT", "REASON_FOR_SUSPECT"}
+    id_keys: set[str] = {"SEND_TO", "SUSPECT_ID", "VOTING_FOR"}
+
+    # Values of the agent ID keys that mean "no one" and the confidence levels given in words
+    _no_one: set[str] = {"", "none", "null", "nil", "nobody", "no one", "noone", "n/a", "na", "-", "everyone", "all"}
+    _confidence_words: dict[str, int] = {"very low": 10, "low": 25, "medium": 50, "moderate": 50, "high": 75, "very high": 90}
+    _true_words: set[str] = {"true", "yes", "y", "1"}
+    _false_words: set[str] = {"false", "no", "n", "0", "none", "null", ""}
+
+    # A line of the form "KEY: value", allowing for markdown decorations (e.g. "**MESSAGE:** value" or "- Intent: value")
+    _re_line = re.compile(r"^[\s>#*_`-]*([A-Za-z][A-Za-z _]{0,30}?)[\s*_`]*:[*_`]*\s*(.*)$")
+    _re_schema_key = re.compile(r"^[A-Z][A-Z_]*$")  # Something that looks like a key of the output schema
+    _re_number = re.compile(r"(\d+(?:\.\d+)?)\s*(%|/\s*100|/\s*10)?")
+
+    @classmethod
+    def salvage(cls, response: str) -> tuple[LLMResponseModel, list[str]]:
+        """
+        Parses the response, repairing it along the way. Returns the parsed response and the repairs made (empty if the
+        response followed the output schema). Raises ValueError if the response can't be salvaged
+        """
+        reader = LLMResponseReader()
+        for line in response.splitlines():
+            reader.read_line(line)
+        raw_values, repairs = reader.raw_values, reader.repairs
+        cls.check_message(raw_values.get("MESSAGE", None))
+
+        result: dict[str, Any] = {}
+        for (key, field_name) in LLMResponseParser.parser_map.items():
+            if key not in raw_values:
+                continue
+            value, repair = cls.salvage_value(key, raw_values[key])
+            result[field_name] = value
+            if repair:
+                repairs.append(f"{key}: {repair}")
+
+        if result.get("intent", None) is None:
+            result["intent"] = ""
+            repairs.append(f"INTENT: missing, left empty")
+
+        # A vote needs someone to vote for -- the suspect is the obvious candidate. Otherwise, don't start it at all
+        if result.get("start_a_vote", False) and (result.get("voting_for", None) is None):
+            if result.get("suspect", None) is not None:
+                result["voting_for"] = result["suspect"]
+                repairs.append(f"VOTING_FOR: missing while starting a vote, voting for the suspect")
+            else:
+                result["start_a_vote"] = False
+                repairs.append(f"START_A_VOTE: no one to vote for, not starting the vote")
+
+        return LLMResponseModel(**result), list(dict.fromkeys(repairs))
+
+    @staticmethod
+    def check_message(raw_message: Optional[str]) -> None:
+        """ Raises ValueError if the (raw) message is missing or empty -- there is nothing to salvage without it """
+        if not (raw_message or "").strip('" '):
+            raise ValueError(f"MESSAGE is missing or empty. DOES NOT MATCH THE OUTPUT SCHEMA")
+
+    @classmethod
+    def split_line(cls, line: str) -> tuple[Optional[str], str, bool]:
+        """
+        Splits the line into (key, value, key was repaired). The key is the one of the output schema it refers to (or
+        the unknown key as is, if it looks like one). It is None if the line isn't of the form "KEY: value"
+        """
+        match = cls._re_line.match(line.strip())
+        if match is None:
+            return None, line, False
+
+        raw_key, value = match.group(1).strip(), match.group(2).strip()
+        key = raw_key.upper().replace(" ", "_")
+        key = cls.key_aliases.get(key, key)
+        if key in LLMResponseParser.parser_map:
+            return key, value, (raw_key != key) or (not line.strip().startswith(raw_key))
+        if cls._re_schema_key.match(raw_key):
+            return raw_key, value, False  # An unknown key
+        return None, line, False  # Just some text with a colon in it
+
+    @classmethod
+    def salvage_value(cls, key: str, contents: str) -> tuple[Any, Optional[str]]:
+        """
+        Returns the value of the given key from its contents and the repair made (None if it was fine). Raises
+        ValueError if the value can't be salvaged
+        """
+        contents = contents.strip()
+        value = LLMResponseParser.parse_value(contents)
+
+        if key in cls.multi_line_keys:
+            # Note: Taken as is, even if it looks like a number or a boolean
+            text = contents.strip('"').strip()
+            return (None if ((key != "MESSAGE") and (value is None)) else text), None
+
+        if key == "SUSPECT_CONFIDENCE":
+            if (isinstance(value, int) and (not isinstance(value, bool)) and (0 <= value <= 100)) or (value is None):
+                return value, None
+            confidence = cls.__salvage_confidence(contents)
+            repair = f"read {contents!r} as {confidence}" if (confidence is not None) else f"ignored {contents!r}"
+            return confidence, repair
+
+        if key == "START_A_VOTE":
+            if isinstance(value, bool):
+                return value, None
+            word = contents.strip("\"'`*.!").lower()
+            if word in cls._true_words:
+                return True, f"read {contents!r} as True"
+            return False, (None if (word in cls._false_words) else f"read {contents!r} as False")
+
+        # Agent IDs
+        assert key in cls.id_keys, f"Key ({key}) of the output schema is not handled by the salvager"
+        if contents.strip("\"'`*.!").lower() in cls._no_one:
+            return None, (None if (value is None) else f"read {contents!r} as None")
+
+        agent_id = LLMResponseModel.normalize_agent_id(contents)
+        if agent_id is None:
+            # Note: Sending a DM to everyone instead would leak it -- better to regenerate the response
+            if key == "SEND_TO":
+                raise ValueError(f"Agent ID ({contents}) not in the allowed set: {LLMResponseModel.allowed_ids}. " +
+                                 f"DOES NOT MATCH THE OUTPUT SCHEMA")
+            return None, f"ignored the unknown agent ID {contents!r}"
+        return agent_id, (None if (agent_id == value) else f"read {contents!r} as {agent_id}")
+
+    @classmethod
+    def __salvage_confidence(cls, contents: str) -> Optional[int]:
+        """ Helper method to read the confidence from contents like "85%", "0.85", "8/10" or "high". None if it can't """
+        words = contents.strip("\"'`*.!").lower()
+        if words in cls._confidence_words:
+            return cls._confidence_words[words]
+
+        match = cls._re_number.search(contents)
+        if match is None:
+            return None
+        number, unit = float(match.group(1)), (match.group(2) or "").replace(" ", "")
+        if unit == "/10":
+            number *= 10
+        elif (not unit) and ("." in match.group(1)) and (number <= 1):
+            number *= 100  # A fraction
+        return max(0, min(100, round(number)))
+
+
+class LLMStreamParser:
+    """
+    Parser class for checking a streamed LLM response as it arrives, so that the generation can be aborted as soon as
+    the response can't be salvaged anymore -- instead of finding it out after the whole response has been generated.
+    Also tells when all the keys of the schema have been received, so that the generation can be stopped instead of
+    letting the model ramble on. Only screens the response: the complete response is still parsed by the salvager
+    """
+
+    first_key: str = "MESSAGE"
+
+    def __init__(self):
+        self._content: str = ""  # Everything received so far
+        self._line: str = ""     # The line currently being received
+        self._reader = LLMResponseReader()  # Note: Reads the complete lines exactly like the salvager does
+
+    @property
+    def content(self) -> str:
+        """ Returns everything received so far """
+        return self._content
+
+    @property
+    def schema_complete(self) -> bool:
+        """ Returns True if the lines of all the keys of the output schema have been received """
+        return len(self._reader.raw_values) == len(LLMResponseParser.parser_map)
+
+    @property
+    def message(self) -> Optional[str]:
+        """ Returns the message (MESSAGE: line) received so far. None if it hasn't started yet """
+        if self.first_key in self._reader.raw_values:
+            return self._reader.raw_values[self.first_key].strip().strip('"')
+        key, value, _ = LLMResponseSalvager.split_line(self._line)
+        if key != self.first_key:
+            return None
+        return value.strip().strip('"')
+
+    @property
+    def message_complete(self) -> bool:
+        """ Returns True if the whole message has been received """
+        return self.first_key in self._reader.raw_values
+
+    def feed(self, delta: str) -> bool:
+        """
+        Feeds the next chunk of the response. Returns True once the output schema is complete (the rest of the response
+        is not needed). Raises LLMSchemaViolationError if the response can't be salvaged anymore
+        """
+        self._content += delta
+        if self.schema_complete:
+            return True  # Whatever comes after the schema is ignored anyway
+
+        *complete_lines, self._line = (self._line + delta).split("\n")
+        for line in complete_lines:
+            self.__read_line(line)
+            if self.schema_complete:
+                return True
+        return False
+
+    def finish(self) -> None:
+        """
+        Reads the last line of the response once it has been received completely. Raises LLMSchemaViolationError if
+        the response can't be salvaged (i.e. exactly when LLMResponseSalvager.salvage would reject it)
+        """
+        self.__read_line(self._line)
+        self._line = ""
+        try:
+            LLMResponseSalvager.check_message(self._reader.raw_values.get(self.first_key, None))
+        except ValueError as e:
+            self.__violation(str(e))
+
+    def __read_line(self, line: str) -> None:
+        """ Helper method to read a complete line of the response, checking the value of the key it starts (if any) """
+        # Note: Only aborts on what the salvager rejects as well -- aborting anything it can repair (text before the
+        # first key, misnamed or unknown keys etc.) would only cause needless regenerations
+        key = self._reader.read_line(line)
+        if key is None:
+            return
+        try:
+            LLMResponseSalvager.salvage_value(key, self._reader.raw_values[key])
+        except ValueError as e:
+            self.__violation(f"Invalid value for {key}: {e}")
+
+    def __violation(self, reason: str) -> None:
+        """ Helper method to raise the violation along with what was received so far """
+        raise LLMSchemaViolationError(f"{reason}. DOES NOT MATCH THE OUTPUT SCHEMA", content=self._content)
+
+
+class LLMJsonStreamParser:
+    """
+    Counterpart of LLMStreamParser for the responses constrained to the JSON schema. The backend already guarantees
+    the structure, so there is nothing to screen -- it only extracts the message received so far to show it while typing
+    """
+
+    # The message is the first field of the schema (the backends generate the fields in order)
+    _re_message = re.compile(r'^\s*\{\s*"message"\s*:\s*"((?:[^"\\]|\\.)*)(")?')
+
+    def __init__(self):
+        self._content: str = ""  # Everything received so far
+
+    @property
+    def content(self) -> str:
+        """ Returns everything received so far """
+        return self._content
+
+    @property
+    def message(self) -> Optional[str]:
+        """ Returns the message received so far. None if it hasn't started yet """
+        match = self._re_message.match(self._content)
+        if match is None:
+            return None
+
+        # Drop an escape sequence cut in half by the chunking before decoding the rest
+        escaped = re.sub(r"\\(u[0-9a-fA-F]{0,3})?$", "", match.group(1))
+        try:
+            return json.loads(f'"{escaped}"')
+        except json.JSONDecodeError:
+            return escaped
+
+    @property
+    def message_complete(self) -> bool:
+        """ Returns True if the whole message has been received """
+        match = self._re_message.match(self._content)
+        return (match is not None) and (match.group(2) is not None)
+
+    def feed(self, delta: str) -> bool:
+        """ Feeds the next chunk of the response. Never asks to stop -- the backend ends the generation with the object """
+        self._content += delta
+        return False
+
+
+@dataclass
+class LLMParsingStats:
+    """ Class for tracking the malformed responses, the trailing output and how many tokens were spent on them """
+    responses: int = 0         # Responses received (complete or aborted)
+    malformed: int = 0         # Responses that did not follow the output schema (each one causes a retry)
+    salvaged: int = 0          # Responses that did not follow the output schema but could be repaired (no retry)
+    aborted: int = 0           # Malformed responses whose generation was aborted midway (streaming only)
+    wasted_tokens: int = 0     # Tokens generated for the malformed responses
+    stopped: int = 0           # Responses whose generation was stopped once the output schema was complete (streaming only)
+    trailing_tokens: int = 0   # Tokens generated after the output schema was complete
+    repairs: int = 0           # Malformed responses whose format the model was asked to fix (instead of regenerating them)
+    repaired: int = 0          # ... out of which were fixed
+    repair_prompt_tokens: int = 0        # Prompt tokens sent for the repairs
+    regeneration_prompt_tokens: int = 0  # Prompt tokens sent for regenerating the responses (the retries)
+    regenerations: int = 0               # Number of regenerations
+    turns: int = 0             # Turns in which a response was requested (each one takes one or more attempts)
+    failed_turns: int = 0      # Turns in which no valid response could be generated within the maximum tries
+    attempts: int = 0          # Attempts made over all the turns
+
+    def record(self, is_malformed: bool, tokens: Optional[int] = None, aborted: bool = False, salvaged: bool = False) -> None:
+        """ Records a response (tokens = number of tokens generated for it) """
+        self.responses += 1
+        if not is_malformed:
+            self.salvaged += int(salvaged)
+            return
+        self.malformed += 1
+        self.aborted += int(aborted)
+        self.wasted_tokens += tokens or 0
+
+    def record_trailing(self, tokens: int, stopped: bool) -> None:
+        """ Records the tokens generated after the output schema (and whether the generation was stopped there) """
+        self.stopped += int(stopped)
+        self.trailing_tokens += tokens
+
+    def record_repair(self, prompt_tokens: int, success: bool) -> None:
+        """ Records a request asking the model to fix the format of a malformed response """
+        self.repairs += 1
+        self.repaired += int(success)
+        self.repair_prompt_tokens += prompt_tokens
+
+    def record_regeneration(self, prompt_tokens: int) -> None:
+        """ Records a request regenerating a response from the whole conversation (a retry) """
+        self.regenerations += 1
+        self.regeneration_prompt_tokens += prompt_tokens
+
+    def record_turn(self, tries: int, success: bool) -> None:
+        """ Records a turn that took the given number of tries (and whether it ended up with a valid response) """
+        self.turns += 1
+        self.failed_turns += int(not success)
+        self.attempts += tries
+
+    def as_dict(self) -> dict[str, Any]:
+        """
+        Returns the stats along with the tokens wasted per retry, the trailing tokens per response, the prompt tokens
+        per repair and per regeneration, the retries per turn and the fraction of turns that ended up with a valid response
+        """
+        wasted_per_retry = (self.wasted_tokens / self.malformed) if self.malformed else 0.0
+        trailing_per_response = (self.trailing_tokens / self.responses) if self.responses else 0.0
+        retries_per_turn = ((self.attempts - self.turns) / self.turns) if self.turns else 0.0
+        success_rate = ((self.turns - self.failed_turns) / self.turns) if self.turns else 0.0
+        prompt_tokens_per_repair = (self.repair_prompt_tokens / self.repairs) if self.repairs else 0.0
+        prompt_tokens_per_regeneration = (self.regeneration_prompt_tokens / self.regenerations) if self.regenerations else 0.0
+        return dict(responses=self.responses, malformed=self.malformed, salvaged=self.salvaged, aborted=self.aborted,
+                    wasted_tokens=self.wasted_tokens, wasted_tokens_per_retry=round(wasted_per_retry, 1),
+                    stopped=self.stopped, trailing_tokens=self.trailing_tokens,
+                    trailing_tokens_per_response=round(trailing_per_response, 1),
+                    repairs=self.repairs, repaired=self.repaired,
+                    prompt_tokens_per_repair=round(prompt_tokens_per_repair, 1),
+                    regenerations=self.regenerations,
+                    prompt_tokens_per_regeneration=round(prompt_tokens_per_regeneration, 1),
+                    turns=self.turns, failed_turns=self.failed_turns,
+                    retries_per_turn=round(retries_per_turn, 2), success_rate=round(success_rate, 3))
@@ -1,3 +1,5 @@
+from typing import Iterable
+
 from allms.core.agents import Agent
 
 
@@ -50,6 +52,7 @@ class LLMPromptGenerator:
         REASON_FOR_SUSPECT: <str>          # Reason for suspicion, empty if none
         START_A_VOTE: <True/False>         # Whether you are starting a vote
         VOTING_FOR: <None or agent ID>     # Who you vote for, or None
+        END_OF_REPLY                       # Always the last line, nothing after it
 
         VALUE RULES:
         - MESSAGE: always a string, concise, aligned with your persona. Should only contain what YOU WANT TO SAY to the chat and nothing else. DO NOT INCLUDE YOUR NAME.
@@ -60,14 +63,99 @@ class LLMPromptGenerator:
         - REASON_FOR_SUSPECT: brief explanation, empty if none.
         - START_A_VOTE: True only if extremely suspicious or want someone kicked out; otherwise False.
         - VOTING_FOR: None if voting has not started, else the agent ID you vote for.
+        - END_OF_REPLY: written as is, on its own line, after all the keys above.
+        """
+        return prompt
+
+    @staticmethod
+    def generate_json_output_prompt() -> str:
+        """ Method to generate the output instructions prompt when the output is constrained to the JSON schema """
+        # Note: The backend enforces the structure itself -- only the meaning of the fields needs to be explained
+        prompt = """
+        OUTPUT FORMAT RULES:
+
+        ALWAYS respond with a single JSON object with the following fields. No other text:
+
+        message: <str>                     # Your chat message, concise, aligned with persona, must advance MAIN GOAL
+        intent: <str>                      # Your motive behind the message
+        send_to: <null or agent ID>        # null = everyone; agent ID = private-message (DM)
+        suspect: <null or agent ID>        # Who you suspect, or null
+        suspect_confidence: <0-100>        # Integer suspicion level
+        suspect_reason: <str>              # Reason for suspicion, empty if none
+        start_a_vote: <true/false>         # Whether you are starting a vote
+        voting_for: <null or agent ID>     # Who you vote for, or null
+
+        VALUE RULES:
+        - message: Should only contain what YOU WANT TO SAY to the chat and nothing else. DO NOT INCLUDE YOUR NAME.
+        - intent: Should only contain what your MAIN INTENT behind the message was and nothing else
+        - start_a_vote: true only if extremely suspicious or want someone kicked out; otherwise false.
+        - voting_for: null if voting has not started, else the agent ID you vote for. MUST be set if start_a_vote is true.
         """
         return prompt
 
+    @staticmethod
+    def generate_repair_prompt(allowed_ids: Iterable[str], json_output: bool = False) -> str:
+        """ Method to generate the prompt asking to fix the format of a reply that didn't follow the output format """
+        # Note: Sent on its own (no background, history or the full output rules) -- only the format needs fixing, so
+        # a compact version of the output schema is enough
+        allowed = ", ".join(sorted(allowed_ids))
+        if json_output:
+            output_format = ("A single JSON object with the fields: message (str), intent (str), send_to (null or agent ID), "
+                             "suspect (null or agent ID), suspect_confidence (0-100), suspect_reason (str), "
+                             "start_a_vote (true/false), voting_for (null or agent ID)")
+        else:
+            output_format = ("MESSAGE: <str>\nINTENT: <str>\nSEND_TO: <None or agent ID>\nSUSPECT_ID: <None or agent ID>\n"
+                             "SUSPECT_CONFIDENCE: <0-100>\nREASON_FOR_SUSPECT: <str>\nSTART_A_VOTE: <True/False>\n"
+                             "VOTING_FOR: <None or agent ID>\nEND_OF_REPLY")
+        prompt = (
+            "You fix the format of chat replies. You are given a reply that does not follow the output format below "
+            "and what is wrong with it. Rewrite the SAME reply in the exact output format. Keep its meaning and wording, "
+            "do not add anything new and do not output anything else.\n\n"
+            f"OUTPUT FORMAT:\n{output_format}\n\n"
+            f"Valid agent IDs: {allowed}. A vote needs an agent ID to vote for."
+        )
+        return prompt
+
+    @staticmethod
+    def generate_memory_prompt(agent_id: str, max_words: int) -> str:
+        """ Method to generate the prompt asking to fold the items evicted from the chat log of the agent into its memory """
+        # Note: Sent on its own (no background or history) -- only the memory and the evicted items matter here
+        prompt = (
+            f"You keep the memory of {agent_id} in a group chat where AI agents try to find the hidden human among them. "
+            "You are given the current memory and the chat messages and notifications that are about to be forgotten. "
+            "Rewrite the memory so that it also covers what matters in them: who accused or suspected whom and why, "
+            "the votes (who started them, who voted for whom, who was terminated), the DMs and alliances, and anything "
+            "that hints at who the human is. Leave out the small talk. Refer to the agents by their IDs.\n\n"
+            f"Output ONLY the updated memory as terse plain-text notes, at most {max_words} words."
+        )
+        return prompt
+
+    @staticmethod
+    def generate_memory_input_prompt(memory: str | None, items: Iterable[str]) -> str:
+        """ Method to generate the input of the memory prompt -- the current memory and the items to fold into it """
+        events = "\n".join(items)
+        return f"CURRENT MEMORY:\n{memory or '(empty)'}\n\nTO BE FORGOTTEN (oldest first):\n{events}"
+
+    @staticmethod
+    def generate_remembered_prompt(memory: str) -> str:
+        """ Method to generate the prompt with what the agent remembers of the messages no longer in its history """
+        return f"WHAT YOU REMEMBER FROM EARLIER IN THE CHAT (older than the messages shown): {memory}"
+
     def generate_input_prompt(self, agent_id: str, vote_has_started: bool = False, started_by: str = None, voted_for: str = None) -> str:
         """ Method to generate the input prompt fed on every iteration """
+        return self.generate_persona_prompt(agent_id) + self.generate_vote_prompt(vote_has_started, started_by, voted_for)
+
+    def generate_turn_prompt(self, agent_id: str, vote_has_started: bool = False, started_by: str = None, voted_for: str = None) -> str:
+        """ Method to generate the prompt fed on every iteration after the history, when the persona is fed before it """
+        prompt = (
+            f"It is your turn, {agent_id}. Reply to the conversation above. FOLLOW THE EXACT OUTPUT SCHEMA. "
+            + self.generate_vote_prompt(vote_has_started, started_by, voted_for)
+        )
+        return prompt
+
+    def generate_persona_prompt(self, agent_id: str) -> str:
+        """ Method to generate the persona prompt of the agent -- the part of the input prompt that never changes """
         assert agent_id in self._agents_map, f"Agent ID ({agent_id}) does not exist: {list(self._agents_map.keys())}"
-        if vote_has_started:
-            assert (started_by is not None), f"Vote has started but did the agent ID who started it is None"
 
         persona = self._agents_map[agent_id].get_persona()
         prompt = (
@@ -80,15 +168,20 @@ class LLMPromptGenerator:
             f"[<agent> -> {agent_id}] <their message> -- for private messages\n"
             "If the human modifies your messages or sends messages or votes via you, you will be notified"
         )
+        return prompt
 
+    @staticmethod
+    def generate_vote_prompt(vote_has_started: bool = False, started_by: str = None, voted_for: str = None) -> str:
+        """ Method to generate the prompt about the vote (if any) -- the part of the input prompt that changes """
         if vote_has_started:
+            assert (started_by is not None), f"Vote has started but did the agent ID who started it is None"
             vote_prefix = f"A VOTE IS IN PROGRESS. Started by {started_by}"
             if not voted_for:
-                prompt += f"{vote_prefix}. Vote for the agent you find most suspicious or hate the most."
+                prompt = f"{vote_prefix}. Vote for the agent you find most suspicious or hate the most."
             else:
-                prompt += f"{vote_prefix}. You have already voted for {voted_for}"
+                prompt = f"{vote_prefix}. You have already voted for {voted_for}"
         else:
-            prompt += (
+            prompt = (
                 "You may start a vote ONLY IF you strongly suspect or dislike someone. "
                 "Starting votes too often makes others suspicious of you."
             )
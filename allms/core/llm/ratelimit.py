@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Mapping, Optional
+
+from allms.config import AppConfiguration
+from .completion import LLMCompletion
+
+
+@dataclass
+class LLMTokenBucket:
+    """ Class for a bucket holding up to a minute's worth of a rate limit, refilled continuously """
+    capacity: float  # Limit per minute
+    level: float     # What can be used right now (negative if more was used than was available)
+    _updated: float = field(default_factory=time.monotonic)
+
+    def get_level(self) -> float:
+        """ Returns what can be used right now """
+        self.__refill()
+        return self.level
+
+    def get_wait_sec(self, amount: float) -> float:
+        """ Returns how long to wait until the given amount can be taken out of the bucket """
+        self.__refill()
+        # Note: A request larger than the whole bucket goes through once the bucket is full -- or it never would
+        needed = min(amount, self.capacity)
+        return max(0.0, (needed - self.level) / (self.capacity / 60))
+
+    def take(self, amount: float) -> None:
+        """ Takes the given amount out of the bucket (without waiting) """
+        self.__refill()
+        self.level -= amount
+
+    def give_back(self, amount: float) -> None:
+        """ Puts the given amount back into the bucket (e.g. when less was used than was taken) """
+        self.__refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def sync(self, limit: Optional[float], remaining: Optional[float]) -> None:
+        """ Syncs the bucket with the limit and what is remaining of it, as reported by the backend """
+        self.__refill()
+        if limit is not None:
+            self.level = min(self.level, limit)
+            self.capacity = limit
+        if remaining is not None:
+            # Note: Only ever lowered -- the backend doesn't know of the requests still in flight
+            self.level = min(self.level, remaining)
+
+    def __refill(self) -> None:
+        """ Helper method to refill the bucket for the time passed since it was last updated """
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.capacity / 60)
+        self._updated = now
+
+
+@dataclass
+class LLMRateLimitStats:
+    """ Class for tracking the requests held back by the rate limits """
+    requests: int = 0         # Requests let through
+    waited: int = 0           # Requests that had to wait for the rate limits
+    wait_ms: float = 0.0      # Total time the requests waited for the rate limits
+    rate_limited: int = 0     # Requests rejected by the backend because of its rate limits (429)
+
+
+class LLMRateLimiter:
+    """
+    Class for holding the requests back until they fit in the rate limits (requests and tokens per minute) of the
+    backend, so that the agents queue up instead of getting rejected (429) and burning their retries. The limits are
+    the configured ones, lowered to the ones the backend reports via the rate-limit headers (x-ratelimit-*) of its
+    replies, if any. The agents take turns (round-robin) -- an agent with several requests waiting (e.g. retries) can't
+    hold the others back. A rejected request pauses every request until the backend says the limit has reset
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        self._configured_limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self._buckets: dict[str, LLMTokenBucket] = {
+            kind: LLMTokenBucket(capacity=limit, level=limit) for (kind, limit) in self._configured_limits.items() if limit
+        }
+        self._paused_until: float = 0.0  # Time (monotonic) until which no request may be sent
+
+        self._queues: dict[str, deque[object]] = {}  # Mapping between agent ID and its requests waiting, in order
+        self._turns: deque[str] = deque()            # Agents with requests waiting, the one to be let through next first
+        self._changed = asyncio.Condition()
+        self.stats = LLMRateLimitStats()
+
+    async def wait_for_turn(self, agent_id: str, tokens: int) -> None:
+        """ Waits until the given agent can send a request of (an estimated) the given number of tokens and charges it """
+        if (not self._buckets) and (self._paused_until <= time.monotonic()) and (not self._turns):
+            self.stats.requests += 1
+            return  # No limits known (yet)
+
+        start = time.monotonic()
+        ticket = object()
+        async with self._changed:
+            queue = self._queues.setdefault(agent_id, deque())
+            queue.append(ticket)
+            if agent_id not in self._turns:
+                self._turns.append(agent_id)
+
+            try:
+                while True:
+                    wait_sec = None  # Not its turn yet -- wait until the requests ahead have gone through
+                    if (self._turns[0] == agent_id) and (queue[0] is ticket):
+                        wait_sec = self.__get_wait_sec(tokens)
+                        if wait_sec <= 0:
+                            break
+                    try:
+                        await asyncio.wait_for(self._changed.wait(), timeout=wait_sec)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                # Let through (or cancelled) -- the other requests of the agent (if any) go to the back of the line
+                queue.remove(ticket)
+                self._turns.remove(agent_id)
+                if queue:
+                    self._turns.append(agent_id)
+                else:
+                    del self._queues[agent_id]
+                self._changed.notify_all()
+
+            self.charge(tokens)
+
+        wait_ms = (time.monotonic() - start) * 1000
+        self.stats.requests += 1
+        if wait_ms >= 1:
+            self.stats.waited += 1
+            self.stats.wait_ms += wait_ms
+
+    def charge(self, tokens: int) -> None:
+        """ Charges a request of (an estimated) the given number of tokens without waiting (e.g. for a hedged request) """
+        if "requests" in self._buckets:
+            self._buckets["requests"].take(1)
+        if "tokens" in self._buckets:
+            self._buckets["tokens"].take(tokens)
+
+    async def record(self, completion: LLMCompletion, charged_tokens: int) -> None:
+        """ Records the reply to a request charged the given number of tokens, syncing the limits with its headers """
+        if ("tokens" in self._buckets) and (completion.prompt_tokens is not None) and (completion.completion_tokens is not None):
+            # The reply is usually shorter than the cap it was charged for -- the rest can be used by the others
+            self._buckets["tokens"].give_back(charged_tokens - completion.prompt_tokens - completion.completion_tokens)
+        await self.__sync(completion.rate_limits or {})
+
+    async def record_rate_limited(self, headers: Mapping[str, str]) -> None:
+        """ Records a request rejected by the backend because of its rate limits, pausing every request for a while """
+        self.stats.rate_limited += 1
+        headers = {key.lower(): value for (key, value) in headers.items()}
+        pause_sec = self.__get_retry_after_sec(headers)
+        AppConfiguration.logger.log(f"Backend is rate limiting the requests. Pausing them for {pause_sec:.1f}s", level=logging.WARNING)
+        self._paused_until = max(self._paused_until, time.monotonic() + pause_sec)
+        await self.__sync(headers)
+
+    def has_waiting(self) -> bool:
+        """ Returns True if any request is being held back by the rate limits right now """
+        return bool(self._turns) or (self._paused_until > time.monotonic())
+
+    def get_stats(self) -> dict[str, Any]:
+        """ Returns the current limits (and how much of them is left) along with the statistics of the waits """
+        limits = {f"{kind}_per_minute": int(bucket.capacity) for (kind, bucket) in self._buckets.items()}
+        available = {f"{kind}_available": int(max(0.0, bucket.get_level())) for (kind, bucket) in self._buckets.items()}
+        return dict(**limits, **available, waiting=sum(len(queue) for queue in self._queues.values()),
+                    requests=self.stats.requests, waited=self.stats.waited, wait_ms=round(self.stats.wait_ms, 1),
+                    rate_limited=self.stats.rate_limited)
+
+    def __get_wait_sec(self, tokens: int) -> float:
+        """ Helper method to return how long to wait until a request of the given number of tokens fits in the limits """
+        wait_sec = self._paused_until - time.monotonic()
+        if "requests" in self._buckets:
+            wait_sec = max(wait_sec, self._buckets["requests"].get_wait_sec(1))
+        if "tokens" in self._buckets:
+            wait_sec = max(wait_sec, self._buckets["tokens"].get_wait_sec(tokens))
+        return wait_sec
+
+    async def __sync(self, headers: Mapping[str, str]) -> None:
+        """ Helper method to sync the limits with the ones reported by the backend via the given headers (if any) """
+        for kind in ["requests", "tokens"]:
+            limit = self.__get_number(headers, f"x-ratelimit-limit-{kind}")
+            remaining = self.__get_number(headers, f"x-ratelimit-remaining-{kind}")
+            if (limit is None) and (remaining is None):
+                continue
+
+            # Note: The configured limit is kept if it is lower (e.g. when the API key is shared with other apps)
+            configured = self._configured_limits[kind]
+            if (limit is not None) and configured:
+                limit = min(limit, configured)
+            if kind not in self._buckets:
+                if not limit:
+                    continue
+                AppConfiguration.logger.log(f"Backend reported a rate limit of {limit:g} {kind} per minute")
+                self._buckets[kind] = LLMTokenBucket(capacity=limit, level=limit)
+            self._buckets[kind].sync(limit, remaining)
+
+            # The limit might be over a longer window than a minute -- nothing can be sent until it resets
+            if remaining is not None and remaining <= 0:
+                reset_sec = self.__get_duration_sec(headers.get(f"x-ratelimit-reset-{kind}", None))
+                if reset_sec is not None:
+                    self._paused_until = max(self._paused_until, time.monotonic() + reset_sec)
+
+        async with self._changed:
+            self._changed.notify_all()
+
+    def __get_retry_after_sec(self, headers: Mapping[str, str]) -> float:
+        """ Helper method to return how long to wait before retrying a request rejected because of the rate limits """
+        retry_after_ms = self.__get_number(headers, "retry-after-ms")
+        if retry_after_ms is not None:
+            return retry_after_ms / 1000
+        retry_after_sec = self.__get_number(headers, "retry-after")  # Note: Could also be a date -- ignored if so
+        if retry_after_sec is not None:
+            return retry_after_sec
+
+        # Otherwise wait until the limits that ran out reset
+        resets = [self.__get_duration_sec(headers.get(f"x-ratelimit-reset-{kind}", None)) for kind in ["requests", "tokens"]
+                  if self.__get_number(headers, f"x-ratelimit-remaining-{kind}") == 0]
+        resets = [reset_sec for reset_sec in resets if reset_sec is not None]
+        return max(resets) if resets else AppConfiguration.llm_rate_limit_default_pause_sec
+
+    @staticmethod
+    def __get_number(headers: Mapping[str, str], key: str) -> Optional[float]:
+        """ Helper method to return the value of the given header as a number (None if missing or not a number) """
+        try:
+            return float(headers[key])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def __get_duration_sec(duration: Optional[str]) -> Optional[float]:
+        """ Helper method to parse a duration like 1s, 6m0s or 20ms (as sent by OpenAI) into seconds (None if it can't) """
+        if duration is None:
+            return None
+        try:
+            return float(duration)  # Plain seconds
+        except ValueError:
+            pass
+
+        units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+        parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", duration)
+        if not parts:
+            return None
+        return sum(float(value) * units[unit] for (value, unit) in parts)
@@ -0,0 +1,84 @@
+import logging
+from typing import Any, Optional, Type
+
+import httpx
+
+from allms.config import AppConfiguration
+from .client import LLMBaseClient
+from .ratelimit import LLMRateLimiter
+
+
+class LLMClientRegistry:
+    """ Process-wide registry of the LLM clients, shared across all the agents and chatrooms """
+
+    # A single connection pool is shared by every client created via the registry. Without this, each new chatroom
+    # would create a fresh client with default (small) pool limits that is never closed, and all the agents would
+    # end up fighting over it on every turn
+    _max_connections: int = 16
+    _request_timeout: float = 300.0
+    _http_client: Optional[httpx.AsyncClient] = None
+
+    # Mapping between (client class name, base URL) and the client created for it
+    _clients: dict[tuple[str, str], Any] = {}
+
+    # Mapping between (model, base URLs) and the rate limiter of the requests sent to the model via those URLs
+    # Note: Shared across the chatrooms, as the rate limits of the backend are (e.g. per API key and model)
+    _rate_limiters: dict[tuple[str, ...], LLMRateLimiter] = {}
+
+    @classmethod
+    def configure(cls, max_connections: int, request_timeout: float) -> None:
+        """ Configures the connection pool. Must be invoked before any client is requested """
+        assert max_connections > 0, f"Expected max. connections to be > 0 but got {max_connections} instead"
+        assert request_timeout > 0, f"Expected request timeout to be > 0 but got {request_timeout} instead"
+        if cls._http_client is not None:
+            AppConfiguration.logger.log(f"Re-configuring the connection pool after it has been created. " +
+                                        f"The new limits will only apply after it is closed", level=logging.WARNING)
+
+        cls._max_connections = max_connections
+        cls._request_timeout = request_timeout
+
+    @classmethod
+    def get_http_client(cls) -> httpx.AsyncClient:
+        """ Returns the shared HTTP client (creates it if it doesn't exist yet) """
+        if cls._http_client is None or cls._http_client.is_closed:
+            limits = httpx.Limits(
+                max_connections=cls._max_connections,
+                max_keepalive_connections=cls._max_connections,  # Keep every connection warm between the turns
+                keepalive_expiry=AppConfiguration.llm_keepalive_expiry_sec,
+            )
+            timeout = httpx.Timeout(cls._request_timeout, connect=AppConfiguration.llm_connect_timeout_sec)
+            AppConfiguration.logger.log(f"Creating the shared connection pool: max_connections={cls._max_connections}, " +
+                                        f"request_timeout={cls._request_timeout}s")
+            cls._http_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+
+        return cls._http_client
+
+    @classmethod
+    def get_client(cls, client_cls: Type[LLMBaseClient], base_url: str, api_key: str = None) -> Any:
+        """ Returns the client for the given client class and base URL, creating it if it doesn't exist yet """
+        key = (client_cls.__name__, base_url)
+        if key not in cls._clients:
+            AppConfiguration.logger.log(f"Creating a new {client_cls.__name__} for {base_url} ...")
+            cls._clients[key] = client_cls.create_client(base_url=base_url, api_key=api_key, http_client=cls.get_http_client())
+
+        return cls._clients[key]
+
+    @classmethod
+    def get_rate_limiter(cls, model: str, base_urls: list[str], requests_per_minute: Optional[int] = None,
+                         tokens_per_minute: Optional[int] = None) -> LLMRateLimiter:
+        """ Returns the rate limiter of the given model on the given URLs, creating it (with the given limits) if it doesn't exist yet """
+        key = (model, *sorted(base_urls))
+        if key not in cls._rate_limiters:
+            cls._rate_limiters[key] = LLMRateLimiter(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+
+        return cls._rate_limiters[key]
+
+    @classmethod
+    async def close(cls) -> None:
+        """ Closes the shared connection pool and forgets all the clients (and their rate limiters) """
+        cls._clients.clear()
+        cls._rate_limiters.clear()
+        if (cls._http_client is not None) and (not cls._http_client.is_closed):
+            AppConfiguration.logger.log(f"Closing the shared connection pool ...")
+            await cls._http_client.aclose()
+        cls._http_client = None
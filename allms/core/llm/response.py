@@ -1,4 +1,5 @@
 from __future__ import annotations
+import re
 from typing import Iterable
 
 from pydantic import BaseModel, field_validator, model_validator
@@ -7,11 +8,28 @@ from typing import Any, ClassVar, Dict, Optional, Set
 
 class _AllowedIDsMixin(BaseModel):
     allowed_ids: ClassVar[Set[str]] = set()  # Run-time set of allowed agent IDs
+    canonical_ids: ClassVar[Dict[str, str]] = {}  # Mapping between the lowercase allowed agent IDs and the actual ones
 
     @classmethod
     def set_allowed_ids(cls, allowed_ids: Iterable[str]) -> None:
-        allowed_ids = {s.lower() for s in allowed_ids}
-        cls.allowed_ids = allowed_ids
+        cls.canonical_ids = {s.lower(): s for s in allowed_ids}
+        cls.allowed_ids = set(cls.canonical_ids.keys())
+
+    @classmethod
+    def normalize_agent_id(cls, text: str) -> Optional[str]:
+        """
+        Returns the allowed agent ID the given text refers to (e.g. '"@ryan".' or 'Agent Ryan (the pilot)' -> 'Ryan'),
+        or None if it doesn't refer to exactly one of them
+        """
+        candidate = text.strip().strip("\"'`*@.,;:!?()[]<> ").lower()
+        if candidate in cls.canonical_ids:
+            return cls.canonical_ids[candidate]
+
+        # The ID may also be mentioned along with something else
+        text = text.lower()
+        mentioned = {agent_id for (lower_id, agent_id) in cls.canonical_ids.items()
+                     if re.search(rf"(?<!\w){re.escape(lower_id)}(?!\w)", text)}
+        return mentioned.pop() if (len(mentioned) == 1) else None
 
     @classmethod
     def validate_agent_id(cls, agent_id: str) -> str:
@@ -44,6 +62,22 @@ class LLMResponseModel(_AllowedIDsMixin):
             return cls.validate_agent_id(agent_id)
         return agent_id
 
+    @classmethod
+    def get_json_schema(cls, agent_ids: Iterable[str]) -> Dict[str, Any]:
+        """ Returns the JSON schema of the response, with the agent ID fields restricted to the given agent IDs """
+        schema = cls.model_json_schema()
+        properties = schema["properties"]
+
+        # Note: Backends enforce this via a grammar, so an invalid agent ID can't even be generated
+        id_schema = {"anyOf": [{"type": "string", "enum": sorted(agent_ids)}, {"type": "null"}]}
+        for field in ["send_to", "suspect", "voting_for"]:
+            properties[field] = {**id_schema, "title": properties[field].get("title", field)}
+        properties["suspect_confidence"] = {"anyOf": [{"type": "integer", "minimum": 0, "maximum": 100}, {"type": "null"}],
+                                            "title": properties["suspect_confidence"].get("title", "suspect_confidence")}
+
+        schema["required"] = list(cls.model_fields.keys())  # Otherwise the model may leave out the optional ones
+        return schema
+
     @model_validator(mode="after")
     def check_for_vote(cls, model: LLMResponseModel) -> LLMResponseModel:
         if model.start_a_vote and (model.voting_for is None):
@@ -0,0 +1,130 @@
+import math
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from allms.config import AppConfiguration
+from allms.core.agents import Agent
+from .balancer import LLMEndpointBalancer
+from .completion import LLMCompletion
+from .hedge import LLMRequestHedger
+from .ratelimit import LLMRateLimiter
+from .response import LLMResponseModel
+
+
+@dataclass
+class LLMRouteStats:
+    """ Class for tracking the latencies and the tokens of the requests sent via a route """
+    requests: int = 0            # Requests that got a completion
+    prompt_tokens: int = 0       # Prompt tokens processed (as reported by the backend -- the cached ones usually aren't)
+    prompt_tokens_sent: int = 0  # Prompt tokens sent (estimated)
+    completion_tokens: int = 0   # Tokens generated (as reported by the backend)
+    prompt_eval_ms: float = 0.0  # Time spent processing the prompts (by the requests it was reported for)
+    _prompt_evals: int = 0       # Requests the time spent processing the prompt was reported for
+    _latencies_ms: deque[float] = field(default_factory=lambda: deque(maxlen=AppConfiguration.llm_route_stats_window))
+
+    def record(self, latency_ms: float, completion: LLMCompletion, prompt_tokens_sent: int = 0) -> None:
+        """ Records a completion (of a prompt of the given estimated tokens) that took the given time """
+        self.requests += 1
+        self.prompt_tokens += completion.prompt_tokens or 0
+        self.prompt_tokens_sent += prompt_tokens_sent
+        self.completion_tokens += completion.completion_tokens or 0
+        if completion.prompt_eval_ms is not None:
+            self.prompt_eval_ms += completion.prompt_eval_ms
+            self._prompt_evals += 1
+        self._latencies_ms.append(latency_ms)
+
+    def as_dict(self) -> dict[str, Any]:
+        """
+        Returns the stats along with the mean and 95th percentile of the recent latencies and the tokens (and the time
+        spent processing the prompt, if reported) per request
+        """
+        latencies = sorted(self._latencies_ms)
+        mean_ms = (sum(latencies) / len(latencies)) if latencies else 0.0
+        p95_ms = latencies[max(0, math.ceil(0.95 * len(latencies)) - 1)] if latencies else 0.0
+        prompt_per_request = (self.prompt_tokens / self.requests) if self.requests else 0.0
+        prompt_sent_per_request = (self.prompt_tokens_sent / self.requests) if self.requests else 0.0
+        completion_per_request = (self.completion_tokens / self.requests) if self.requests else 0.0
+        stats = dict(requests=self.requests, latency_mean_ms=round(mean_ms, 1), latency_p95_ms=round(p95_ms, 1),
+                     prompt_tokens=self.prompt_tokens, completion_tokens=self.completion_tokens,
+                     prompt_tokens_per_request=round(prompt_per_request, 1),
+                     prompt_tokens_sent_per_request=round(prompt_sent_per_request, 1),
+                     completion_tokens_per_request=round(completion_per_request, 1))
+        if self._prompt_evals:
+            stats["prompt_eval_ms_per_request"] = round(self.prompt_eval_ms / self._prompt_evals, 1)
+        return stats
+
+
+@dataclass
+class LLMRoute:
+    """ Class for a route -- the model the requests are sent to along with the endpoints serving it """
+    name: str
+    model: str
+    balancer: LLMEndpointBalancer
+    hedger: Optional[LLMRequestHedger] = None  # Per route, as the models take very different times to reply
+    rate_limiter: Optional[LLMRateLimiter] = None  # Ditto, as the backends usually rate limit each model separately
+    stats: LLMRouteStats = field(default_factory=LLMRouteStats)
+
+    def get_stats(self) -> dict[str, Any]:
+        """ Returns the statistics of the requests sent via the route """
+        stats = dict(model=self.model, endpoints=self.balancer.get_stats(), **self.stats.as_dict())
+        if self.hedger is not None:
+            stats["hedging"] = self.hedger.stats.as_dict()
+        if self.rate_limiter is not None:
+            stats["rate_limits"] = self.rate_limiter.get_stats()
+        return stats
+
+
+@dataclass
+class LLMTurn:
+    """ Class for what was decided for a single turn of an agent """
+    stakes: str                             # Either LLMModelRouter.routine or LLMModelRouter.high_stakes
+    reason: str                             # Why the turn has these stakes
+    route: LLMRoute                         # Where the requests of the turn are sent to
+    reasoning_effort: Optional[str] = None  # Reasoning effort asked of the model (None = the backend's default)
+
+
+class LLMModelRouter:
+    """
+    Class for picking the stakes of every turn of an agent, which decide the route (and the reasoning effort) of the
+    turn. Routine chatter goes to the routine route (e.g. a small, fast model) and the high-stakes turns to the other one
+    (e.g. a larger model). A turn is high-stakes if a vote is going on, if the agent strongly suspects someone (i.e. is
+    likely deciding whether to start a vote) or if the agent has received a DM from the human since its last turn
+    """
+
+    routine: str = "routine"
+    high_stakes: str = "high_stakes"
+
+    def __init__(self, suspicion_threshold: int, human_id: Optional[str] = None):
+        self._suspicion_threshold = suspicion_threshold
+        self._human_id = human_id
+        self._suspicion: dict[str, int] = {}       # Mapping between agent ID and the confidence of its latest suspicion
+        self._human_dms_seen: dict[str, int] = {}  # Mapping between agent ID and the DMs from the human it had at its last turn
+        self._decisions: Counter = Counter()       # Mapping between the reason of a decision and how often it was made
+
+    def pick(self, agent: Agent, vote_has_started: bool) -> tuple[str, str]:
+        """ Returns the stakes of the next turn of the given agent along with the reason for picking them """
+        human_dms = len(agent.dm_msg_ids_recv.get(self._human_id, ())) if (self._human_id is not None) else 0
+        has_new_human_dm = human_dms > self._human_dms_seen.get(agent.id, 0)
+        self._human_dms_seen[agent.id] = human_dms  # Replied to in this turn
+
+        suspicion = self._suspicion.get(agent.id, 0)
+        if vote_has_started:
+            stakes, reason = self.high_stakes, "vote in progress"
+        elif suspicion >= self._suspicion_threshold:
+            stakes, reason = self.high_stakes, "strong suspicion"
+        elif has_new_human_dm:
+            stakes, reason = self.high_stakes, "reply to a DM from the human"
+        else:
+            stakes, reason = self.routine, "routine"
+
+        self._decisions[reason] += 1
+        return stakes, reason
+
+    def record_response(self, agent_id: str, response: LLMResponseModel) -> None:
+        """ Records the (valid) response of the given agent -- its suspicion affects the stakes of its next turns """
+        self._suspicion[agent_id] = (response.suspect_confidence or 0) if (response.suspect is not None) else 0
+
+    def get_stats(self) -> dict[str, int]:
+        """ Returns how often each reason decided the stakes """
+        return dict(self._decisions)
@@ -0,0 +1,11 @@
+from enum import Enum
+
+
+class LLMBackendStatus(str, Enum):
+    """ Class for storing the status of the model backend, as displayed to the user """
+
+    WARMING_UP: str = "Warming up the model ..."
+    WARM_UP_FAILED: str = "Could not warm up the model. The agents will try anyway"
+    READY: str = "Model is ready"
+    UNAVAILABLE: str = "Model backend is unavailable. The agents will resume once it is back"
+    RECOVERED: str = "Model backend is available again. The agents are resuming"
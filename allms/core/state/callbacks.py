@@ -8,6 +8,8 @@ class StateManagerCallbackType(BaseCallbackType):
 
     GET_RECENT_MESSAGE_IDS: str = "get_recent_message_ids"
     GET_MESSAGE_WITH_ID: str = "get_message_with_id"
+    GET_FORMATTED_MESSAGE_WITH_ID: str = "get_formatted_message_with_id"
+    GET_MESSAGES_VERSION: str = "get_messages_version"
     IS_TYPING: str = "is_typing"
     SEND_MESSAGE: str = "send_message"
     VOTE_HAS_STARTED: str = "vote_started"
@@ -15,6 +17,8 @@ class StateManagerCallbackType(BaseCallbackType):
     VOTE_FOR: str = "vote_for"
     END_THE_VOTE: str = "end_vote"
     UPDATE_UI_ON_NEW_MESSAGE: str = "update_ui"
+    UPDATE_LLM_STATUS: str = "update_llm_status"
+    PARTIAL_MESSAGE: str = "partial_message"
 
 
 class StateManagerCallbacks(BaseCallbacks):
@@ -11,10 +11,12 @@ from typing import Any, Callable, Optional
 
 from allms.cli.callbacks import ChatCallbackType, ChatCallbacks
 from allms.config import AppConfiguration, RunTimeConfiguration
-from allms.core.agents import Agent, AgentFactory
+from allms.core.agents import Agent, AgentFactory, AgentGenerationProfile
 from allms.core.chat import ChatMessage, ChatMessageFormatter
 from allms.core.generate import PersonaGenerator, ScenarioGenerator
+from allms.core.llm.cassette import LLMCassettePlayer, LLMCassetteRecorder
 from allms.core.llm.loop import ChatLoop
+from allms.core.llm.status import LLMBackendStatus
 from allms.utils.save import SavingUtils
 from .callbacks import StateManagerCallbackType, StateManagerCallbacks
 from .state import GameState
@@ -38,11 +40,18 @@ class GameStateManager:
         self._chat_callbacks: Optional[ChatCallbacks] = None
         self._self_callbacks: StateManagerCallbacks = StateManagerCallbacks(self.__generate_callbacks())
         self._chat_loop: Optional[ChatLoop] = None
+        self._llm_status: Optional[LLMBackendStatus] = None  # None if the LLMs have not been started
+
+        # Recording/replaying of the LLM traffic (see cassetteMode in the config file)
+        self._loaded_from_dir: Optional[Path] = None  # Save directory the game state was loaded from (if any)
+        self._cassette_recorder: Optional[LLMCassetteRecorder] = None
 
     async def new(self) -> None:
         """ Creates a new game state """
         self._logger.log("Creating a new game state ...")
         self._game_state = GameState()
+        self._loaded_from_dir = None
+        self._cassette_recorder = None
         self.update_scenario(self.generate_scenario())
         self.create_agents(self._config.default_agent_count)
 
@@ -56,6 +65,13 @@ class GameStateManager:
         try:
             game_state = self.__load_and_validate_game_state(file_path, reset)
             self._game_state = game_state
+
+            # Agents of the saves made before the generation profiles existed get the default one
+            for agent in game_state.get_all_agents().values():
+                if agent.get_generation_profile() is None:
+                    agent.update_generation_profile(self.create_generation_profile(AppConfiguration.default_generation_profile))
+            self._loaded_from_dir = file_path.parent
+            self._cassette_recorder = None
         except (json.JSONDecodeError, Exception) as err:
             raise err
 
@@ -109,6 +125,10 @@ class GameStateManager:
                 f.write(msg)
                 f.write("\n\n" if (i != n_messages-1) else "\n")
 
+        # Store the recorded LLM traffic next to the save
+        if self._cassette_recorder is not None:
+            self._cassette_recorder.save(save_dir)
+
         return save_dir
 
     def start_llms(self) -> None:
@@ -119,12 +139,25 @@ class GameStateManager:
         if self._config.ui_dev_mode or self._game_state.get_game_ended():
             return
 
+        self._llm_status = None
+        cassette_player = None
+        if (self._config.cassette_mode == "record") and (self._cassette_recorder is None):
+            self._cassette_recorder = LLMCassetteRecorder()
+        elif (self._config.cassette_mode == "replay") and (self._loaded_from_dir is not None):
+            cassette_player = LLMCassettePlayer.from_save_dir(self._loaded_from_dir,
+                                                              match=self._config.cassette_match,
+                                                              speed=self._config.cassette_speed)
+        elif self._config.cassette_mode == "replay":
+            self._logger.log(f"Nothing to replay as the game was not loaded from a save", level=logging.WARNING)
+
         self._chat_loop = ChatLoop(config=self._config,
                                    your_agent_id=your_id,
                                    agents=self.get_all_agents(),
                                    terminated_agent_ids=self.get_terminated_agent_ids(),
                                    scenario=self.get_scenario(),
-                                   callbacks=self._self_callbacks
+                                   callbacks=self._self_callbacks,
+                                   cassette_recorder=self._cassette_recorder,
+                                   cassette_player=cassette_player
                                    )
         self._chat_loop.start()
 
@@ -143,9 +176,20 @@ class GameStateManager:
         if agent_id is None:
             self._chat_loop.stop()
             self._chat_loop = None
+            self._llm_status = None
         else:
             self._chat_loop.stop_agents(agent_id)
 
+    def get_llm_stats(self) -> dict[str, Any]:
+        """ Returns the statistics of the requests sent to the model backend (empty if the LLMs are not running) """
+        if self._chat_loop is None:
+            return {}
+        return self._chat_loop.get_stats()
+
+    def get_llm_status(self) -> Optional[LLMBackendStatus]:
+        """ Returns the current status of the model backend (None if the LLMs have not been started) """
+        return self._llm_status
+
     def register_chat_callbacks(self, callbacks: ChatCallbacks) -> None:
         """ Registers the chat callbacks """
         self._chat_callbacks = callbacks
@@ -169,6 +213,9 @@ class GameStateManager:
         agents = AgentFactory.create(genre=genre, n_agents=n_agents)
         self.__check_game_state_validity()
 
+        for agent in agents:
+            agent.update_generation_profile(self.create_generation_profile(AppConfiguration.default_generation_profile))
+
         self._game_state.initialize_agents(agents)
 
     def get_agent(self, agent_id: str) -> Agent:
@@ -225,6 +272,15 @@ class GameStateManager:
         persona = self._persona_generator.generate(n=1)
         return persona[0]
 
+    def get_generation_profile_names(self) -> list[str]:
+        """ Returns the names of the generation profiles the agents can be given """
+        return list(self._config.generation_profiles.keys())
+
+    def create_generation_profile(self, name: str) -> AgentGenerationProfile:
+        """ Creates the generation profile with the given name (with a random seed if it has none) and returns it """
+        assert name in self._config.generation_profiles, f"Generation profile({name}) does not exist in the configuration"
+        return AgentGenerationProfile.from_config(name, self._config.generation_profiles[name])
+
     def generate_scenario(self) -> str:
         """ Generates a random scenario (based on currently set genre) and returns it """
         self.__check_game_state_validity()
@@ -258,13 +314,15 @@ class GameStateManager:
                            reply_to_id: Optional[str] = None,
                            suspect_id: Optional[str] = None,
                            suspect_confidence: Optional[int] = None,
-                           suspect_reason: Optional[str] = None
+                           suspect_reason: Optional[str] = None,
+                           reasoning_effort: Optional[str] = None
                            ) -> str:
         """ Sends a message by the given agent ID and returns the message ID """
         self.__check_game_state_validity()
         msg = self.__create_new_message(msg=msg, sent_by=sent_by, sent_by_you=sent_by_you, sent_to=sent_to,
                                         thought_process=thought_process, reply_to_id=reply_to_id, suspect_id=suspect_id,
-                                        suspect_reason=suspect_reason, suspect_confidence=suspect_confidence)
+                                        suspect_reason=suspect_reason, suspect_confidence=suspect_confidence,
+                                        reasoning_effort=reasoning_effort)
         await self._game_state.add_message(msg)
         return msg.id
 
@@ -273,6 +331,16 @@ class GameStateManager:
         self.__check_game_state_validity()
         return self._game_state.get_message(msg_id)
 
+    def get_formatted_message(self, msg_id: str) -> str:
+        """ Returns the message associated with the given message ID, formatted for the LLMs """
+        self.__check_game_state_validity()
+        return self._game_state.get_formatted_message(msg_id)
+
+    def get_messages_version(self) -> int:
+        """ Returns the version of the messages, which changes every time a message is edited/deleted """
+        self.__check_game_state_validity()
+        return self._game_state.get_messages_version()
+
     def get_all_messages(self, ids_only: bool = False) -> list[ChatMessage] | list[str]:
         """ Returns a list of chat messages or list of chat message IDs """
         return self._game_state.get_all_messages(ids_only=ids_only)
@@ -476,6 +544,7 @@ class GameStateManager:
                              suspect_id: Optional[str] = None,
                              suspect_confidence: Optional[int] = None,
                              suspect_reason: Optional[str] = None,
+                             reasoning_effort: Optional[str] = None,
                              is_announcement: bool = False
                              ) -> ChatMessage:
         """ Helper method to create a message and return it """
@@ -494,7 +563,7 @@ class GameStateManager:
         chat_msg = ChatMessage(id=msg_id, timestamp=timestamp, msg=msg, sent_by=sent_by, sent_by_you=sent_by_you,
                                sent_to=sent_to, thought_process=thought_process, reply_to_id=reply_to_id,
                                suspect=suspect_id, suspect_reason=suspect_reason, suspect_confidence=suspect_confidence,
-                               is_announcement=is_announcement)
+                               reasoning_effort=reasoning_effort, is_announcement=is_announcement)
         AppConfiguration.logger.log(f"Created a new message: {chat_msg}")
         return chat_msg
 
@@ -597,17 +666,34 @@ class GameStateManager:
         """ Callback to update the agent typing in the chat screen """
         self.__invoke_chat_callback(ChatCallbackType.IS_TYPING, agent_id=agent_id, is_typing=is_typing)
 
+    def __show_partial_message(self, agent_id: str, text: Optional[str]) -> None:
+        """ Callback to show the message the agent is still typing in the chat screen (None = nothing to show) """
+        self.__invoke_chat_callback(ChatCallbackType.PARTIAL_MESSAGE, agent_id=agent_id, text=text)
+
+    def __update_llm_status(self, status: LLMBackendStatus) -> None:
+        """ Callback to update the status of the model backend """
+        if status == self._llm_status:
+            return
+
+        self._logger.log(f"Model backend status: {status.value}")
+        self._llm_status = status
+        self.__invoke_chat_callback(ChatCallbackType.LLM_STATUS_CHANGED, status)
+
     def __generate_callbacks(self) -> dict[StateManagerCallbackType, Callable[..., Any]]:
         """ Helper method to generate the callbacks required by the chat-loop class """
         self_callbacks = {
             StateManagerCallbackType.SEND_MESSAGE: self.send_message,
             StateManagerCallbackType.UPDATE_UI_ON_NEW_MESSAGE: self.on_new_message_received,
             StateManagerCallbackType.GET_MESSAGE_WITH_ID: self.get_message,
+            StateManagerCallbackType.GET_FORMATTED_MESSAGE_WITH_ID: self.get_formatted_message,
+            StateManagerCallbackType.GET_MESSAGES_VERSION: self.get_messages_version,
             StateManagerCallbackType.IS_TYPING: self.__agent_is_typing,
             StateManagerCallbackType.VOTE_HAS_STARTED: self.voting_has_started,
             StateManagerCallbackType.START_A_VOTE: self.start_vote,
             StateManagerCallbackType.VOTE_FOR: self.vote,
-            StateManagerCallbackType.END_THE_VOTE: self.end_vote
+            StateManagerCallbackType.END_THE_VOTE: self.end_vote,
+            StateManagerCallbackType.UPDATE_LLM_STATUS: self.__update_llm_status,
+            StateManagerCallbackType.PARTIAL_MESSAGE: self.__show_partial_message
         }
 
         return self_callbacks
@@ -232,6 +232,14 @@ class GameState:
         """ Fetches the message with the given message ID and returns it """
         return self.messages.get(message_id)
 
+    def get_formatted_message(self, message_id: str) -> str:
+        """ Fetches the message with the given message ID and returns it formatted for the LLMs """
+        return self.messages.get_formatted(message_id)
+
+    def get_messages_version(self) -> int:
+        """ Returns the version of the messages, which changes every time a message is edited/deleted """
+        return self.messages.get_version()
+
     def get_messages_sent_by(self, agent_id: str, latest_first: bool = True) -> list[ChatMessage]:
         """ Fetches all the messages sent by agent ID and returns it """
         assert agent_id in self._all_agents, f"Trying to fetch messages by agent ID({agent_id}) which is not present"
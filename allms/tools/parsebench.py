@@ -0,0 +1,106 @@
+import json
+import sys
+from argparse import ArgumentParser
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from allms.core.llm.cassette import LLMCassette
+from allms.core.llm.parser import LLMResponseParser, LLMResponseSalvager
+from allms.core.llm.response import LLMResponseModel
+
+
+# The corpus used when none is given -- hand-written responses covering the common deviations from the output schema
+default_corpus: Path = Path(__file__).parent / "corpus" / "responses.jsonl"
+
+
+@dataclass
+class ParseBenchCase:
+    """ Class for a single response of the corpus """
+    case: str                # What the response is an example of
+    allowed_ids: list[str]   # The agent IDs in the chatroom when the response was generated
+    response: str            # The raw response of the model
+
+
+@dataclass
+class ParseBenchResult:
+    """ Class for the outcome of parsing the corpus with a parser """
+    total: int = 0
+    failed: int = 0
+    failures: Counter = field(default_factory=Counter)  # Mapping between the case and the number of failed responses
+
+    @property
+    def retry_rate(self) -> float:
+        """ Fraction of the responses that would have been regenerated """
+        return (self.failed / self.total) if self.total else 0.0
+
+
+def load_corpus(file_path: Path, extra_ids: list[str]) -> list[ParseBenchCase]:
+    """
+    Loads the responses from the given file -- either a corpus (one JSON object per line with the case, the allowed IDs
+    and the response) or a cassette recorded during a game (the allowed IDs being its agents and the given extra IDs)
+    """
+    if file_path.name.endswith(LLMCassette.file_name):
+        entries = LLMCassette.load(file_path)
+        allowed_ids = sorted({entry.agent_id for entry in entries} | set(extra_ids))
+        return [ParseBenchCase(case=f"cassette:{entry.agent_id}", allowed_ids=allowed_ids, response=entry.content) for entry in entries]
+
+    cases = []
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                cases.append(ParseBenchCase(case=record.get("case", "unknown"),
+                                            allowed_ids=record["allowed_ids"] + extra_ids,
+                                            response=record["response"]))
+    return cases
+
+
+def run(cases: list[ParseBenchCase], parse: Callable[[str], object]) -> ParseBenchResult:
+    """ Parses every response of the corpus with the given parser """
+    result = ParseBenchResult()
+    for case in cases:
+        LLMResponseModel.set_allowed_ids(case.allowed_ids)
+        result.total += 1
+        try:
+            parse(case.response)
+        except Exception:
+            result.failed += 1
+            result.failures[case.case] += 1
+    return result
+
+
+def main():
+    parser = ArgumentParser(description="Compares the retry rate of the strict and the salvaging response parsers on a corpus")
+    parser.add_argument("corpus", type=Path, nargs="*", default=[default_corpus],
+                        help=f"Corpus files or cassettes ({LLMCassette.file_name}) of recorded games")
+    parser.add_argument("--ids", type=str, default="", help="Comma-separated agent IDs to allow in addition (e.g. your own)")
+    parser.add_argument("--verbose", action="store_true", help="Show the repairs made and the responses that still fail")
+    args = parser.parse_args(sys.argv[1:])
+
+    extra_ids = [agent_id.strip() for agent_id in args.ids.split(",") if agent_id.strip()]
+    cases = [case for file_path in args.corpus for case in load_corpus(file_path, extra_ids)]
+
+    repairs = Counter()
+
+    def _salvage(response: str) -> None:
+        _, response_repairs = LLMResponseSalvager.salvage(response)
+        repairs.update(repair.split(":")[0] for repair in response_repairs)
+        if args.verbose and response_repairs:
+            print(f"Repaired: {response_repairs}")
+
+    strict = run(cases, LLMResponseParser.parse)
+    salvaging = run(cases, _salvage)
+
+    print(f"Responses: {len(cases)}")
+    print(f"Strict parser:    {strict.failed:4d} failed (retry rate: {strict.retry_rate:6.1%})")
+    print(f"Salvaging parser: {salvaging.failed:4d} failed (retry rate: {salvaging.retry_rate:6.1%})")
+    print(f"Repairs by key:   {dict(repairs.most_common())}")
+    print(f"Still failing:    {dict(salvaging.failures.most_common())}")
+    if args.verbose:
+        print(f"Failing with the strict parser: {dict(strict.failures.most_common())}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,514 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from dataclasses import asdict, dataclass, field, fields, replace
+from typing import Any, Awaitable, Callable, Optional
+
+from aiohttp import web
+
+from allms.config import AppConfiguration
+from allms.core.llm.completion import LLMGenerationOptions, LLMTokenEstimator
+from allms.core.llm.fake import FakeLLMClient
+from allms.core.llm.ratelimit import LLMTokenBucket
+
+
+@dataclass(frozen=True)
+class StubServerProfile:
+    """ Class for the behavior of the stub server """
+    slots: int = 4                          # Number of requests served in parallel (like OLLAMA_NUM_PARALLEL)
+    max_queue: int = 64                     # Requests waiting for a slot beyond which new ones are rejected (503)
+    tokens_per_sec: float = 30.0            # Generation speed of a single slot
+    prefill_tokens_per_sec: float = 600.0   # Prompt processing speed of a single slot
+    timeout_rate: float = 0.0               # Probability of a request hanging (holding its slot) until the client gives up
+    error_rate: float = 0.0                 # Probability of a request failing with a 500
+    truncate_rate: float = 0.0              # Probability of the response body being cut off mid-way
+    malformed_rate: float = 0.05            # Probability of a reply not following the output schema
+    vote_start_rate: float = 0.02           # Probability of a reply starting a vote
+    dm_rate: float = 0.1                    # Probability of a reply being a DM
+    trailing_rate: float = 0.0              # Probability of a reply rambling on after the output schema
+    requests_per_minute: int = 0            # Rate limit on the requests, enforced like a hosted provider would (0 = none)
+    tokens_per_minute: int = 0              # Ditto, on the prompt tokens + max. tokens of the requests (0 = none)
+    seed: int = 0                           # Seed of the reply and fault generators
+
+
+# Presets for the commonly needed behaviors -- any of their values can be overridden via the command-line
+profiles: dict[str, StubServerProfile] = {
+    "gpu": StubServerProfile(slots=4, tokens_per_sec=60.0, prefill_tokens_per_sec=2000.0),
+    "cpu": StubServerProfile(slots=1, tokens_per_sec=8.0, prefill_tokens_per_sec=80.0),
+    "flaky": StubServerProfile(slots=4, tokens_per_sec=30.0, prefill_tokens_per_sec=600.0,
+                               timeout_rate=0.05, error_rate=0.05, truncate_rate=0.05),
+    "hosted": StubServerProfile(slots=16, tokens_per_sec=120.0, prefill_tokens_per_sec=5000.0,
+                                requests_per_minute=30, tokens_per_minute=60000),
+}
+
+
+@dataclass
+class StubServerStats:
+    """ Class for the statistics of the stub server """
+    requests: int = 0        # Requests received
+    completed: int = 0       # Requests served successfully
+    cancelled: int = 0       # Requests dropped by the client before they were served
+    rejected: int = 0        # Requests rejected because the queue was full
+    rate_limited: int = 0    # Requests rejected because they didn't fit in the rate limits
+    in_flight: int = 0       # Requests currently holding a slot
+    prompt_tokens: int = 0   # Prompt tokens received
+    cached_tokens: int = 0   # Prompt tokens that were reused from the slot's cache instead of being processed
+    queued: int = 0          # Requests currently waiting for a slot
+    max_queued: int = 0      # Most requests ever waiting for a slot at once
+    faults: dict[str, int] = field(default_factory=lambda: {"timeout": 0, "error": 0, "truncate": 0})
+
+
+class OllamaStubServer:
+    """
+    Class for a standalone stub server speaking the same HTTP API as Ollama (OpenAI-compatible and native), with a
+    configurable throughput, parallelism, rate limits and faults. Meant for exercising the real network path (pooling,
+    retries, cancellation etc.) under load on a single machine, without a model. The rate limits are enforced and
+    reported (x-ratelimit-* headers) the way OpenAI does. Like Ollama, every slot keeps the prompt it processed last
+    (its KV cache): a request goes to the free slot sharing the longest prefix with its prompt and only the rest of the
+    prompt is processed (and reported as processed)
+    """
+
+    def __init__(self, profile: StubServerProfile):
+        assert profile.slots > 0, f"Expected the number of slots to be > 0 but got {profile.slots} instead"
+        assert profile.tokens_per_sec > 0, f"Expected tokens/sec to be > 0 but got {profile.tokens_per_sec} instead"
+        assert profile.prefill_tokens_per_sec > 0, f"Expected prefill tokens/sec to be > 0 but got {profile.prefill_tokens_per_sec} instead"
+
+        self._profile = profile
+        self._slots = asyncio.Semaphore(profile.slots)
+        self._slot_prompts: list[str] = [""] * profile.slots  # Prompt processed last by every slot
+        self._free_slots: set[int] = set(range(profile.slots))
+        self._rng = random.Random(profile.seed)
+        self._rate_limits = {kind: LLMTokenBucket(capacity=limit, level=limit) for (kind, limit) in
+                             [("requests", profile.requests_per_minute), ("tokens", profile.tokens_per_minute)] if limit > 0}
+        self.stats = StubServerStats()
+
+    def create_app(self) -> web.Application:
+        """ Creates the web application serving the API """
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.__openai_chat)
+        app.router.add_get("/v1/models", self.__openai_models)
+        app.router.add_post("/api/chat", self.__native_chat)
+        app.router.add_get("/api/version", self.__native_version)
+        app.router.add_get("/stub/stats", self.__stats)
+        return app
+
+    async def run(self, host: str, port: int) -> None:
+        """ Runs the server until cancelled """
+        # Note: Cancel the handlers when the client drops the request -- like Ollama, this frees the slot immediately
+        runner = web.AppRunner(self.create_app(), handler_cancellation=True)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        AppConfiguration.logger.log(f"Stub server listening on http://{host}:{port} with {self._profile}")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            AppConfiguration.logger.log(f"Stub server statistics: {self.stats}")
+            await runner.cleanup()
+
+    async def __openai_chat(self, request: web.Request) -> web.StreamResponse:
+        """ Handler for the OpenAI-compatible chat completions """
+        body = await request.json()
+        if body.get("stream", False):
+            return await self.__openai_chat_stream(request, body)
+
+        reply = await self.__generate(body["messages"], model=body.get("model", ""), max_tokens=body.get("max_tokens", None),
+                                      json_schema=self.__get_json_schema(body),
+                                      reasoning_effort=self.__get_reasoning_effort(body),
+                                      seed=self.__get_seed(body),
+                                      stop=self.__get_stop(body))
+        if isinstance(reply, web.Response):
+            return reply
+
+        content, prompt_tokens, completion_tokens, finish_reason, _, _ = reply
+        data = {
+            "id": f"chatcmpl-{self.stats.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", ""),
+            "choices": [{"index": 0, "finish_reason": finish_reason, "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+        return await self.__respond(request, data)
+
+    async def __native_chat(self, request: web.Request) -> web.StreamResponse:
+        """ Handler for Ollama's native chat API """
+        body = await request.json()
+        options = body.get("options", {}) or {}
+        # Note: Unlike the OpenAI-compatible API, the native one streams by default
+        if body.get("stream", True):
+            return await self.__native_chat_stream(request, body)
+
+        reply = await self.__generate(body["messages"], model=body.get("model", ""), max_tokens=options.get("num_predict", None),
+                                      json_schema=self.__get_json_schema(body),
+                                      reasoning_effort=self.__get_reasoning_effort(body),
+                                      seed=self.__get_seed(body),
+                                      stop=self.__get_stop(body))
+        if isinstance(reply, web.Response):
+            return reply
+
+        content, prompt_tokens, completion_tokens, finish_reason, prefill_sec, eval_sec = reply
+        data = self.__native_message(body, content)
+        data.update(self.__native_stats(prompt_tokens, completion_tokens, finish_reason, prefill_sec, eval_sec))
+        return await self.__respond(request, data)
+
+    async def __openai_chat_stream(self, request: web.Request, body: dict[str, Any]) -> web.StreamResponse:
+        """ Handler for the streamed OpenAI-compatible chat completions (server-sent events) """
+        chunk_id = f"chatcmpl-{self.stats.requests + 1}"
+
+        def _chunk(delta: dict[str, str], finish_reason: Optional[str] = None) -> dict[str, Any]:
+            return {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": body.get("model", ""),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+        def _encode(data: dict[str, Any] | str) -> bytes:
+            return f"data: {data if isinstance(data, str) else json.dumps(data)}\n\n".encode()
+
+        def _encode_end(reply: tuple) -> bytes:
+            _, prompt_tokens, completion_tokens, finish_reason, _, _ = reply
+            end = _encode(_chunk({}, finish_reason=finish_reason))
+            if (body.get("stream_options", None) or {}).get("include_usage", False):
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                         "total_tokens": prompt_tokens + completion_tokens}
+                end += _encode({**_chunk({}), "choices": [], "usage": usage})
+            return end + _encode("[DONE]")
+
+        return await self.__stream(request, body["messages"], model=body.get("model", ""), max_tokens=body.get("max_tokens", None),
+                                   json_schema=self.__get_json_schema(body), reasoning_effort=self.__get_reasoning_effort(body),
+                                   seed=self.__get_seed(body), stop=self.__get_stop(body), content_type="text/event-stream",
+                                   encode_delta=lambda delta: _encode(_chunk({"role": "assistant", "content": delta})),
+                                   encode_end=_encode_end)
+
+    async def __native_chat_stream(self, request: web.Request, body: dict[str, Any]) -> web.StreamResponse:
+        """ Handler for the streamed native chat API (one JSON object per line) """
+        def _encode(data: dict[str, Any]) -> bytes:
+            return (json.dumps(data) + "\n").encode()
+
+        def _encode_end(reply: tuple) -> bytes:
+            _, prompt_tokens, completion_tokens, finish_reason, prefill_sec, eval_sec = reply
+            data = self.__native_message(body, "")
+            data.update(self.__native_stats(prompt_tokens, completion_tokens, finish_reason, prefill_sec, eval_sec))
+            return _encode(data)
+
+        options = body.get("options", {}) or {}
+        return await self.__stream(request, body["messages"], model=body.get("model", ""), max_tokens=options.get("num_predict", None),
+                                   json_schema=self.__get_json_schema(body), reasoning_effort=self.__get_reasoning_effort(body),
+                                   seed=self.__get_seed(body), stop=self.__get_stop(body), content_type="application/x-ndjson",
+                                   encode_delta=lambda delta: _encode({**self.__native_message(body, delta), "done": False}),
+                                   encode_end=_encode_end)
+
+    async def __stream(self,
+                       request: web.Request,
+                       messages: list[dict[str, str]],
+                       model: str,
+                       max_tokens: Optional[int],
+                       json_schema: Optional[dict[str, Any]],
+                       reasoning_effort: Optional[str],
+                       seed: Optional[int],
+                       stop: Optional[list[str]],
+                       content_type: str,
+                       encode_delta: Callable[[str], bytes],
+                       encode_end: Callable[[tuple], bytes]) -> web.StreamResponse:
+        """ Helper method to stream the reply as it is generated (the response starts with the first token) """
+        response: Optional[web.StreamResponse] = None
+        # With a truncation fault, the connection is closed after a random number of chunks
+        truncate_after = self._rng.randint(1, 20) if (self._rng.random() < self._profile.truncate_rate) else None
+        n_chunks = 0
+
+        async def _emit(delta: str) -> bool:
+            nonlocal response, n_chunks
+            if response is None:
+                response = web.StreamResponse(headers={"Content-Type": content_type, **self.__get_rate_limit_headers()})
+                await response.prepare(request)
+            if n_chunks == truncate_after:
+                self.stats.faults["truncate"] += 1
+                request.transport.close()
+                return False
+            n_chunks += 1
+            await response.write(encode_delta(delta))
+            return True
+
+        reply = await self.__generate(messages, model=model, max_tokens=max_tokens, json_schema=json_schema,
+                                      reasoning_effort=reasoning_effort, seed=seed, stop=stop, emit=_emit)
+        if isinstance(reply, web.Response):
+            return reply  # Failed before anything was streamed
+        if n_chunks == truncate_after:
+            return response
+        if response is None:  # Nothing was generated (e.g. the cap was used up by the reasoning)
+            response = web.StreamResponse(headers={"Content-Type": content_type, **self.__get_rate_limit_headers()})
+            await response.prepare(request)
+
+        await response.write(encode_end(reply))
+        await response.write_eof()
+        return response
+
+    @staticmethod
+    def __get_json_schema(body: dict[str, Any]) -> Optional[dict[str, Any]]:
+        """ Helper method to return the JSON schema the reply must be constrained to (None if it isn't constrained) """
+        response_format = body.get("response_format", None) or {}  # OpenAI-compatible API
+        if response_format.get("type", None) == "json_schema":
+            return response_format["json_schema"]["schema"]
+        if response_format.get("type", None) == "json_object":
+            return {"type": "object"}
+
+        fmt = body.get("format", None)  # Native API -- either "json" or the schema itself
+        if isinstance(fmt, dict):
+            return fmt
+        if fmt == "json":
+            return {"type": "object"}
+        return None
+
+    @staticmethod
+    def __get_reasoning_effort(body: dict[str, Any]) -> Optional[str]:
+        """ Helper method to return the reasoning effort asked for (None if the reply isn't reasoned about) """
+        if body.get("reasoning_effort", None) is not None:  # OpenAI-compatible API
+            return body["reasoning_effort"]
+
+        think = body.get("think", None)  # Native API -- either the level or whether to think at all
+        if isinstance(think, str):
+            return think
+        return "medium" if (think is True) else None
+
+    @staticmethod
+    def __get_seed(body: dict[str, Any]) -> Optional[int]:
+        """ Helper method to return the seed of the sampler asked for (None if not given) """
+        if body.get("seed", None) is not None:  # OpenAI-compatible API
+            return body["seed"]
+        return (body.get("options", None) or {}).get("seed", None)  # Native API
+
+    @staticmethod
+    def __get_stop(body: dict[str, Any]) -> Optional[list[str]]:
+        """ Helper method to return the stop sequences asked for (None if not given) """
+        stop = body.get("stop", None)  # OpenAI-compatible API -- either a string or a list of them
+        if stop is None:
+            stop = (body.get("options", None) or {}).get("stop", None)  # Native API
+        if isinstance(stop, str):
+            return [stop]
+        return stop
+
+    @staticmethod
+    def __native_message(body: dict[str, Any], content: str) -> dict[str, Any]:
+        """ Helper method to create a (partial) response of the native API """
+        return {
+            "model": body.get("model", ""),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "message": {"role": "assistant", "content": content},
+        }
+
+    @staticmethod
+    def __native_stats(prompt_tokens: int, completion_tokens: int, finish_reason: str, prefill_sec: float, eval_sec: float) -> dict[str, Any]:
+        """ Helper method to create the statistics sent at the end of a response of the native API """
+        sec_to_ns = 1e9
+        return {
+            "done": True,
+            "done_reason": finish_reason,
+            "total_duration": int((prefill_sec + eval_sec) * sec_to_ns),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prefill_sec * sec_to_ns),
+            "eval_count": completion_tokens,
+            "eval_duration": int(eval_sec * sec_to_ns),
+        }
+
+    async def __openai_models(self, request: web.Request) -> web.Response:
+        """ Handler for listing the models (used as a health-check) """
+        return web.json_response({"object": "list", "data": []})
+
+    async def __native_version(self, request: web.Request) -> web.Response:
+        """ Handler for the version (used as a health-check) """
+        return web.json_response({"version": "stub"})
+
+    async def __stats(self, request: web.Request) -> web.Response:
+        """ Handler for the statistics of the server """
+        return web.json_response(asdict(self.stats))
+
+    async def __generate(self,
+                         messages: list[dict[str, str]],
+                         model: str,
+                         max_tokens: Optional[int],
+                         json_schema: Optional[dict[str, Any]] = None,
+                         reasoning_effort: Optional[str] = None,
+                         seed: Optional[int] = None,
+                         stop: Optional[list[str]] = None,
+                         emit: Optional[Callable[[str], Awaitable[bool]]] = None) -> tuple | web.Response:
+        """
+        Helper method to wait for a slot and generate the reply, taking as long as a real backend would. Returns the
+        (content, prompt tokens, completion tokens, finish reason, prefill seconds, eval seconds) or the error response.
+        If emit is given, the reply is passed to it token by token as it is generated (until it returns False). If
+        json_schema is given, the reply is constrained to it. The hidden reasoning tokens (depending on the reasoning
+        effort) are generated before the reply and counted in the completion tokens. The seed (if any) is mixed into
+        the seed of the reply generator. The reply ends at the first of the stop sequences (if any)
+        """
+        self.stats.requests += 1
+        messages = self.__normalize_messages(messages)
+        rejection = self.__charge_rate_limits(tokens=LLMTokenEstimator.estimate_messages(messages) + (max_tokens or 0))
+        if rejection is not None:
+            return rejection
+        if self.stats.queued >= self._profile.max_queue:
+            self.stats.rejected += 1
+            return web.json_response({"error": "server busy, please try again later"}, status=503)
+
+        self.stats.queued += 1
+        self.stats.max_queued = max(self.stats.max_queued, self.stats.queued)
+        try:
+            await self._slots.acquire()
+        except asyncio.CancelledError:
+            self.stats.cancelled += 1
+            raise
+        finally:
+            self.stats.queued -= 1
+
+        self.stats.in_flight += 1
+        prompt = "".join(f"<|{message['role']}|>{message['content']}" for message in messages)  # As the chat template would
+        slot = max(self._free_slots, key=lambda idx: len(os.path.commonprefix([self._slot_prompts[idx], prompt])))
+        self._free_slots.remove(slot)
+        try:
+            fault = self.__pick_fault()
+            if fault == "timeout":
+                await asyncio.Event().wait()  # Hang (holding the slot) until the client gives up
+            if fault == "error":
+                return web.json_response({"error": "injected internal server error"}, status=500)
+
+            options = LLMGenerationOptions(backend_options=dict(
+                seed=self._profile.seed, latency_distribution="constant", latency_mean_ms=0, malformed_rate=self._profile.malformed_rate,
+                vote_start_rate=self._profile.vote_start_rate, dm_rate=self._profile.dm_rate, trailing_rate=self._profile.trailing_rate
+            ), json_schema=json_schema, reasoning_effort=reasoning_effort, seed=seed, stop=stop)
+            completion = await FakeLLMClient.chat(None, model, messages, options)
+            content = completion.content
+            prompt_tokens = completion.prompt_tokens
+            reasoning_tokens = FakeLLMClient.reasoning_tokens.get(reasoning_effort, 0)
+            reply_tokens = completion.completion_tokens - reasoning_tokens
+            finish_reason = "stop"
+
+            if (max_tokens is not None) and (0 < max_tokens < reasoning_tokens + reply_tokens):
+                # The cap covers the reasoning as well -- the reply may not even start
+                reasoning_tokens = min(reasoning_tokens, max_tokens)
+                reply_tokens = max_tokens - reasoning_tokens
+                content = content[:int(reply_tokens * LLMTokenEstimator.chars_per_token)]
+                finish_reason = "length"
+
+            completion_tokens = reasoning_tokens + reply_tokens
+            cached_tokens = min(prompt_tokens - 1, int(len(os.path.commonprefix([self._slot_prompts[slot], prompt])) / LLMTokenEstimator.chars_per_token))
+            self._slot_prompts[slot] = prompt
+            self.stats.prompt_tokens += prompt_tokens
+            self.stats.cached_tokens += cached_tokens
+            prompt_tokens -= cached_tokens  # Only the rest is processed
+            prefill_sec = prompt_tokens / self._profile.prefill_tokens_per_sec
+            reasoning_sec = reasoning_tokens / self._profile.tokens_per_sec
+            eval_sec = completion_tokens / self._profile.tokens_per_sec
+            if emit is None:
+                await asyncio.sleep(prefill_sec + eval_sec)
+            else:
+                await asyncio.sleep(prefill_sec + reasoning_sec)  # Nothing is streamed while the model is reasoning
+                chunk_size = int(LLMTokenEstimator.chars_per_token)
+                chunks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+                for chunk in chunks:
+                    await asyncio.sleep((eval_sec - reasoning_sec) / len(chunks))
+                    if not await emit(chunk):
+                        break
+
+            self.stats.completed += 1
+            return content, prompt_tokens, completion_tokens, finish_reason, prefill_sec, eval_sec
+
+        except asyncio.CancelledError:
+            self.stats.cancelled += 1
+            raise
+        finally:
+            self.stats.in_flight -= 1
+            self._free_slots.add(slot)
+            self._slots.release()
+
+    async def __respond(self, request: web.Request, data: dict[str, Any]) -> web.StreamResponse:
+        """ Helper method to send the response, cutting the body off mid-way if a truncation fault is injected """
+        if self._rng.random() >= self._profile.truncate_rate:
+            return web.json_response(data, headers=self.__get_rate_limit_headers())
+
+        self.stats.faults["truncate"] += 1
+        body = json.dumps(data).encode()
+        response = web.StreamResponse(headers={"Content-Type": "application/json", **self.__get_rate_limit_headers()})
+        response.content_length = len(body)
+        await response.prepare(request)
+        await response.write(body[:len(body) // 2])
+        request.transport.close()  # The client sees the connection closing before the promised number of bytes
+        return response
+
+    def __charge_rate_limits(self, tokens: int) -> Optional[web.Response]:
+        """ Helper method to charge a request of the given tokens to the rate limits. Returns the rejection if it doesn't fit """
+        amounts = {"requests": 1, "tokens": tokens}
+        wait_sec = max([bucket.get_wait_sec(amounts[kind]) for (kind, bucket) in self._rate_limits.items()], default=0.0)
+        if wait_sec > 0:
+            self.stats.rate_limited += 1
+            headers = {**self.__get_rate_limit_headers(), "retry-after-ms": str(math.ceil(wait_sec * 1000)),
+                       "retry-after": str(math.ceil(wait_sec))}
+            error = {"message": "Rate limit reached, please try again later", "type": "rate_limit_exceeded", "code": "rate_limit_exceeded"}
+            return web.json_response({"error": error}, status=429, headers=headers)
+
+        for (kind, bucket) in self._rate_limits.items():
+            bucket.take(amounts[kind])
+        return None
+
+    def __get_rate_limit_headers(self) -> dict[str, str]:
+        """ Helper method to return the headers reporting the rate limits (and what is left of them) """
+        headers = {}
+        for (kind, bucket) in self._rate_limits.items():
+            level = max(0.0, bucket.get_level())
+            reset_sec = (bucket.capacity - level) / (bucket.capacity / 60)  # Until the bucket is full again
+            headers.update({f"x-ratelimit-limit-{kind}": str(int(bucket.capacity)),
+                            f"x-ratelimit-remaining-{kind}": str(int(level)),
+                            f"x-ratelimit-reset-{kind}": f"{reset_sec:.3f}s"})
+        return headers
+
+    @staticmethod
+    def __normalize_messages(messages: list[dict[str, Any]]) -> list[dict[str, str]]:
+        """ Helper method to flatten the contents sent as a list of parts (allowed by the OpenAI API) into plain text """
+        normalized = []
+        for message in messages:
+            content = message.get("content", None) or ""
+            if isinstance(content, list):
+                content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+            normalized.append(dict(role=message.get("role", "user"), content=content))
+        return normalized
+
+    def __pick_fault(self) -> Optional[str]:
+        """ Helper method to pick the fault to inject into the current request (if any) """
+        roll = self._rng.random()
+        for fault, rate in [("timeout", self._profile.timeout_rate), ("error", self._profile.error_rate)]:
+            if roll < rate:
+                self.stats.faults[fault] += 1
+                return fault
+            roll -= rate
+        return None
+
+
+def parse_args(args: list[str]) -> tuple[str, int, StubServerProfile]:
+    """ Helper method to build a parser and parse the arguments """
+    parser = ArgumentParser(description="Stub server speaking Ollama's API, for load-testing without a model")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Host to listen on")
+    parser.add_argument("--port", type=int, default=11435, help="Port to listen on")
+    parser.add_argument("--profile", type=str, default="gpu", choices=list(profiles.keys()), help="Preset to start from")
+
+    # Every field of the profile can be overridden, e.g. --tokens-per-sec 20 --error-rate 0.1
+    for profile_field in fields(StubServerProfile):
+        parser.add_argument(f"--{profile_field.name.replace('_', '-')}", type=type(profile_field.default), default=None)
+
+    args_list = parser.parse_args(args)
+    overrides = {f.name: getattr(args_list, f.name) for f in fields(StubServerProfile) if getattr(args_list, f.name) is not None}
+    profile = replace(profiles[args_list.profile], **overrides)
+    return args_list.host, args_list.port, profile
+
+
+def main():
+    host, port, profile = parse_args(sys.argv[1:])
+    AppConfiguration.logger.set_log_level(logging.INFO)
+    try:
+        asyncio.run(OllamaStubServer(profile).run(host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
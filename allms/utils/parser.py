@@ -1,9 +1,13 @@
 import logging
+import os
 from pathlib import Path
 
 import yaml
 
 from allms.config import AppConfiguration
+from allms.core.llm.cassette import LLMCassettePlayer
+from allms.core.llm.client import OpenAIOnlineLLMClient
+from allms.core.llm.fake import FakeLLMClient
 
 
 class BaseYAMLParser:
@@ -43,36 +47,105 @@ class YAMLConfigFileParser(BaseYAMLParser):
     key_ai_model: str = "model"
     key_offline_model: str = "offlineModel"
     key_reasoning_level: str = "reasoningLevel"
+    key_routine_reasoning_level: str = "routineReasoningLevel"
     key_max_agent_count: str = "maximumAgentCount"
     key_enable_rag: str = "enableRAG"
     key_show_thought_process: str = "showThoughtProcess"
     key_show_suspects: str = "showSuspects"
     key_save_directory: str = "saveDirectory"
     key_ui_dev_mode: str = "uiDeveloperMode"
+    key_max_connections: str = "maxConnections"
+    key_request_timeout: str = "requestTimeout"
+    key_endpoints: str = "endpoints"
+    key_sticky_endpoints: str = "stickyEndpoints"
+    key_backend: str = "backend"
+    key_ollama_options: str = "ollamaOptions"
+    key_hedge_requests: str = "hedgeRequests"
+    key_hedge_percentile: str = "hedgePercentile"
+    key_stream_responses: str = "streamResponses"
+    key_constrained_output: str = "constrainedOutput"
+    key_repair_responses: str = "repairResponses"
+    key_model_routing: str = "modelRouting"
+    key_generation_profiles: str = "generationProfiles"
+    key_adaptive_concurrency: str = "adaptiveConcurrency"
+    key_rate_limits: str = "rateLimits"
+    key_prompt_layout: str = "promptLayout"
+    key_history_tokens: str = "historyTokens"
+    key_agent_memory: str = "agentMemory"
+    key_fake_options: str = "fakeOptions"
+    key_cassette_mode: str = "cassetteMode"
+    key_cassette_match: str = "cassetteMatch"
+    key_cassette_speed: str = "cassetteSpeed"
 
     def __init__(self, file_path: str | Path):
         super().__init__(file_path)
         self.ai_model: str | None = None
         self.offline_model: bool | None = None
         self.reasoning_level: str | None = None
+        self.routine_reasoning_level: str | None = None
         self.max_agent_count: int | None = None
         self.enable_rag: bool | None = None
         self.show_thought_process: bool | None = None
         self.show_suspects: bool | None = None
         self.save_directory: str | None = None
         self.ui_dev_mode: bool | None = None
+        self.max_connections: int | None = None
+        self.request_timeout: float | None = None
+        self.endpoints: list[str] | None = None
+        self.sticky_endpoints: bool | None = None
+        self.backend: str | None = None
+        self.ollama_options: dict | None = None
+        self.hedge_requests: bool | None = None
+        self.hedge_percentile: float | None = None
+        self.stream_responses: bool | None = None
+        self.constrained_output: bool | None = None
+        self.repair_responses: bool | None = None
+        self.model_routing: dict | None = None
+        self.generation_profiles: dict | None = None
+        self.adaptive_concurrency: bool | None = None
+        self.rate_limits: dict | None = None
+        self.prompt_layout: str | None = None
+        self.history_tokens: int | None = None
+        self.agent_memory: bool | None = None
+        self.fake_options: dict | None = None
+        self.cassette_mode: str | None = None
+        self.cassette_match: str | None = None
+        self.cassette_speed: float | None = None
 
     def parse(self, root_key: str = None) -> dict:
         yml_data = super().parse()
         self.ai_model = yml_data[self.key_ai_model].lower()
         self.offline_model = yml_data[self.key_offline_model]
         self.reasoning_level = yml_data[self.key_reasoning_level].lower()
+        self.routine_reasoning_level = str(yml_data[self.key_routine_reasoning_level]).lower()
         self.max_agent_count = yml_data[self.key_max_agent_count]
         self.enable_rag = yml_data[self.key_enable_rag]
         self.show_thought_process = yml_data[self.key_show_thought_process]
         self.show_suspects = yml_data[self.key_show_suspects]
         self.save_directory = yml_data[self.key_save_directory]
         self.ui_dev_mode = yml_data[self.key_ui_dev_mode]
+        self.max_connections = yml_data[self.key_max_connections]
+        self.request_timeout = yml_data[self.key_request_timeout]
+        self.endpoints = yml_data[self.key_endpoints]
+        self.sticky_endpoints = yml_data[self.key_sticky_endpoints]
+        self.backend = yml_data[self.key_backend].lower()
+        self.ollama_options = yml_data[self.key_ollama_options]
+        self.hedge_requests = yml_data[self.key_hedge_requests]
+        self.hedge_percentile = yml_data[self.key_hedge_percentile]
+        self.stream_responses = yml_data[self.key_stream_responses]
+        self.constrained_output = yml_data[self.key_constrained_output]
+        self.repair_responses = yml_data[self.key_repair_responses]
+        self.model_routing = yml_data[self.key_model_routing]
+        self.generation_profiles = yml_data[self.key_generation_profiles]
+        self.adaptive_concurrency = yml_data[self.key_adaptive_concurrency]
+        self.rate_limits = yml_data[self.key_rate_limits]
+        self.prompt_layout = str(yml_data[self.key_prompt_layout]).lower()
+        self.history_tokens = yml_data[self.key_history_tokens]
+        self.agent_memory = yml_data[self.key_agent_memory]
+        self.fake_options = yml_data[self.key_fake_options]
+        self.cassette_mode = str(yml_data[self.key_cassette_mode]).lower()
+        self.cassette_match = str(yml_data[self.key_cassette_match]).lower()
+        self.cassette_speed = yml_data[self.key_cassette_speed]
         return yml_data
 
     def validate(self, yml_data: dict = None) -> None:
@@ -91,6 +164,11 @@ class YAMLConfigFileParser(BaseYAMLParser):
             logging.error(f"Given reasoning-level({self.reasoning_level}) is not supported." +
                           "Supported levels: {AppConfiguration.ai_reasoning_levels}")
 
+        if self.routine_reasoning_level not in AppConfiguration.ai_reasoning_levels:
+            is_error = True
+            logging.error(f"Given {self.key_routine_reasoning_level}({self.routine_reasoning_level}) is not supported. " +
+                          f"Supported levels: {AppConfiguration.ai_reasoning_levels}")
+
         try:
             max_agent_count = int(self.max_agent_count)
             if max_agent_count <= AppConfiguration.min_agent_count:
@@ -120,6 +198,127 @@ class YAMLConfigFileParser(BaseYAMLParser):
             is_error = True
             logging.error(f"UI developer mode flag must be a boolean (True or False) but got {self.ui_dev_mode} instead")
 
+        if (not isinstance(self.max_connections, int)) or isinstance(self.max_connections, bool) or (self.max_connections <= 0):
+            is_error = True
+            logging.error(f"Max. connections must be a positive integer but got {self.max_connections} instead")
+
+        if (not isinstance(self.request_timeout, (int, float))) or isinstance(self.request_timeout, bool) or (self.request_timeout <= 0):
+            is_error = True
+            logging.error(f"Request timeout must be a positive number (in seconds) but got {self.request_timeout} instead")
+
+        valid_url_prefixes = ("http://", "https://")
+        if (not isinstance(self.endpoints, list)) or (len(self.endpoints) == 0) or \
+                any((not isinstance(url, str)) or (not url.startswith(valid_url_prefixes)) for url in self.endpoints):
+            is_error = True
+            logging.error(f"Endpoints must be a non-empty list of http(s) URLs but got {self.endpoints} instead")
+
+        if not isinstance(self.sticky_endpoints, bool):
+            is_error = True
+            logging.error(f"sticky endpoints must be a boolean (True or False) but got {self.sticky_endpoints} instead")
+
+        if self.backend not in AppConfiguration.llm_backends:
+            is_error = True
+            logging.error(f"Given backend({self.backend}) is not supported. Supported backends: {AppConfiguration.llm_backends}")
+
+        if self.backend == "ollama" and (not self.offline_model):
+            is_error = True
+            logging.error(f"Ollama's native API (backend=ollama) can only be used with offline models")
+
+        if (self.backend == "openai") and (self.offline_model is False) and (not os.environ.get(OpenAIOnlineLLMClient.api_key_env_var, None)):
+            is_error = True
+            logging.error(f"Online models need the API key of the provider in the {OpenAIOnlineLLMClient.api_key_env_var} " +
+                          f"environment variable, but it is not set")
+
+        if not isinstance(self.ollama_options, dict):
+            is_error = True
+            logging.error(f"Ollama options must be a mapping of option names to values but got {self.ollama_options} instead")
+        else:
+            # Drop the unset options so that Ollama uses its defaults for them
+            self.ollama_options = {k: v for (k, v) in self.ollama_options.items() if v is not None}
+            num_ctx = self.ollama_options.get("num_ctx", None)
+            if (num_ctx is not None) and (num_ctx != "auto") and ((not isinstance(num_ctx, int)) or (num_ctx <= 0)):
+                is_error = True
+                logging.error(f"num_ctx must be a positive integer, auto or null but got {num_ctx} instead")
+
+        if not isinstance(self.hedge_requests, bool):
+            is_error = True
+            logging.error(f"hedge requests must be a boolean (True or False) but got {self.hedge_requests} instead")
+
+        if (not isinstance(self.hedge_percentile, (int, float))) or isinstance(self.hedge_percentile, bool) or \
+                (not (0 < self.hedge_percentile <= 100)):
+            is_error = True
+            logging.error(f"Hedge percentile must be a number in the range (0, 100] but got {self.hedge_percentile} instead")
+
+        if not isinstance(self.stream_responses, bool):
+            is_error = True
+            logging.error(f"stream responses must be a boolean (True or False) but got {self.stream_responses} instead")
+
+        if not isinstance(self.constrained_output, bool):
+            is_error = True
+            logging.error(f"constrained output must be a boolean (True or False) but got {self.constrained_output} instead")
+
+        if not isinstance(self.repair_responses, bool):
+            is_error = True
+            logging.error(f"repair responses must be a boolean (True or False) but got {self.repair_responses} instead")
+
+        if not isinstance(self.model_routing, dict):
+            is_error = True
+            logging.error(f"Model routing must be a mapping of option names to values but got {self.model_routing} instead")
+        else:
+            is_error = self.__validate_model_routing() or is_error
+
+        if not isinstance(self.generation_profiles, dict):
+            is_error = True
+            logging.error(f"Generation profiles must be a mapping of profile names to options but got {self.generation_profiles} instead")
+        else:
+            is_error = self.__validate_generation_profiles() or is_error
+
+        if not isinstance(self.adaptive_concurrency, bool):
+            is_error = True
+            logging.error(f"adaptive concurrency must be a boolean (True or False) but got {self.adaptive_concurrency} instead")
+
+        supported_rate_limits = {"requests_per_minute", "tokens_per_minute"}
+        if (not isinstance(self.rate_limits, dict)) or (set(self.rate_limits.keys()) != supported_rate_limits):
+            is_error = True
+            logging.error(f"Rate limits must have exactly the options: {supported_rate_limits} but got {self.rate_limits} instead")
+        else:
+            for (key, value) in self.rate_limits.items():
+                if (value is not None) and ((not isinstance(value, int)) or isinstance(value, bool) or (value <= 0)):
+                    is_error = True
+                    logging.error(f"Rate limit {key} must be a positive integer or null but got {value} instead")
+
+        if self.prompt_layout not in AppConfiguration.prompt_layouts:
+            is_error = True
+            logging.error(f"Given prompt layout({self.prompt_layout}) is not supported. Supported layouts: {AppConfiguration.prompt_layouts}")
+
+        if (not isinstance(self.history_tokens, int)) or isinstance(self.history_tokens, bool) or (self.history_tokens <= 0):
+            is_error = True
+            logging.error(f"History tokens must be a positive integer but got {self.history_tokens} instead")
+
+        if not isinstance(self.agent_memory, bool):
+            is_error = True
+            logging.error(f"Agent memory must be a boolean (True or False) but got {self.agent_memory} instead")
+
+        if not isinstance(self.fake_options, dict):
+            is_error = True
+            logging.error(f"Fake options must be a mapping of option names to values but got {self.fake_options} instead")
+        elif self.backend == "fake":
+            is_error = self.__validate_fake_options() or is_error
+
+        if self.cassette_mode == "false":
+            self.cassette_mode = "off"  # YAML parses an unquoted off as False
+        if self.cassette_mode not in AppConfiguration.cassette_modes:
+            is_error = True
+            logging.error(f"Given cassette mode({self.cassette_mode}) is not supported. Supported modes: {AppConfiguration.cassette_modes}")
+
+        if self.cassette_match not in LLMCassettePlayer.match_modes:
+            is_error = True
+            logging.error(f"Given cassette match({self.cassette_match}) is not supported. Supported values: {LLMCassettePlayer.match_modes}")
+
+        if (not isinstance(self.cassette_speed, (int, float))) or isinstance(self.cassette_speed, bool) or (self.cassette_speed < 0):
+            is_error = True
+            logging.error(f"Cassette speed must be a non-negative number but got {self.cassette_speed} instead")
+
         # Validate the paths
         paths = [self.save_directory]
         for path_x in paths:
@@ -137,6 +336,113 @@ class YAMLConfigFileParser(BaseYAMLParser):
         if is_error:
             raise RuntimeError(f"Invalid configuration received")
 
+    def __validate_model_routing(self) -> bool:
+        """ Helper method to validate the model routing options. Returns True if there was an error """
+        is_error = False
+        supported_keys = {"enabled", "routine_model", "high_stakes_model", "suspicion_threshold"}
+        if set(self.model_routing.keys()) != supported_keys:
+            logging.error(f"Model routing must have exactly the options: {supported_keys} but got {list(self.model_routing.keys())} instead")
+            return True
+
+        if not isinstance(self.model_routing["enabled"], bool):
+            is_error = True
+            logging.error(f"Model routing enabled must be a boolean (True or False) but got {self.model_routing['enabled']} instead")
+
+        for key in ["routine_model", "high_stakes_model"]:
+            if self.model_routing[key] not in AppConfiguration.ai_models:
+                is_error = True
+                logging.error(f"Given {key}({self.model_routing[key]}) is not supported. Supported models: {AppConfiguration.ai_models}")
+
+        threshold = self.model_routing["suspicion_threshold"]
+        if (not isinstance(threshold, int)) or isinstance(threshold, bool) or (not (0 <= threshold <= 100)):
+            is_error = True
+            logging.error(f"Suspicion threshold must be an integer in the range [0, 100] but got {threshold} instead")
+        return is_error
+
+    def __validate_generation_profiles(self) -> bool:
+        """ Helper method to validate the generation profiles. Returns True if there was an error """
+        is_error = False
+        if AppConfiguration.default_generation_profile not in self.generation_profiles:
+            is_error = True
+            logging.error(f"Generation profiles must have the '{AppConfiguration.default_generation_profile}' profile " +
+                          f"but got {list(self.generation_profiles.keys())} instead")
+
+        def _is_number(_value) -> bool:
+            return isinstance(_value, (int, float)) and (not isinstance(_value, bool))
+
+        supported_keys = {"max_tokens", "temperature", "top_p", "seed", "history_tokens"}
+        for (name, profile) in self.generation_profiles.items():
+            if not isinstance(profile, dict):
+                is_error = True
+                logging.error(f"Generation profile '{name}' must be a mapping of option names to values but got {profile} instead")
+                continue
+
+            unknown_keys = set(profile.keys()) - supported_keys
+            if unknown_keys:
+                is_error = True
+                logging.error(f"Unknown options in generation profile '{name}': {unknown_keys}. Supported options: {supported_keys}")
+
+            max_tokens = profile.get("max_tokens", None)
+            if (max_tokens is not None) and ((not isinstance(max_tokens, int)) or isinstance(max_tokens, bool) or (max_tokens <= 0)):
+                is_error = True
+                logging.error(f"max_tokens of generation profile '{name}' must be a positive integer or null but got {max_tokens} instead")
+
+            temperature = profile.get("temperature", None)
+            if (temperature is not None) and ((not _is_number(temperature)) or (temperature < 0)):
+                is_error = True
+                logging.error(f"temperature of generation profile '{name}' must be a non-negative number or null but got {temperature} instead")
+
+            top_p = profile.get("top_p", None)
+            if (top_p is not None) and ((not _is_number(top_p)) or (not (0 < top_p <= 1))):
+                is_error = True
+                logging.error(f"top_p of generation profile '{name}' must be a number in the range (0, 1] or null but got {top_p} instead")
+
+            seed = profile.get("seed", None)
+            if (seed is not None) and ((not isinstance(seed, int)) or isinstance(seed, bool) or
+                                       (not (0 <= seed <= AppConfiguration.max_generation_seed))):
+                is_error = True
+                logging.error(f"seed of generation profile '{name}' must be an integer in the range " +
+                              f"[0, {AppConfiguration.max_generation_seed}] or null but got {seed} instead")
+
+            history_tokens = profile.get("history_tokens", None)
+            if (history_tokens is not None) and ((not isinstance(history_tokens, int)) or isinstance(history_tokens, bool) or (history_tokens <= 0)):
+                is_error = True
+                logging.error(f"history_tokens of generation profile '{name}' must be a positive integer or null but got {history_tokens} instead")
+        return is_error
+
+    def __validate_fake_options(self) -> bool:
+        """ Helper method to validate the options of the fake model. Returns True if there was an error """
+        is_error = False
+        unknown_options = set(self.fake_options.keys()) - set(FakeLLMClient.default_options.keys())
+        if unknown_options:
+            is_error = True
+            logging.error(f"Unknown fake options: {unknown_options}. Supported options: {list(FakeLLMClient.default_options.keys())}")
+
+        def _is_number(_value) -> bool:
+            return isinstance(_value, (int, float)) and (not isinstance(_value, bool))
+
+        options = {**FakeLLMClient.default_options, **self.fake_options}
+        if options["latency_distribution"] not in FakeLLMClient.latency_distributions:
+            is_error = True
+            logging.error(f"Given latency distribution({options['latency_distribution']}) is not supported. " +
+                          f"Supported distributions: {FakeLLMClient.latency_distributions}")
+
+        for key in ["latency_mean_ms", "latency_stddev_ms", "reasoning_ms_per_token"]:
+            if (not _is_number(options[key])) or (options[key] < 0):
+                is_error = True
+                logging.error(f"{key} must be a non-negative number but got {options[key]} instead")
+
+        if (options["latency_distribution"] == "lognormal") and _is_number(options["latency_mean_ms"]) and (options["latency_mean_ms"] <= 0):
+            is_error = True
+            logging.error(f"latency_mean_ms must be > 0 for the lognormal distribution but got {options['latency_mean_ms']} instead")
+
+        for key in ["malformed_rate", "vote_start_rate", "dm_rate", "trailing_rate"]:
+            if (not _is_number(options[key])) or (not (0 <= options[key] <= 1)):
+                is_error = True
+                logging.error(f"{key} must be a number in the range [0, 1] but got {options[key]} instead")
+
+        return is_error
+
 
 class YAMLPersonaParser(BaseYAMLParser):
     """ Parser for the agent persona file """
@@ -80,10 +80,14 @@ class SavingUtils:
             # Iterable types (in our case, we have lists, tuples, sets, deques)
             elif (origin in iterable_types) or isinstance(field_value, tuple(iterable_types)):
                 item_type = args[0] if args else Any
+                item_origin = get_origin(item_type) or item_type
                 converted_items = []
                 for item in field_value:
                     if is_dataclass(item_type) and isinstance(item, dict):
                         converted_items.append(SavingUtils.properly_deserialize_json(cls=item_type, data=item))
+                    elif (item_origin in iterable_types) and isinstance(item, list):
+                        # Note: Tuples etc. are saved as lists (e.g. the chat log items, deque[tuple]) -- convert them back
+                        converted_items.append(item_origin(item))
                     else:
                         converted_items.append(item)
 
@@ -106,9 +110,13 @@ class SavingUtils:
                     key_type, val_type = args
 
                 converted_dict = {}
+                val_origin = get_origin(val_type) or val_type
                 for k, v in field_value.items():
                     if is_dataclass(val_type) and isinstance(v, dict):
                         converted_dict[k] = SavingUtils.properly_deserialize_json(cls=val_type, data=v)
+                    elif (val_origin in iterable_types) and isinstance(v, list):
+                        # Note: Sets etc. are saved as lists (e.g. the DM message IDs, dict[str, set]) -- convert them back
+                        converted_dict[k] = val_origin(v)
                     else:
                         converted_dict[k] = v
                 init_kwargs[f.name] = target_type(converted_dict)
@@ -0,0 +1,123 @@
+import asyncio
+
+import httpx
+import pytest
+
+from allms.config import AppConfiguration
+from allms.core.llm.balancer import LLMEndpoint, LLMEndpointBalancer
+from allms.core.llm.client import LLMBaseClient
+
+
+class FakeClient(LLMBaseClient):
+    """ Client whose health is whatever the test says it is """
+    @staticmethod
+    async def check_health(client: dict) -> bool:
+        return client["up"]
+
+
+@pytest.fixture(autouse=True)
+def fast_health_checks(monkeypatch):
+    monkeypatch.setattr(AppConfiguration, "llm_endpoint_max_failures", 3)
+    monkeypatch.setattr(AppConfiguration, "llm_health_check_interval_sec", 0.0)
+    monkeypatch.setattr(AppConfiguration, "llm_sticky_max_imbalance", 2)
+
+
+def create_balancer(n_endpoints: int, sticky: bool = False) -> LLMEndpointBalancer:
+    endpoints = [LLMEndpoint(url=f"http://server-{i}", client_cls=FakeClient, client=dict(up=True)) for i in range(n_endpoints)]
+    return LLMEndpointBalancer(endpoints=endpoints, sticky=sticky)
+
+
+def server_error(status_code: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "http://server")
+    return httpx.HTTPStatusError("Server error", request=request, response=httpx.Response(status_code, request=request))
+
+
+def test_picks_the_least_outstanding_endpoint():
+    balancer = create_balancer(3)
+    balancer.endpoints[0].outstanding = 2
+    balancer.endpoints[1].outstanding = 1
+    balancer.endpoints[2].outstanding = 3
+    assert balancer.pick() is balancer.endpoints[1]
+    assert balancer.pick(avoid=balancer.endpoints[1]) is balancer.endpoints[0]
+
+
+def test_requests_are_tracked_as_outstanding():
+    async def _test():
+        balancer = create_balancer(2)
+        async with balancer.acquire() as first:
+            async with balancer.acquire() as second:
+                assert first is not second
+                assert (first.outstanding, second.outstanding) == (1, 1)
+        assert [ep.outstanding for ep in balancer.endpoints] == [0, 0]
+
+    asyncio.run(_test())
+
+
+def test_sticky_agents_stay_until_the_endpoint_is_too_loaded():
+    balancer = create_balancer(2, sticky=True)
+    endpoint = balancer.pick("Ada")
+    other = next(ep for ep in balancer.endpoints if ep is not endpoint)
+
+    endpoint.outstanding = 2  # Within the tolerated imbalance
+    assert balancer.pick("Ada") is endpoint
+    endpoint.outstanding = 3
+    assert balancer.pick("Ada") is other
+    assert balancer.pick("Ada", avoid=other) is endpoint  # Hedged requests don't change the affinity
+    assert balancer.pick("Ada") is other
+
+
+def test_failures_take_the_endpoint_down():
+    async def _test():
+        balancer = create_balancer(2)
+        endpoint = balancer.endpoints[0]
+
+        for _ in range(AppConfiguration.llm_endpoint_max_failures - 1):
+            balancer.mark_failure(endpoint, fatal=False)
+        balancer.mark_success(endpoint)
+        balancer.mark_failure(endpoint, fatal=False)
+        assert endpoint.healthy  # Only consecutive failures count
+
+        with pytest.raises(httpx.ConnectError):
+            async with balancer.acquire(avoid=balancer.endpoints[1]):
+                raise httpx.ConnectError("Connection refused")
+        assert not endpoint.healthy  # Can't connect, down right away
+
+        endpoint.client["up"] = False
+        for _ in range(5):
+            assert balancer.pick() is balancer.endpoints[1]
+            await asyncio.sleep(0)
+        assert not endpoint.healthy
+
+        endpoint.client["up"] = True
+        balancer.pick()
+        await asyncio.gather(*balancer._probes)
+        assert endpoint.healthy
+
+    asyncio.run(_test())
+
+
+def test_only_server_errors_count_as_failures():
+    async def _test():
+        balancer = create_balancer(1)
+        endpoint = balancer.endpoints[0]
+
+        for status_code in (400, 429, 500):
+            with pytest.raises(httpx.HTTPStatusError):
+                async with balancer.acquire():
+                    raise server_error(status_code)
+        assert endpoint.failures == 1
+
+        with pytest.raises(RuntimeError):
+            async with balancer.acquire():
+                raise RuntimeError("Wrapped") from server_error(502)
+        assert endpoint.failures == 2
+
+    asyncio.run(_test())
+
+
+def test_all_endpoints_down_are_still_tried():
+    balancer = create_balancer(2)
+    for endpoint in balancer.endpoints:
+        endpoint.healthy = False
+        endpoint.last_checked = float("inf")  # Not due for a probe
+    assert balancer.pick() in balancer.endpoints
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from allms.config import AppConfiguration
+from allms.core.llm.breaker import LLMCircuitBreaker, LLMCircuitState
+
+
+@pytest.fixture(autouse=True)
+def fast_cooldown(monkeypatch):
+    monkeypatch.setattr(AppConfiguration, "llm_breaker_failure_threshold", 3)
+    monkeypatch.setattr(AppConfiguration, "llm_breaker_cooldown_sec", 0.01)
+    monkeypatch.setattr(AppConfiguration, "llm_breaker_max_cooldown_sec", 0.04)
+
+
+def create_breaker(probe_results: list[bool]) -> tuple[LLMCircuitBreaker, list[LLMCircuitState]]:
+    """ Returns a breaker whose probes return the given results (in order) along with the states it goes through """
+    states = []
+
+    async def _probe() -> bool:
+        return probe_results.pop(0)
+
+    async def _on_state_change(state: LLMCircuitState) -> None:
+        states.append(state)
+
+    breaker = LLMCircuitBreaker(probe=_probe, on_state_change=_on_state_change, _cooldown_sec=AppConfiguration.llm_breaker_cooldown_sec)
+    return breaker, states
+
+
+def test_opens_after_consecutive_failures_only():
+    async def _test():
+        breaker, _ = create_breaker(probe_results=[True])
+        await breaker.record_failure()
+        await breaker.record_failure()
+        await breaker.record_success()  # Resets the count
+        await breaker.record_failure()
+        await breaker.record_failure()
+        assert breaker.state == LLMCircuitState.CLOSED
+        await breaker.record_failure()
+        assert (breaker.state, breaker.trips) == (LLMCircuitState.OPEN, 1)
+        breaker.stop()
+    asyncio.run(_test())
+
+
+def test_agents_park_until_the_probe_succeeds():
+    async def _test():
+        breaker, states = create_breaker(probe_results=[False, False, True])
+        for _ in range(3):
+            await breaker.record_failure()
+
+        parked = asyncio.create_task(breaker.wait_until_closed())
+        await asyncio.sleep(0)
+        assert not parked.done()
+        await asyncio.wait_for(parked, timeout=1)
+
+        assert breaker.state == LLMCircuitState.CLOSED
+        assert states == [LLMCircuitState.OPEN, LLMCircuitState.HALF_OPEN, LLMCircuitState.OPEN, LLMCircuitState.HALF_OPEN,
+                          LLMCircuitState.OPEN, LLMCircuitState.HALF_OPEN, LLMCircuitState.CLOSED]
+        assert breaker._cooldown_sec == AppConfiguration.llm_breaker_cooldown_sec  # Reset once the backend is back
+    asyncio.run(_test())
+
+
+def test_failures_and_successes_while_open_are_ignored():
+    async def _test():
+        breaker, _ = create_breaker(probe_results=[True])
+        for _ in range(3):
+            await breaker.record_failure()
+        await breaker.record_success()  # A request sent before the circuit opened
+        assert breaker.state == LLMCircuitState.OPEN
+        await breaker.record_failure()
+        assert breaker.trips == 1
+        await asyncio.wait_for(breaker.wait_until_closed(), timeout=1)
+    asyncio.run(_test())
+
+
+def test_probe_raising_counts_as_failed():
+    async def _test():
+        calls = []
+
+        async def _probe() -> bool:
+            calls.append(None)
+            if len(calls) == 1:
+                raise ConnectionError("backend is down")
+            return True
+
+        breaker = LLMCircuitBreaker(probe=_probe, _cooldown_sec=AppConfiguration.llm_breaker_cooldown_sec)
+        for _ in range(3):
+            await breaker.record_failure()
+        await asyncio.wait_for(breaker.wait_until_closed(), timeout=1)
+        assert len(calls) == 2
+    asyncio.run(_test())
+
+
+def test_cooldown_is_doubled_up_to_the_max():
+    async def _test():
+        breaker, _ = create_breaker(probe_results=[False] * 10)
+        for _ in range(3):
+            await breaker.record_failure()
+        await asyncio.sleep(0.3)
+        assert breaker.state != LLMCircuitState.CLOSED
+        assert breaker._cooldown_sec == AppConfiguration.llm_breaker_max_cooldown_sec
+        breaker.stop()
+    asyncio.run(_test())
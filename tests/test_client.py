@@ -0,0 +1,38 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from allms.core.llm.client import OllamaNativeLLMClient
+from allms.core.llm.completion import LLMGenerationOptions
+
+messages = [dict(role="user", content="Hello")]
+
+
+def chat(body: str, stream: bool):
+    """ Sends a chat request to a fake Ollama replying with the given body, returning the completion """
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, text=body))
+
+    async def _chat():
+        async with httpx.AsyncClient(transport=transport) as http_client:
+            client = OllamaNativeLLMClient.create_client("http://ollama", http_client=http_client)
+            options = LLMGenerationOptions(on_delta=(lambda delta: False) if stream else None)
+            return await OllamaNativeLLMClient.chat(client, "model", messages, options)
+
+    return asyncio.run(_chat())
+
+
+def test_streamed_reply():
+    lines = [dict(message=dict(content="MESSAGE: "), done=False), dict(message=dict(content="Hi"), done=False),
+             dict(message=dict(content=""), done=True, done_reason="stop", prompt_eval_count=12, eval_count=3)]
+    completion = chat("\n".join(json.dumps(line) for line in lines) + "\n", stream=True)
+    assert completion.content == "MESSAGE: Hi"
+    assert (completion.prompt_tokens, completion.completion_tokens, completion.finish_reason) == (12, 3, "stop")
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_garbled_reply_is_a_retryable_http_error(stream):
+    body = json.dumps(dict(message=dict(content="MESSAGE: "), done=False)) + '\n{"message": {"cont\n'
+    with pytest.raises(httpx.DecodingError):
+        chat(body, stream=stream)
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from allms.core.agents import Agent
+from allms.core.llm.completion import LLMTokenEstimator
+from allms.core.llm.history import LLMAgentHistory
+
+
+class FakeMessages:
+    """ Stand-in for the chat history -- formats the messages by their IDs and counts how often it was asked to """
+    def __init__(self):
+        self.contents: dict[str, str] = {}
+        self.formatted: list[str] = []
+
+    async def format(self, msg_id: str) -> str:
+        self.formatted.append(msg_id)
+        return f"[{msg_id}] {self.contents[msg_id]}"
+
+
+@pytest.fixture
+def messages() -> FakeMessages:
+    return FakeMessages()
+
+
+def post(agent: Agent, messages: FakeMessages, msg_id: str, content: str, role: str = "user") -> None:
+    messages.contents[msg_id] = content
+    agent.add_to_chat_log(role, msg_id, is_message_id=True)
+
+
+def sync(history: LLMAgentHistory, agent: Agent, messages: FakeMessages, version: int = 0,
+         budget_tokens: int = 10_000, keep_evicted: bool = False) -> list[dict[str, str]]:
+    return asyncio.run(history.sync(agent, version, messages.format, budget_tokens, keep_evicted=keep_evicted))
+
+
+def tokens_of(history_messages: list[dict[str, str]]) -> int:
+    return LLMTokenEstimator.estimate_messages(history_messages)
+
+
+def test_only_appended_items_are_formatted(messages):
+    agent, history = Agent(id="Ada", persona="..."), LLMAgentHistory()
+    post(agent, messages, "1", "Hello")
+    agent.add_to_chat_log("user", "Ryan was voted out")
+    assert sync(history, agent, messages) == [dict(role="user", content="[1] Hello"),
+                                              dict(role="user", content="Ryan was voted out")]
+
+    post(agent, messages, "2", "Hi", role="assistant")
+    result = sync(history, agent, messages)
+    assert result[-1] == dict(role="assistant", content="[2] Hi")
+    assert len(result) == 3
+    assert messages.formatted == ["1", "2"]
+    assert history.tokens == tokens_of(result)
+
+
+def test_edits_are_formatted_again_on_a_new_version(messages):
+    agent, history = Agent(id="Ada", persona="..."), LLMAgentHistory()
+    post(agent, messages, "1", "Hello")
+    post(agent, messages, "2", "Hi")
+    sync(history, agent, messages, version=0)
+
+    messages.contents["1"] = "Hello (edited)"
+    assert sync(history, agent, messages, version=0)[0]["content"] == "[1] Hello"  # Same version, cached
+    result = sync(history, agent, messages, version=1)
+    assert result[0] == dict(role="user", content="[1] Hello (edited)")
+    assert messages.formatted == ["1", "2", "1", "2"]
+    assert history.tokens == tokens_of(result)
+
+
+def test_items_evicted_from_the_chat_log_are_dropped(messages):
+    agent, history = Agent(id="Ada", persona="..."), LLMAgentHistory()
+    for i in range(5):
+        post(agent, messages, str(i), f"Message {i}")
+    sync(history, agent, messages)
+
+    agent.evict_from_chat_log(2)
+    post(agent, messages, "5", "Message 5")
+    result = sync(history, agent, messages)
+    assert [message["content"] for message in result] == [f"[{i}] Message {i}" for i in range(2, 6)]
+    assert history.tokens == tokens_of(result)
+
+
+def test_outgrowing_the_budget_evicts_the_oldest_items(messages):
+    agent, history = Agent(id="Ada", persona="..."), LLMAgentHistory()
+    for i in range(10):
+        post(agent, messages, str(i), f"Message number {i}")
+    full = sync(history, agent, messages)
+    budget = tokens_of(full) // 2
+
+    result = sync(history, agent, messages, budget_tokens=budget, keep_evicted=True)
+    assert history.tokens <= int(budget * 0.75)
+    assert result == full[-len(result):]  # The newest items are kept
+
+    n_evicted = len(full) - len(result)
+    assert len(agent.chat_logs) == len(result)
+    assert agent.memory_backlog == [message["content"] for message in full[:n_evicted]]
+    assert history.get_stats()["trims"] == 1
+    assert history.get_stats()["evicted"] == n_evicted
+
+
+def test_newest_item_is_kept_even_if_over_the_budget(messages):
+    agent, history = Agent(id="Ada", persona="..."), LLMAgentHistory()
+    post(agent, messages, "1", "Hello")
+    post(agent, messages, "2", "A rather long message " * 20)
+
+    result = sync(history, agent, messages, budget_tokens=1)
+    assert [message["content"] for message in result] == [f"[2] {'A rather long message ' * 20}"]
+    assert agent.memory_backlog == []  # Not kept unless asked to
+
+
+def test_reset_starts_over(messages):
+    agent, history = Agent(id="Ada", persona="..."), LLMAgentHistory()
+    post(agent, messages, "1", "Hello")
+    post(agent, messages, "2", "Hi")
+    sync(history, agent, messages)
+
+    agent.reset()
+    post(agent, messages, "3", "New game")
+    result = sync(history, agent, messages)
+    assert result == [dict(role="user", content="[3] New game")]
+    assert history.tokens == tokens_of(result)
+
+
+def test_out_of_sync_history_is_rebuilt(messages):
+    agent, history = Agent(id="Ada", persona="..."), LLMAgentHistory()
+    post(agent, messages, "1", "Hello")
+    post(agent, messages, "2", "Hi")
+    sync(history, agent, messages)
+
+    agent.chat_logs[0] = ("user", "Changed behind the history's back", False)
+    result = sync(history, agent, messages)
+    assert result == [dict(role="user", content="Changed behind the history's back"),
+                      dict(role="user", content="[2] Hi")]
+    assert history.tokens == tokens_of(result)
@@ -0,0 +1,104 @@
+import asyncio
+from contextlib import AsyncExitStack
+
+from allms.config import AppConfiguration
+from allms.core.llm.completion import LLMCompletion
+from allms.core.llm.limiter import LLMConcurrencyLimiter
+
+
+async def reply(limiter: LLMConcurrencyLimiter, load: float, latency_ms: float = 5.0) -> None:
+    """ Records a reply (sent after the last adjustment of the limit) with the given load (> 1 = queueing) """
+    await asyncio.sleep(latency_ms / 1000 + 0.001)
+    service_ms = latency_ms / (load * AppConfiguration.llm_concurrency_queueing_tolerance)
+    completion = LLMCompletion(content="MESSAGE: Hi", prompt_eval_ms=service_ms / 2, eval_ms=service_ms / 2)
+    await limiter.record(latency_ms, completion)
+
+
+async def hold(stack: AsyncExitStack, limiter: LLMConcurrencyLimiter, n: int) -> None:
+    """ Holds n slots of the limiter until the stack is closed """
+    for _ in range(n):
+        await stack.enter_async_context(limiter.acquire())
+
+
+def test_limit_is_kept_within_bounds():
+    async def _test():
+        assert LLMConcurrencyLimiter(max_limit=4, limit=6).limit == 4
+        assert LLMConcurrencyLimiter(max_limit=4, limit=0).limit == 1
+    asyncio.run(_test())
+
+
+def test_requests_beyond_the_limit_wait():
+    async def _test():
+        limiter = LLMConcurrencyLimiter(max_limit=8, limit=2)
+        async with AsyncExitStack() as waiter_stack:
+            async with AsyncExitStack() as first_stack:
+                await hold(first_stack, limiter, 2)
+                waiter = asyncio.create_task(hold(waiter_stack, limiter, 1))
+                await asyncio.sleep(0.01)
+                assert (limiter.in_flight, limiter.waiting) == (2, 1)
+                assert not waiter.done()
+            await asyncio.wait_for(waiter, timeout=1)
+            assert (limiter.in_flight, limiter.waiting) == (1, 0)
+        assert limiter.in_flight == 0
+    asyncio.run(_test())
+
+
+def test_slow_start_then_additive_increase_and_multiplicative_decrease():
+    async def _test():
+        limiter = LLMConcurrencyLimiter(max_limit=16, limit=2)
+        async with AsyncExitStack() as stack:
+            await hold(stack, limiter, 2)  # The limit is used up
+            for _ in range(2):
+                await reply(limiter, load=0.5)
+        assert limiter.limit == 4  # Doubled (slow start)
+
+        async with AsyncExitStack() as stack:
+            await hold(stack, limiter, 4)
+            for _ in range(4):
+                await reply(limiter, load=2.0)
+        assert limiter.limit == 3  # Cut down, which ends the slow start
+
+        async with AsyncExitStack() as stack:
+            await hold(stack, limiter, 3)
+            for _ in range(3):
+                await reply(limiter, load=0.5)
+        assert limiter.limit == 4  # Raised by one
+        assert (limiter.stats.increases, limiter.stats.decreases, limiter.stats.max_limit_reached) == (2, 1, 4)
+    asyncio.run(_test())
+
+
+def test_limit_is_not_raised_unless_used_up():
+    async def _test():
+        limiter = LLMConcurrencyLimiter(max_limit=16, limit=4)
+        for _ in range(8):
+            await reply(limiter, load=0.5)
+        assert limiter.limit == 4
+    asyncio.run(_test())
+
+
+def test_single_slow_reply_does_not_cut_the_limit():
+    async def _test():
+        limiter = LLMConcurrencyLimiter(max_limit=16, limit=3)
+        for load in [0.5, 5.0, 0.5]:
+            await reply(limiter, load=load)
+        assert limiter.limit == 3
+    asyncio.run(_test())
+
+
+def test_overload_cuts_the_limit_down_to_one():
+    async def _test():
+        limiter = LLMConcurrencyLimiter(max_limit=16, limit=4)
+        for expected in [3, 2, 1, 1]:
+            await limiter.record_overload(reason="timed out")
+            assert limiter.limit == expected
+        assert limiter.stats.overloads == 4
+    asyncio.run(_test())
+
+
+def test_failed_replies_say_nothing_about_the_load():
+    async def _test():
+        limiter = LLMConcurrencyLimiter(max_limit=16, limit=2)
+        await asyncio.sleep(0.01)
+        await limiter.record(5.0, LLMCompletion(content=""))
+        assert limiter.stats.samples == 0
+    asyncio.run(_test())
@@ -0,0 +1,117 @@
+import pytest
+
+from allms.core.llm.parser import LLMResponseSalvager, LLMSchemaViolationError, LLMStreamParser
+from allms.core.llm.response import LLMResponseModel
+from allms.tools.parsebench import default_corpus, load_corpus
+
+corpus = load_corpus(default_corpus, extra_ids=[])
+
+
+def stream(response: str, chunk_size: int = 1) -> LLMStreamParser:
+    """ Feeds the response to a stream parser chunk by chunk, the way a streamed reply arrives """
+    parser = LLMStreamParser()
+    for i in range(0, len(response), chunk_size):
+        if parser.feed(response[i:i + chunk_size]):
+            return parser  # The rest of the reply would not have been generated
+    parser.finish()
+    return parser
+
+
+def is_salvageable(response: str) -> bool:
+    try:
+        LLMResponseSalvager.salvage(response)
+    except ValueError:
+        return False
+    return True
+
+
+def is_streamable(response: str, chunk_size: int = 1) -> bool:
+    try:
+        stream(response, chunk_size)
+    except LLMSchemaViolationError:
+        return False
+    return True
+
+
+@pytest.mark.parametrize("case", corpus, ids=[f"{i}-{case.case}" for (i, case) in enumerate(corpus)])
+@pytest.mark.parametrize("chunk_size", [1, 4, 1000])
+def test_stream_parser_agrees_with_salvager(case, chunk_size):
+    LLMResponseModel.set_allowed_ids(case.allowed_ids)
+    assert is_streamable(case.response, chunk_size) == is_salvageable(case.response)
+
+
+@pytest.mark.parametrize("response", [
+    "MSG: hello there\nINTENT: Greet\nSEND_TO: None",
+    "INTENT: Greet\nSEND_TO: None\nMESSAGE: hello there",
+    "Sure! Here is my response:\nMESSAGE: hello there\nINTENT: Greet",
+    "MESSAGE: hello there\nMOOD: Cheerful\nINTENT: Greet",
+])
+def test_stream_parser_does_not_abort_what_the_salvager_repairs(response):
+    LLMResponseModel.set_allowed_ids(["Ada", "Ryan"])
+    assert is_streamable(response)
+    assert is_salvageable(response)
+
+
+def test_stream_parser_aborts_a_dm_to_an_unknown_agent_right_away():
+    LLMResponseModel.set_allowed_ids(["Ada", "Ryan"])
+    parser = LLMStreamParser()
+    parser.feed("MESSAGE: Meet me by the docks\nINTENT: Plot\n")
+    with pytest.raises(LLMSchemaViolationError) as e:
+        parser.feed("SEND_TO: Nobody-In-This-Room\n")
+    assert e.value.content.endswith("Nobody-In-This-Room\n")
+
+
+def test_stream_parser_stops_once_the_schema_is_complete():
+    LLMResponseModel.set_allowed_ids(["Ada", "Ryan"])
+    response = ("MESSAGE: Ryan, where were you?\nINTENT: Question Ryan\nSEND_TO: None\nSUSPECT_ID: Ryan\n"
+                "SUSPECT_CONFIDENCE: 30\nREASON_FOR_SUSPECT: Unclear alibi\nSTART_A_VOTE: False\nVOTING_FOR: None\n")
+    parser = LLMStreamParser()
+    assert not parser.feed(response[:-1])  # The last line isn't complete yet
+    assert parser.feed("\nLet me know if you would like a different tone.")
+    assert parser.schema_complete
+
+
+def test_stream_parser_message():
+    parser = LLMStreamParser()
+    parser.feed("Sure!\n**MESSAGE:** \"Hello the")
+    assert parser.message == "Hello the"
+    assert not parser.message_complete
+    parser.feed("re\"\nINTENT: Greet")
+    assert parser.message == "Hello there"
+    assert parser.message_complete
+
+
+# Cases of the corpus that can't be salvaged -- everything else must be
+unsalvageable_cases = {"unknown_dm_target", "missing_message", "prose", "json"}
+
+
+@pytest.mark.parametrize("case", corpus, ids=[f"{i}-{case.case}" for (i, case) in enumerate(corpus)])
+def test_salvager_on_corpus(case):
+    LLMResponseModel.set_allowed_ids(case.allowed_ids)
+    assert is_salvageable(case.response) == (case.case not in unsalvageable_cases)
+
+
+def test_salvager_accepts_clean_responses_without_repairs():
+    for case in corpus:
+        if case.case == "clean":
+            LLMResponseModel.set_allowed_ids(case.allowed_ids)
+            assert LLMResponseSalvager.salvage(case.response)[1] == []
+
+
+@pytest.mark.parametrize("response, expected", [
+    ("MESSAGE: Hi\nINTENT: x\nSUSPECT_ID: Ryan\nSUSPECT_CONFIDENCE: 85%", dict(suspect="Ryan", suspect_confidence=85)),
+    ("MESSAGE: Hi\nINTENT: x\nSUSPECT_ID: Ryan\nSUSPECT_CONFIDENCE: 0.7", dict(suspect_confidence=70)),
+    ("MESSAGE: Hi\nINTENT: x\nSUSPECT_ID: Ryan\nSUSPECT_CONFIDENCE: 8/10", dict(suspect_confidence=80)),
+    ("MESSAGE: Hi\nINTENT: x\nSUSPECT_ID: Ryan\nSUSPECT_CONFIDENCE: High", dict(suspect_confidence=75)),
+    ("MESSAGE: Hi\nINTENT: x\nSUSPECT: @ryan\nCONFIDENCE: 60\nREASON: Nervous", dict(suspect="Ryan", suspect_confidence=60, suspect_reason="Nervous")),
+    ("MESSAGE: Hi\nINTENT: x\nSEND_TO: everyone\nSUSPECT_ID: nobody", dict(send_to=None, suspect=None)),
+    ("MESSAGE: Vote!\nINTENT: x\nSUSPECT_ID: Ryan\nSTART_A_VOTE: yes", dict(start_a_vote=True, voting_for="Ryan")),
+    ("MESSAGE: Vote!\nINTENT: x\nSTART_A_VOTE: True", dict(start_a_vote=False, voting_for=None)),
+    ("**MESSAGE:** Who had\nthe keys last?\n**INTENT:** Find out", dict(message="Who had the keys last?", intent="Find out")),
+    ("MESSAGE: Hi", dict(message="Hi", intent="")),
+])
+def test_salvager_repairs(response, expected):
+    LLMResponseModel.set_allowed_ids(["Ada", "Ryan"])
+    parsed, repairs = LLMResponseSalvager.salvage(response)
+    assert {key: getattr(parsed, key) for key in expected} == expected
+    assert repairs
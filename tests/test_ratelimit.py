@@ -0,0 +1,139 @@
+import asyncio
+import time
+
+import pytest
+
+from allms.core.llm import ratelimit
+from allms.core.llm.completion import LLMCompletion
+from allms.core.llm.ratelimit import LLMRateLimiter, LLMTokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+
+def test_token_bucket_refills_continuously(clock):
+    bucket = LLMTokenBucket(capacity=60, level=60, _updated=clock.now)  # One per second
+    bucket.take(60)
+    assert bucket.get_wait_sec(1) == pytest.approx(1.0)
+    clock.now += 30
+    assert bucket.get_level() == pytest.approx(30)
+    assert bucket.get_wait_sec(10) == 0.0
+    clock.now += 300
+    assert bucket.get_level() == pytest.approx(60)  # Never beyond the capacity
+
+
+def test_token_bucket_lets_oversized_requests_through_once_full(clock):
+    bucket = LLMTokenBucket(capacity=60, level=0, _updated=clock.now)
+    assert bucket.get_wait_sec(600) == pytest.approx(60)
+
+
+def test_token_bucket_give_back_and_sync(clock):
+    bucket = LLMTokenBucket(capacity=100, level=100, _updated=clock.now)
+    bucket.take(80)
+    bucket.give_back(500)
+    assert bucket.get_level() == 100
+    bucket.sync(limit=50, remaining=None)
+    assert (bucket.capacity, bucket.get_level()) == (50, 50)
+    bucket.sync(limit=None, remaining=10)
+    assert bucket.get_level() == 10
+    bucket.sync(limit=None, remaining=40)  # Only ever lowered
+    assert bucket.get_level() == 10
+
+
+@pytest.mark.parametrize("duration, expected", [("1.5", 1.5), ("20ms", 0.02), ("6m0s", 360), ("1h2m3s", 3723), ("soon", None), (None, None)])
+def test_reset_durations(duration, expected):
+    assert LLMRateLimiter._LLMRateLimiter__get_duration_sec(duration) == expected
+
+
+def test_no_limits_let_requests_through():
+    async def _test():
+        limiter = LLMRateLimiter()
+        for _ in range(100):
+            await asyncio.wait_for(limiter.wait_for_turn("Ada", tokens=1000), timeout=1)
+        assert limiter.stats.requests == 100
+        assert not limiter.has_waiting()
+    asyncio.run(_test())
+
+
+def test_requests_beyond_the_limit_are_held_back():
+    async def _test():
+        limiter = LLMRateLimiter(requests_per_minute=2, tokens_per_minute=10_000)
+        await limiter.wait_for_turn("Ada", tokens=100)
+        await limiter.wait_for_turn("Ryan", tokens=100)
+        held_back = asyncio.create_task(limiter.wait_for_turn("Ada", tokens=100))
+        await asyncio.sleep(0.05)
+        assert not held_back.done()
+        assert limiter.has_waiting() and (limiter.get_stats()["waiting"] == 1)
+        held_back.cancel()
+        await asyncio.gather(held_back, return_exceptions=True)
+        assert not limiter.has_waiting()
+    asyncio.run(_test())
+
+
+def test_agents_take_turns_after_a_rejection():
+    async def _test():
+        limiter = LLMRateLimiter(requests_per_minute=1000)
+        await limiter.record_rate_limited({"Retry-After-Ms": "50"})
+        assert limiter.has_waiting()
+
+        order = []
+
+        async def _send(agent_id: str) -> None:
+            await limiter.wait_for_turn(agent_id, tokens=10)
+            order.append(agent_id)
+
+        tasks = []
+        for agent_id in ["Ada", "Ada", "Ada", "Ryan", "Mira"]:
+            tasks.append(asyncio.create_task(_send(agent_id)))
+            await asyncio.sleep(0)  # Queue them up in this order
+        start = time.monotonic()
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=2)
+        assert time.monotonic() - start >= 0.04
+        assert order == ["Ada", "Ryan", "Mira", "Ada", "Ada"]  # Round-robin, not first come first served
+        assert limiter.stats.rate_limited == 1
+    asyncio.run(_test())
+
+
+def test_limits_are_synced_with_the_headers_of_the_replies():
+    async def _test():
+        limiter = LLMRateLimiter(requests_per_minute=500)
+        headers = {"x-ratelimit-limit-requests": "100", "x-ratelimit-remaining-requests": "40",
+                   "x-ratelimit-limit-tokens": "20000", "x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "50ms"}
+        await limiter.record(LLMCompletion(content="Hi", rate_limits=headers), charged_tokens=100)
+        stats = limiter.get_stats()
+        assert (stats["requests_per_minute"], stats["tokens_per_minute"]) == (100, 20000)
+        assert stats["requests_available"] == 40
+        assert limiter.has_waiting()  # Out of tokens until the reset
+        await asyncio.sleep(0.06)
+        assert not limiter.has_waiting()
+    asyncio.run(_test())
+
+
+def test_configured_limit_is_kept_if_lower():
+    async def _test():
+        limiter = LLMRateLimiter(requests_per_minute=10)
+        await limiter.record(LLMCompletion(content="Hi", rate_limits={"x-ratelimit-limit-requests": "100"}), charged_tokens=0)
+        assert limiter.get_stats()["requests_per_minute"] == 10
+    asyncio.run(_test())
+
+
+def test_unused_tokens_are_given_back():
+    async def _test():
+        limiter = LLMRateLimiter(tokens_per_minute=1000)
+        await limiter.wait_for_turn("Ada", tokens=800)
+        assert limiter.get_stats()["tokens_available"] <= 200
+        await limiter.record(LLMCompletion(content="Hi", prompt_tokens=150, completion_tokens=50), charged_tokens=800)
+        assert limiter.get_stats()["tokens_available"] >= 800
+    asyncio.run(_test())
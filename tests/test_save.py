@@ -0,0 +1,67 @@
+import json
+from dataclasses import asdict
+
+from allms.config import AppConfiguration
+from allms.core.agents import Agent, AgentGenerationProfile
+from allms.utils.save import SavingUtils
+
+
+def save_and_load(agent: Agent) -> Agent:
+    """ Saves the given agent the way the game state is saved and loads it back """
+    data = json.loads(json.dumps(SavingUtils.properly_serialize_json(asdict(agent))))
+    return SavingUtils.properly_deserialize_json(cls=Agent, data=data)
+
+
+def create_agent() -> Agent:
+    agent = Agent(id="Ada", persona="A retired detective")
+    agent.add_message_id("3")
+    agent.add_message_id("7")
+    agent.add_dm_message_id("4", agent_id="Ryan", dm_received=True)
+    agent.add_dm_message_id("5", agent_id="Ryan", dm_received=True)
+    agent.add_dm_message_id("6", agent_id="Mira", dm_received=False)
+    agent.add_to_chat_log("user", "1", is_message_id=True)
+    agent.add_to_chat_log("user", "Ryan was voted out")
+    agent.add_to_memory_backlog(["Mira accused Ryan"])
+    agent.update_memory("Ryan and Mira argued", position=agent.get_memory_backlog()[0], n_folded=0)
+    agent.update_generation_profile(AgentGenerationProfile(name="focused", max_tokens=512, temperature=0.3, seed=42))
+    return agent
+
+
+def test_agent_round_trip():
+    agent = create_agent()
+    loaded = save_and_load(agent)
+    assert loaded == agent
+
+    assert isinstance(loaded.msg_ids, set)
+    assert isinstance(loaded.dm_msg_ids_recv["Ryan"], set)
+    assert isinstance(loaded.dm_msg_ids_sent["Mira"], set)
+    assert isinstance(loaded.generation_profile, AgentGenerationProfile)
+    assert loaded.chat_logs.maxlen == AppConfiguration.max_chat_log_messages
+    assert loaded.memory == "Ryan and Mira argued"
+    assert loaded.memory_backlog == ["Mira accused Ryan"]
+
+
+def test_loaded_agent_keeps_working():
+    loaded = save_and_load(create_agent())
+
+    loaded.add_message_id("3")  # Already there
+    loaded.add_dm_message_id("5", agent_id="Ryan", dm_received=True)  # Already there
+    loaded.add_dm_message_id("8", agent_id="Ryan", dm_received=True)
+    assert loaded.get_message_ids() == ["7", "3"]
+    assert loaded.get_dm_message_ids("Ryan", dm_received=True) == ["8", "5", "4"]
+
+    # The items of the saved chat log count as appended
+    assert loaded.get_chat_log_cursor() == (0, 2)
+    loaded.add_to_chat_log("user", "9", is_message_id=True)
+    assert loaded.get_chat_log_cursor() == (0, 3)
+
+
+def test_agent_of_an_older_save():
+    data = json.loads(json.dumps(SavingUtils.properly_serialize_json(asdict(Agent(id="Ada", persona="...")))))
+    for key in ("generation_profile", "memory", "memory_backlog"):
+        del data[key]
+
+    loaded = SavingUtils.properly_deserialize_json(cls=Agent, data=data)
+    assert loaded.generation_profile is None
+    assert loaded.memory is None
+    assert loaded.memory_backlog == []